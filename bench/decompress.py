@@ -0,0 +1,99 @@
+# Compare decompression throughput of the compression methods zipimport64
+# supports.
+#
+# Usage (from the top of the repo):
+#
+#     python -m bench.decompress [file ...]
+#
+# With no arguments, the sources of the stdlib's email package are used as a
+# stand-in for a typical set of modules.  Methods whose codec isn't installed
+# are skipped.
+
+import bz2
+import email
+import glob
+import os
+import sys
+import time
+import zlib
+
+import zipimport64
+
+
+def compress_deflate(data):
+    c = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    return c.compress(data) + c.flush()
+
+
+def compress_lzma(data):
+    import lzma
+
+    # The same framing as zipfile's LZMACompressor
+    props = lzma._encode_filter_properties({"id": lzma.FILTER_LZMA1})
+    c = lzma.LZMACompressor(
+        lzma.FORMAT_RAW,
+        filters=[lzma._decode_filter_properties(lzma.FILTER_LZMA1, props)],
+    )
+    header = b"\x09\x04" + len(props).to_bytes(2, "little") + props
+    return header + c.compress(data) + c.flush()
+
+
+def compress_zstd(data):
+    try:
+        from compression.zstd import compress
+    except ImportError:
+        try:
+            from zstandard import compress
+        except ImportError:
+            from pyzstd import compress
+    return compress(data)
+
+
+METHODS = {
+    "deflate": (zipimport64.ZIP_DEFLATED, compress_deflate),
+    "bzip2": (zipimport64.ZIP_BZIP2, bz2.compress),
+    "lzma": (zipimport64.ZIP_LZMA, compress_lzma),
+    "zstd": (zipimport64.ZIP_ZSTANDARD, compress_zstd),
+}
+
+
+def default_files():
+    return sorted(glob.glob(os.path.join(os.path.dirname(email.__file__), "*.py")))
+
+
+def bench(members, method, repeat=5):
+    decompress = zipimport64._get_decompressor(method)
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for data, file_size in members:
+            decompress(data, file_size)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(files):
+    sources = []
+    for filename in files or default_files():
+        with open(filename, "rb") as f:
+            sources.append(f.read())
+    total = sum(len(data) for data in sources)
+
+    print(f"{len(sources)} files, {total:,} bytes")
+    for name, (method, compress) in METHODS.items():
+        try:
+            members = [(compress(data), len(data)) for data in sources]
+            elapsed = bench(members, method)
+        except (ImportError, zipimport64.ZipImportError):
+            print(f"{name:>8}: not available")
+            continue
+        ratio = total / sum(len(data) for data, _ in members)
+        print(
+            f"{name:>8}: {elapsed * 1000:.1f} ms = {total / elapsed / 1e6:,.1f} MB/s "
+            f"(ratio {ratio:.2f})"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,52 @@
+# Compare the speed of the central directory parsers in zipimport64.
+#
+# Usage (from the top of the repo):
+#
+#     python -m bench.read_directory [archive ...]
+#
+# With no arguments, the zip64 test archives are used (see testdata/create.py).
+
+import io
+import sys
+import time
+
+import zipimport64
+
+DEFAULT_ARCHIVES = ["testdata/small_store_64.zip", "testdata/small_deflate_64.zip"]
+
+
+def by_entry(fp, archive, header_position, size, position, arc_offset, num_entries):
+    return zipimport64._read_central_directory_by_entry(
+        fp, archive, header_position, position, arc_offset, num_entries
+    )
+
+
+PARSERS = {"by_entry": by_entry, "bulk": zipimport64._read_central_directory}
+
+
+def bench(archive, parser, repeat=5):
+    with open(archive, "rb") as f:
+        # Take the disk out of the picture; we're measuring parsing.
+        fp = io.BytesIO(f.read())
+    eocd = zipimport64._read_end_of_central_directory(fp, archive)
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        files = parser(fp, archive, *eocd[:5])
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return len(files), best
+
+
+def main(archives):
+    for archive in archives or DEFAULT_ARCHIVES:
+        for name, parser in PARSERS.items():
+            entries, elapsed = bench(archive, parser)
+            print(
+                f"{archive} {name:>8}: {entries} entries in {elapsed * 1000:.1f} ms "
+                f"= {entries / elapsed:,.0f} entries/s"
+            )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
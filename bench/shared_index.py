@@ -0,0 +1,113 @@
+# Measure the memory used by forked workers that look up every name in an
+# archive's directory, with and without the shared index.
+#
+# Usage (from the top of the repo, Linux only):
+#
+#     python -m bench.shared_index [--entries 200000] [--workers 1 8 32]
+#
+# For each number of workers, a fresh process reads the directory of a
+# generated archive (moving it into shared memory with enable_shared_index(),
+# or not), forks the workers, and adds up their proportional set size (PSS,
+# which splits shared pages between the processes sharing them) and private
+# memory, as reported by /proc/<pid>/smaps_rollup.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import zipimport64
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "testdata"))
+from create import ReproducibleZipFile  # noqa: E402
+
+DEFAULT_ENTRIES = 200_000
+DEFAULT_WORKERS = [1, 8, 32]
+
+
+def generate(path, entries):
+    with ReproducibleZipFile(path, "w") as zf:
+        for i in range(entries):
+            zf.writestr(f"pkg{i % 100}/sub{i % 7}/module_{i}.py", b"")
+
+
+def smaps_rollup(pid):
+    result = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                result[key] = int(value.split()[0])
+    return result
+
+
+def measure(archive, workers, shared):
+    # Runs in a fresh process; prints the totals for the workers as JSON.
+    if shared:
+        zipimport64.enable_shared_index()
+    files = zipimport64.zipimporter(archive)._files
+    ready_r, ready_w = os.pipe()
+    done_r, done_w = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            os.close(done_w)
+            # As a worker importing and reading resources would, over time.
+            for name in files:
+                files.get(name)
+            os.write(ready_w, b"x")
+            os.read(done_r, 1)
+            os._exit(0)
+        pids.append(pid)
+    os.close(ready_w)
+    os.close(done_r)
+    for _ in range(workers):
+        os.read(ready_r, 1)
+    pss = private = 0
+    for pid in pids:
+        rollup = smaps_rollup(pid)
+        pss += rollup["Pss"]
+        private += rollup["Private_Clean"] + rollup["Private_Dirty"]
+    os.close(done_w)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    json.dump({"pss_kb": pss, "private_kb": private}, sys.stdout)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=DEFAULT_ENTRIES)
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=DEFAULT_WORKERS, metavar="N"
+    )
+    parser.add_argument("--measure", nargs=3, help=argparse.SUPPRESS)
+    options = parser.parse_args(args)
+    if options.measure:
+        archive, workers, shared = options.measure
+        measure(archive, int(workers), shared == "shared")
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        archive = os.path.join(tmpdir, "bench.zip")
+        generate(archive, options.entries)
+        print(f"{options.entries:,} entries")
+        for workers in options.workers:
+            for mode in ["dict", "shared"]:
+                output = subprocess.check_output(
+                    [sys.executable, "-m", "bench.shared_index", "--measure"]
+                    + [archive, str(workers), mode]
+                )
+                result = json.loads(output)
+                print(
+                    f"{workers:>3} workers, {mode:>6}: "
+                    f"PSS {result['pss_kb'] / 1024:7.1f} MiB, "
+                    f"private {result['private_kb'] / 1024:7.1f} MiB"
+                )
+
+
+if __name__ == "__main__":
+    main()
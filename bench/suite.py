@@ -0,0 +1,260 @@
+# Benchmark zipimport64 against the stdlib's zipimport and zipfile.
+#
+# Usage (from the top of the repo):
+#
+#     python -m bench.suite [--entries 100 10000 ...] [--output results.json]
+#
+# Synthetic archives are generated reproducibly (see testdata/create.py) for
+# each combination of entry count, stored or deflated members, classic or
+# zip64 end of central directory, and with or without prepended data.  Each
+# benchmark reports the best of --repeat runs, in seconds, as JSON.  A
+# benchmark an implementation can't do (e.g. zip64 on older stdlib zipimport)
+# is reported with an "error" instead.
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+import zipfile
+import zipimport
+
+import zipimport64
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "testdata"))
+from create import ReproducibleZipFile  # noqa: E402
+from zip64_promotion import modify_to_include_zip64_eocd  # noqa: E402
+
+DEFAULT_ENTRIES = [100, 10_000, 100_000]
+# With more entries than this, the classic EOCD can't count them.
+MAX_CLASSIC_ENTRIES = 0xFFFF
+PREPENDED = b"#!/usr/bin/env python3\n" + b"\x00" * 100
+# Number of members read (or modules imported) by get_data and import.
+SAMPLE_SIZE = 200
+
+
+def archive_name(entries, method, zip64, prepended):
+    return (
+        f"bench_{entries}_{'deflate' if method else 'store'}"
+        f"{'_64' if zip64 else ''}{'_par' if prepended else ''}.zip"
+    )
+
+
+def generate(workdir, entries, method, zip64, prepended):
+    path = os.path.join(workdir, archive_name(entries, method, zip64, prepended))
+    if os.path.exists(path):
+        return path
+    plain = os.path.join(workdir, archive_name(entries, method, False, False))
+    if not os.path.exists(plain):
+        with ReproducibleZipFile(plain, "w", compression=method) as zf:
+            for i in range(entries):
+                zf.writestr(f"m{i}.py", f"x = {i}\n" + "# padding\n" * (i % 10))
+    source = plain
+    if zip64 and entries <= MAX_CLASSIC_ENTRIES:
+        # zipfile only writes a zip64 EOCD when it needs one.
+        source = os.path.join(workdir, archive_name(entries, method, True, False))
+        if not os.path.exists(source):
+            modify_to_include_zip64_eocd(plain, source)
+    if prepended:
+        with open(path, "wb") as f:
+            f.write(PREPENDED)
+            with open(source, "rb") as f2:
+                shutil.copyfileobj(f2, f)
+    return path if prepended else source
+
+
+def best_of(repeat, func, entries):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        found = func()
+        elapsed = time.perf_counter() - t0
+        # Being fast by not finding anything doesn't count.
+        if found is not None and found != entries:
+            raise ValueError(f"found {found} entries, expected {entries}")
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def clear_caches():
+    zipimport64._zip_directory_cache.clear()
+    zipimport64._zip_reader_cache.clear()
+    zipimport._zip_directory_cache.clear()
+
+
+def read_directory(path):
+    def zipimport64_impl():
+        clear_caches()
+        return len(zipimport64._read_directory(path))
+
+    def zipimport_impl():
+        return len(zipimport._read_directory(path))
+
+    def zipfile_impl():
+        with zipfile.ZipFile(path) as zf:
+            return len(zf.infolist())
+
+    return {
+        "zipimport64": zipimport64_impl,
+        "zipimport": zipimport_impl,
+        "zipfile": zipfile_impl,
+    }
+
+
+def construct(path):
+    def zipimport64_impl():
+        clear_caches()
+        return len(zipimport64.zipimporter(path)._files)
+
+    def zipimport_impl():
+        clear_caches()
+        return len(zipimport.zipimporter(path)._files)
+
+    return {"zipimport64": zipimport64_impl, "zipimport": zipimport_impl}
+
+
+def get_data(path, names):
+    # Members are read through an importer made up front, so this measures
+    # reading rather than parsing the directory.
+    clear_caches()
+    zi64 = zipimport64.zipimporter(path)
+    try:
+        zi = zipimport.zipimporter(path)
+    except zipimport.ZipImportError:
+        zi = None
+    zf = zipfile.ZipFile(path)
+
+    def zipimport64_impl():
+        for name in names:
+            zi64.get_data(name)
+
+    def zipimport64_get_many_impl():
+        zi64.get_many(names)
+
+    def zipimport_impl():
+        if zi is None:
+            raise zipimport.ZipImportError("can't read archive")
+        for name in names:
+            zi.get_data(name)
+
+    def zipfile_impl():
+        for name in names:
+            zf.read(name)
+
+    return {
+        "zipimport64": zipimport64_impl,
+        "get_many": zipimport64_get_many_impl,
+        "zipimport": zipimport_impl,
+        "zipfile": zipfile_impl,
+    }
+
+
+def import_modules(path, modules):
+    def run(hook):
+        saved = sys.path[:], sys.path_hooks[:], dict(sys.modules)
+        sys.path.insert(0, path)
+        sys.path_hooks.insert(0, hook)
+        sys.path_importer_cache.pop(path, None)
+        clear_caches()
+        try:
+            with warnings.catch_warnings():
+                # zipimport64.zipimporter only has find_loader()
+                warnings.simplefilter("ignore", ImportWarning)
+                for module in modules:
+                    importlib.import_module(module)
+        finally:
+            sys.path[:], sys.path_hooks[:] = saved[:2]
+            sys.modules.clear()
+            sys.modules.update(saved[2])
+            sys.path_importer_cache.pop(path, None)
+
+    return {
+        "zipimport64": lambda: run(zipimport64.zipimporter),
+        "zipimport": lambda: run(zipimport.zipimporter),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--entries", type=int, nargs="+", default=DEFAULT_ENTRIES, metavar="N"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workdir", help="where to keep the generated archives")
+    parser.add_argument("--output", "-o", help="JSON file to write (default stdout)")
+    options = parser.parse_args(args)
+
+    workdir = options.workdir or tempfile.mkdtemp(prefix="zipimport64-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    try:
+        for entries, method, zip64, prepended in itertools.product(
+            options.entries,
+            [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED],
+            [False, True],
+            [False, True],
+        ):
+            if not zip64 and entries > MAX_CLASSIC_ENTRIES:
+                continue
+            path = generate(workdir, entries, method, zip64, prepended)
+            sample = sorted(
+                random.Random(entries).sample(range(entries), min(entries, SAMPLE_SIZE))
+            )
+            config = {
+                "entries": entries,
+                "method": "deflate" if method else "store",
+                "zip64": zip64,
+                "prepended": prepended,
+            }
+            for benchmark, impls in [
+                ("read_directory", read_directory(path)),
+                ("zipimporter", construct(path)),
+                ("get_data", get_data(path, [f"m{i}.py" for i in sample])),
+                ("import", import_modules(path, [f"m{i}" for i in sample])),
+            ]:
+                for impl, func in impls.items():
+                    result = {"benchmark": benchmark, "impl": impl, **config}
+                    try:
+                        result["seconds"] = best_of(options.repeat, func, entries)
+                    except Exception as exc:
+                        result["error"] = f"{type(exc).__name__}: {exc}"
+                    results.append(result)
+                    print(
+                        f"{benchmark:>14} {impl:>11} {os.path.basename(path)}: "
+                        + (
+                            f"{result['seconds'] * 1000:.2f} ms"
+                            if "seconds" in result
+                            else result["error"]
+                        ),
+                        file=sys.stderr,
+                    )
+    finally:
+        if options.workdir is None:
+            shutil.rmtree(workdir)
+
+    output = {
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "repeat": options.repeat,
+        "sample_size": SAMPLE_SIZE,
+        "results": results,
+    }
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,29 @@
+import asyncio
+import contextlib
+import http.server
+import importlib
+import importlib.machinery
+import importlib.resources.abc
+import importlib.util
+import io
+import marshal
 import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
 import unittest
+import warnings
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from unittest import mock
 
+import zipimport64
 from zipimport64 import zipimporter, ZipImportError
 
 
@@ -76,17 +98,24 @@ class Zipimport64Test(unittest.TestCase):
     def test_small_corrupt_exception(self):
         with self.assertRaisesRegex(
             ZipImportError,
-            "^mismatched num_entries: 0 should be 2 in 'testdata/small_store_corrupt\.zip'$",
+            r"^mismatched num_entries: 0 should be 2 in 'testdata/small_store_corrupt\.zip'$",
         ):
             load_entries("testdata/small_store_corrupt.zip")
 
-    def test_small_corrupt_exception(self):
+    def test_small_corrupt_exception_64(self):
+        # The locator points past the Zip64 EOCD, so the EOCD's counts are used.
         with self.assertRaisesRegex(
             ZipImportError,
-            "^mismatched num_entries: 0 should be 65535 in 'testdata/small_deflate_64_junk\.zip'$",
+            r"^mismatched num_entries: 0 should be 65535 in 'testdata/small_deflate_64_junk\.zip'$",
         ):
             load_entries("testdata/small_deflate_64_junk.zip")
 
+    def test_junk_before_locator(self):
+        # The Zip64 EOCD is found through the locator.
+        e, zi = load_zipimporter("testdata/small_store_fake64_junk.zip")
+        self.assertEqual(2, len(e))
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+
     # method=ZIP_STORED with prefix
 
     def test_par_directory_and_contents(self):
@@ -157,3 +186,1846 @@ class Zipimport64Test(unittest.TestCase):
 
         data = zi.get_data("testdata/turducken_store.zip/outer.py")
         self.assertEqual(EXPECTED_OUTER, data)
+
+
+class IndexCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.archive = os.path.join(self.tmp.name, "small_store.zip")
+        shutil.copy("testdata/small_store.zip", self.archive)
+        zipimport64.enable_index_cache(os.path.join(self.tmp.name, "cache"))
+        self.addCleanup(zipimport64.disable_index_cache)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+
+    def test_index_is_reused(self):
+        self.assertEqual(2, zipimport64.prewarm_index_cache(self.archive))
+        self.assertEqual(1, len(os.listdir(os.path.join(self.tmp.name, "cache"))))
+
+        with mock.patch.object(
+            zipimport64, "_read_central_directory", side_effect=AssertionError
+        ):
+            zi = zipimporter(self.archive)
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+
+    def test_changed_archive_is_reparsed(self):
+        zipimport64.prewarm_index_cache(self.archive)
+        shutil.copy("testdata/par_store.zip", self.archive)
+
+        e, zi = load_zipimporter(self.archive)
+        self.assertEqual(TEST_OFFSET, e[0].file_offset)
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+
+    def test_index_per_interpreter(self):
+        name = zipimport64._index_cache_name(self.archive)
+        with mock.patch.object(sys.implementation, "cache_tag", "other-99"):
+            self.assertNotEqual(name, zipimport64._index_cache_name(self.archive))
+        with mock.patch.object(zipimport64.marshal, "version", 99):
+            self.assertNotEqual(name, zipimport64._index_cache_name(self.archive))
+
+    def test_clear(self):
+        zipimport64.prewarm_index_cache(self.archive)
+        zipimport64.clear_index_cache()
+        self.assertEqual([], os.listdir(os.path.join(self.tmp.name, "cache")))
+
+
+class TableOfContentsTest(unittest.TestCase):
+    def test_mapping(self):
+        files = zipimport64._read_directory("testdata/par_store.zip")
+        self.assertEqual(["small.py", "zeroes.bin"], list(files))
+        self.assertEqual(2, len(files))
+        self.assertIn("small.py", files)
+        self.assertNotIn("missing.py", files)
+        self.assertIsNone(files.get("missing.py"))
+        self.assertEqual(
+            (
+                "testdata/par_store.zip/small.py",
+                0,
+                6,
+                6,
+                TEST_OFFSET,
+                0,
+                33,
+                zlib.crc32(EXPECTED_SMALL),
+            ),
+            files["small.py"],
+        )
+        self.assertEqual(list(files.values()), [files[k] for k in files.keys()])
+        with self.assertRaises(KeyError):
+            files["missing.py"]
+
+    def test_state_round_trip(self):
+        files = zipimport64._read_directory("testdata/small_deflate_extra.zip")
+        copy = zipimport64._TableOfContents._from_state(
+            files.archive, files._get_state()
+        )
+        self.assertEqual(dict(files.items()), dict(copy.items()))
+
+    def test_find_extension(self):
+        suffixes = [".cpython-3x.so", ".abi3.so", ".so"]
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = os.path.join(tmp, "ext.zip")
+            with zipfile.ZipFile(archive, "w") as zf:
+                for name in ["pkg/a.so", "pkg/a.abi3.so", "b.so", "c.py", "d.txt"]:
+                    zf.writestr(name, b"")
+            files = zipimport64._read_directory(archive)
+        with mock.patch.object(
+            zipimport64._imp, "extension_suffixes", return_value=suffixes
+        ) as extension_suffixes:
+            self.assertEqual(
+                os.path.join("pkg", "a.abi3.so"),
+                files._find_extension(os.path.join("pkg", "a")),
+            )
+            self.assertEqual("b.so", files._find_extension("b"))
+            for path in ["c", "d", "pkg", "missing"]:
+                self.assertIsNone(files._find_extension(path))
+        # The names are only looked through once.
+        self.assertEqual(1, extension_suffixes.call_count)
+
+
+class SharedIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(zipimport64.disable_shared_index)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        zipimport64._zip_directory_cache.clear()
+
+    def test_mapping(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        archive = os.path.join(tmpdir, "many.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            for i in range(1000):
+                zf.writestr(f"pkg/m{i}.py", str(i))
+            zf.writestr("päckage/ü.py", "")
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")  # Duplicate name
+                zf.writestr("pkg/m1.py", "again")
+        files = zipimport64._read_directory(archive)
+        expected = list(files.items())
+        self.assertTrue(zipimport64._share_table_of_contents(files))
+        self.assertIsInstance(files._index, zipimport64._FlatIndex)
+        self.assertEqual(expected, list(files.items()))
+        self.assertEqual([name for name, _ in expected], list(files))
+        self.assertEqual(1001, len(files))
+        self.assertIn("päckage/ü.py", files)
+        self.assertNotIn("pkg/m1000.py", files)
+        self.assertNotIn(b"pkg/m1.py", files)
+        self.assertIsNone(files.get("missing.py"))
+        with self.assertRaises(KeyError):
+            files["missing.py"]
+        with self.assertRaises(TypeError):
+            files._compress[0] = 1
+        self.assertEqual({"pkg": True, "päckage": True}, files._list_dir(""))
+        copy = zipimport64._TableOfContents._from_state(archive, files._get_state())
+        self.assertEqual(expected, list(copy.items()))
+
+    def test_enable(self):
+        zi = zipimporter("testdata/small_deflate.zip")
+        self.assertIsInstance(zi._files._index, dict)
+        zipimport64.enable_shared_index()
+        # Directories already read are moved too.
+        self.assertIsInstance(zi._files._index, zipimport64._FlatIndex)
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+        zi = zipimporter("testdata/small_store.zip")
+        self.assertIsInstance(zi._files._index, zipimport64._FlatIndex)
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+        zipimport64.disable_shared_index()
+        zi = zipimporter("testdata/small_bzip2.zip")
+        self.assertIsInstance(zi._files._index, dict)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork()")
+    def test_fork(self):
+        zipimport64.enable_shared_index()
+        zi = zipimporter("testdata/small_deflate.zip")
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if zi.get_data("small.py") == EXPECTED_SMALL else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, os.waitstatus_to_exitcode(status))
+
+
+class EndOfCentralDirectoryTest(unittest.TestCase):
+    class CountingFile(io.BytesIO):
+        def read(self, size=-1):
+            data = super().read(size)
+            self.reads.append(len(data))
+            return data
+
+    def read_eocd(self, data, archive="test.zip"):
+        fp = self.CountingFile(data)
+        fp.reads = []
+        result = zipimport64._read_end_of_central_directory(fp, archive)
+        return result, fp.reads
+
+    def read_file(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_no_comment(self):
+        (_, _, _, arc_offset, num_entries, eocd), reads = self.read_eocd(
+            self.read_file("testdata/small_store.zip")
+        )
+        self.assertEqual((0, 2), (arc_offset, num_entries))
+        # The most the EOCD and Zip64 records can take, in one read
+        self.assertEqual([98], reads)
+        self.assertEqual(22, len(eocd))
+
+    def test_comment(self):
+        (_, _, _, arc_offset, num_entries, _), reads = self.read_eocd(
+            self.read_file("testdata/small_store_comment.zip")
+        )
+        self.assertEqual((0, 2), (arc_offset, num_entries))
+        self.assertEqual(2, len(reads))
+
+    def test_zip64(self):
+        data = self.read_file("testdata/small_store_fake64.zip")
+        (_, _, _, arc_offset, num_entries, eocd), reads = self.read_eocd(data)
+        self.assertEqual((0, 2), (arc_offset, num_entries))
+        self.assertEqual([98], reads)
+        self.assertEqual(data[-98:], eocd)
+
+        (_, _, _, arc_offset, _, _), reads = self.read_eocd(b"\x00" * 100 + data)
+        self.assertEqual(100, arc_offset)
+        self.assertEqual([98], reads)
+
+    def test_data_before_locator(self):
+        data = self.read_file("testdata/small_store_fake64.zip")
+        data = data[:-42] + b"\x05" * 1000 + data[-42:]
+        result, reads = self.read_eocd(data)
+        self.assertEqual((0, 2), result[3:5])
+        self.assertEqual([98, 56], reads)
+        self.assertEqual(data[-1098:-1042] + data[-42:], result[5])
+
+    def test_not_a_zip_file(self):
+        with self.assertRaisesRegex(ZipImportError, "not a Zip file"):
+            self.read_eocd(b"\x00" * 1000)
+        with self.assertRaisesRegex(ZipImportError, "not a Zip file"):
+            self.read_eocd(b"")
+
+
+class CentralDirectoryParserTest(unittest.TestCase):
+    def test_parsers_agree(self):
+        for name in [
+            "small_store.zip",
+            "small_deflate_comment.zip",
+            "small_deflate_extra.zip",
+            "par_store.zip",
+            "small_store_fake64.zip",
+            "turducken_store.zip",
+        ]:
+            archive = f"testdata/{name}"
+            with self.subTest(archive), open(archive, "rb") as fp:
+                eocd = zipimport64._read_end_of_central_directory(fp, archive)
+                hp, size, pos, arc, n, _ = eocd
+                bulk = zipimport64._read_central_directory(
+                    fp, archive, hp, size, pos, arc, n
+                )
+                by_entry = zipimport64._read_central_directory_by_entry(
+                    fp, archive, hp, pos, arc, n
+                )
+                self.assertEqual(dict(by_entry.items()), dict(bulk.items()))
+
+    def test_huge_num_entries(self):
+        # A Zip64 EOCD claiming far more entries than the central directory
+        # has room for mustn't make the parsers allocate room for them all.
+        with open("testdata/small_store_fake64.zip", "rb") as f:
+            data = bytearray(f.read())
+        pos = data.rindex(b"PK\x06\x06")
+        data[pos + 24 : pos + 40] = (1 << 40).to_bytes(8, "little") * 2
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = os.path.join(tmp, "crafted.zip")
+            with open(archive, "wb") as f:
+                f.write(data)
+            with self.assertRaisesRegex(ZipImportError, "mismatched num_entries"):
+                zipimporter(archive)
+            with open(archive, "rb") as fp:
+                hp, size, pos, arc, n, _ = zipimport64._read_end_of_central_directory(
+                    fp, archive
+                )
+                self.assertEqual(1 << 40, n)
+                with self.assertRaisesRegex(ZipImportError, "mismatched num_entries"):
+                    zipimport64._read_central_directory_by_entry(
+                        fp, archive, hp, pos, arc, n
+                    )
+
+    def test_non_ascii_names(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = os.path.join(tmp, "names.zip")
+            with zipfile.ZipFile(archive, "w") as zf:
+                zf.writestr("caf\xe9.txt", b"utf-8")
+                zf.writestr("Xa.txt", b"cp437")
+            # zipfile only writes ascii or utf-8 names, so patch in a cp437 one.
+            with open(archive, "rb") as f:
+                data = f.read().replace(b"Xa.txt", "\xe7a.txt".encode("cp437"))
+            with open(archive, "wb") as f:
+                f.write(data)
+            self.assertEqual(
+                ["caf\xe9.txt", "\xe7a.txt"], list(zipimport64._read_directory(archive))
+            )
+
+
+class ArchiveReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(zipimport64._zip_reader_cache.clear)
+
+    def test_archive_opened_once(self):
+        zi = zipimporter("testdata/small_deflate.zip")
+        with mock.patch.object(
+            zipimport64._io, "open_code", wraps=zipimport64._io.open_code
+        ) as open_code:
+            for _ in range(3):
+                self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+                self.assertEqual(b"\x00" * 10_000, zi.get_data("zeroes.bin"))
+        self.assertEqual(1, open_code.call_count)
+
+    def test_closed_when_dropped(self):
+        zi = zipimporter("testdata/small_store.zip")
+        zi.get_data("small.py")
+        fp = zipimport64._zip_reader_cache.pop(zi.archive)._fp
+        self.assertTrue(fp.closed)
+
+    def test_in_use_when_archive_changes(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        archive = os.path.join(tmpdir, "small.zip")
+        shutil.copy("testdata/small_store.zip", archive)
+        zi = zipimporter(archive)
+        self.addCleanup(zipimport64._zip_directory_cache.pop, archive, None)
+        f = zi.open("zeroes.bin")
+        self.assertEqual(b"\x00" * 10, f.read(10))
+        reader = zipimport64._zip_reader_cache[archive]
+        with zipfile.ZipFile(archive, "a") as zf:
+            zf.writestr("new.py", b"")
+        zi.invalidate_caches()
+        self.assertNotIn(archive, zipimport64._zip_reader_cache)
+        # Still open for the stream that's using it
+        self.assertFalse(reader._fp.closed)
+        self.assertEqual(b"\x00" * 9990, f.read())
+        fp = reader._fp
+        f.close()
+        del f, reader
+        self.assertTrue(fp.closed)
+
+    def test_threads(self):
+        zi = zipimporter("testdata/small_store_64.zip")
+        names = [f"{i}.bin" for i in range(0, 65536, 97)]
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(zi.get_data, names))
+        self.assertEqual([name[:-4].encode() for name in names], results)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_reopened_after_fork(self):
+        zi = zipimporter("testdata/small_store.zip")
+        zi.get_data("small.py")
+        parent_fp = zipimport64._zip_reader_cache[zi.archive]._fp
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                data = zi.get_data("small.py")
+                reopened = zipimport64._zip_reader_cache[zi.archive]._fp
+                ok = data == EXPECTED_SMALL and reopened is not parent_fp
+                os.write(w, b"1" if ok else b"0")
+            finally:
+                os._exit(0)
+        os.close(w)
+        self.assertEqual(b"1", os.read(r, 1))
+        os.close(r)
+        os.waitpid(pid, 0)
+        self.assertFalse(parent_fp.closed)
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+
+
+class CountingSource:
+    def __init__(self, data):
+        self.data = data
+        self.reads = []
+
+    def size(self):
+        return len(self.data)
+
+    def pread(self, size, offset):
+        self.reads.append((offset, size))
+        return self.data[offset : offset + size]
+
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    data = b""
+    ranges = []
+    ignore_ranges = False
+
+    def do_GET(self):
+        data = self.data
+        header = self.headers.get("Range")
+        if header is not None:
+            start, end = map(int, header.removeprefix("bytes=").split("-"))
+            self.ranges.append((start, end))
+        if header is None or self.ignore_ranges:
+            self.send_response(200)
+        else:
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            end = min(end, len(data) - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            data = data[start : end + 1]
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class SourceTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        self.addCleanup(zipimport64._zip_reader_cache.clear)
+        with open("testdata/small_deflate.zip", "rb") as f:
+            self.data = f.read()
+
+    def register(self, archive, source):
+        zipimport64.register_source(archive, source)
+        self.addCleanup(zipimport64.unregister_source, archive)
+
+    def test_source(self):
+        source = CountingSource(self.data)
+        self.register("remote/small.zip", source)
+        zi = zipimporter("remote/small.zip")
+        self.assertEqual("remote/small.zip", zi.archive)
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+        self.assertEqual(b"\x00" * 10_000, zi.get_data("zeroes.bin"))
+        self.assertTrue(source.reads)
+        # Cached until unregistered, without looking for a file.
+        self.assertIs(zi._files, zipimporter("remote/small.zip/")._files)
+        zipimport64.unregister_source("remote/small.zip")
+        self.assertNotIn("remote/small.zip", zipimport64._zip_directory_cache)
+        with self.assertRaises(ZipImportError):
+            zipimporter("remote/small.zip")
+
+    def test_prefix(self):
+        self.register("remote/small.zip", CountingSource(self.data))
+        zi = zipimporter("remote/small.zip/pkg")
+        self.assertEqual("remote/small.zip", zi.archive)
+        self.assertEqual("pkg" + os.sep, zi.prefix)
+
+    def test_file_source(self):
+        source = zipimport64.FileSource("testdata/small_deflate.zip")
+        self.addCleanup(source.close)
+        self.assertEqual(len(self.data), source.size())
+        self.assertEqual(self.data[100:200], source.pread(100, 100))
+        self.assertEqual(b"", source.pread(10, len(self.data)))
+
+    def test_block_cache(self):
+        source = CountingSource(bytes(range(256)) * 100)
+        cache = zipimport64.BlockCache(source, block_size=100, max_blocks=4)
+        self.assertEqual(source.data[150:250], cache.pread(100, 150))
+        # Blocks 1 and 2, and one more read ahead.
+        self.assertEqual([(100, 300)], source.reads)
+        self.assertEqual(source.data[320:390], cache.pread(70, 320))
+        self.assertEqual(source.data[380:470], cache.pread(90, 380))
+        self.assertEqual([(100, 300), (400, 200)], source.reads)
+        self.assertEqual((2, 3, 2), (cache.hits, cache.misses, cache.fetches))
+        # Block 1 was evicted, the least recently used.
+        self.assertEqual(source.data[150:160], cache.pread(10, 150))
+        self.assertEqual((100, 100), source.reads[-1])
+        # Too big to cache
+        self.assertEqual(source.data[:1000], cache.pread(1000, 0))
+        self.assertEqual((0, 1000), source.reads[-1])
+        # At the end
+        self.assertEqual(source.data[-5:], cache.pread(100, len(source.data) - 5))
+        self.assertEqual(b"", cache.pread(100, len(source.data)))
+
+    def test_block_cache_archive(self):
+        source = CountingSource(self.data)
+        self.register("remote/small.zip", zipimport64.BlockCache(source, 4096))
+        zi = zipimporter("remote/small.zip")
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+        self.assertEqual(b"\x00" * 10_000, zi.get_data("zeroes.bin"))
+        # The archive is small enough for a single fetch.
+        self.assertEqual([(0, 4096)], source.reads)
+
+    def serve(self, **attrs):
+        handler = type("Handler", (RangeRequestHandler,), {"data": self.data, **attrs})
+        handler.ranges = []
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_port}/small.zip", handler
+
+    def test_http(self):
+        url, handler = self.serve()
+        source = zipimport64.HTTPRangeSource(url, timeout=10)
+        self.addCleanup(source.close)
+        self.assertEqual(len(self.data), source.size())
+        self.assertEqual(self.data[10:20], source.pread(10, 10))
+        self.assertEqual(b"", source.pread(10, len(self.data) + 10))
+        end = len(self.data)
+        self.assertEqual([(0, 0), (10, 19), (end + 10, end + 19)], handler.ranges)
+
+        self.register(url, zipimport64.BlockCache(source))
+        with (
+            mock.patch.object(sys, "path", [url]),
+            mock.patch.object(sys, "path_hooks", [zipimporter]),
+            mock.patch.dict(sys.path_importer_cache, clear=True),
+            mock.patch.dict(sys.modules),
+            warnings.catch_warnings(),
+        ):
+            warnings.simplefilter("ignore", ImportWarning)
+            sys.modules.pop("small", None)
+            import small
+        self.assertEqual(1, small.x)
+        self.assertEqual(url + os.sep + "small.py", small.__file__)
+
+    def test_http_ranges_ignored(self):
+        url, handler = self.serve(ignore_ranges=True)
+        source = zipimport64.HTTPRangeSource(url, timeout=10)
+        self.addCleanup(source.close)
+        self.register(url, zipimport64.BlockCache(source, block_size=16))
+        zi = zipimporter(url)
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+        self.assertEqual(b"\x00" * 10_000, zi.get_data("zeroes.bin"))
+        # The whole file was sent once, and kept.
+        self.assertEqual([(0, 0)], handler.ranges)
+
+    def test_http_errors(self):
+        with self.assertRaises(ValueError):
+            zipimport64.HTTPRangeSource("ftp://example.com/a.zip")
+        source = zipimport64.HTTPRangeSource("http://127.0.0.1:9/a.zip", timeout=1)
+        with self.assertRaises(OSError):
+            source.size()
+
+
+class NestedArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        self.addCleanup(zipimport64._zip_reader_cache.clear)
+        self.addCleanup(zipimport64._sources.clear)
+
+    def make_bundle(self, path, inner_members, padding=b""):
+        inner = io.BytesIO()
+        with zipfile.ZipFile(inner, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, data in inner_members.items():
+                zf.writestr(name, data)
+        with zipfile.ZipFile(path, "w") as zf:
+            zf.writestr("padding.bin", padding)
+            zf.writestr("libs/inner.zip", inner.getvalue())
+        return inner.getvalue()
+
+    def test_turducken(self):
+        zi = zipimporter("testdata/turducken_store.zip/inner.zip")
+        self.assertEqual("testdata/turducken_store.zip/inner.zip", zi.archive)
+        self.assertEqual("", zi.prefix)
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+        path = "testdata/turducken_store.zip/inner.zip/small.py"
+        self.assertEqual(EXPECTED_SMALL, zi.get_data(path))
+        self.assertIn("testdata/turducken_store.zip/inner.zip", zipimport64._sources)
+
+    def test_not_copied(self):
+        zipimport64.enable_stats()
+        self.addCleanup(zipimport64.disable_stats)
+        zi = zipimporter("testdata/turducken_store.zip/inner.zip")
+        buffer = zi.get_buffer("small.py")
+        self.assertEqual(EXPECTED_SMALL, buffer)
+        counters = zipimport64.get_stats()["archives"][zi.archive]
+        self.assertEqual(1, counters["mapped_reads"])
+        # Only the directory and local header of the inner archive were read.
+        outer = zipimport64.get_stats()["archives"]["testdata/turducken_store.zip"]
+        self.assertLess(outer["bytes_read"], 1000)
+
+    def test_members_not_entered(self):
+        zi = zipimporter("testdata/turducken_store.zip/outer.py")
+        self.assertEqual("testdata/turducken_store.zip", zi.archive)
+        self.assertEqual("outer.py" + os.sep, zi.prefix)
+        self.assertEqual({}, zipimport64._sources)
+        # Compressed archives can't be read in place.
+        path = os.path.join(self.tmp.name, "bundle.zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+            with open("testdata/small_store.zip", "rb") as f:
+                zf.writestr("inner.zip", f.read())
+        zi = zipimporter(path + "/inner.zip")
+        self.assertEqual(path, zi.archive)
+        self.assertEqual("inner.zip" + os.sep, zi.prefix)
+
+    def test_import(self):
+        path = os.path.join(self.tmp.name, "bundle.zip")
+        self.make_bundle(path, {"pkg/__init__.py": "", "pkg/mod.py": "x = 'inner'\n"})
+        entry = os.path.join(path, "libs", "inner.zip")
+        with (
+            mock.patch.object(sys, "path", [entry]),
+            mock.patch.object(sys, "path_hooks", [zipimporter]),
+            mock.patch.dict(sys.path_importer_cache, clear=True),
+            mock.patch.dict(sys.modules),
+            warnings.catch_warnings(),
+        ):
+            warnings.simplefilter("ignore", ImportWarning)
+            from pkg import mod
+        self.assertEqual("inner", mod.x)
+        self.assertEqual(os.path.join(entry, "pkg", "mod.py"), mod.__file__)
+        zi = zipimporter(os.path.join(entry, "pkg"))
+        self.assertEqual(entry, zi.archive)
+        self.assertEqual("pkg" + os.sep, zi.prefix)
+
+    def test_nested_twice(self):
+        middle = os.path.join(self.tmp.name, "middle.zip")
+        with zipfile.ZipFile(middle, "w") as zf:
+            zf.write("testdata/small_store.zip", "inner.zip")
+        outer = os.path.join(self.tmp.name, "outer.zip")
+        with zipfile.ZipFile(outer, "w") as zf:
+            zf.write(middle, "middle.zip")
+        zi = zipimporter(os.path.join(outer, "middle.zip", "inner.zip"))
+        self.assertEqual(os.path.join(outer, "middle.zip", "inner.zip"), zi.archive)
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+
+    def test_outer_changed(self):
+        path = os.path.join(self.tmp.name, "bundle.zip")
+        self.make_bundle(path, {"mod.py": "x = 1\n"})
+        zi = zipimporter(os.path.join(path, "libs", "inner.zip"))
+        self.assertEqual(b"x = 1\n", zi.get_data("mod.py"))
+        # The inner archive moves within the outer one.
+        self.make_bundle(path, {"mod.py": "x = 2\n"}, padding=b"\x00" * 1000)
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        zi.invalidate_caches()
+        self.assertEqual(b"x = 2\n", zi.get_data("mod.py"))
+        # And then it's gone.
+        with zipfile.ZipFile(path, "w") as zf:
+            zf.writestr("other.py", "")
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 2 * 10**9))
+        zi.invalidate_caches()
+        with self.assertRaises(OSError):
+            zi.get_data("mod.py")
+        self.assertEqual({}, zipimport64._sources)
+
+
+class InvalidateCachesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        self.addCleanup(zipimport64._zip_reader_cache.clear)
+        self.archive = os.path.join(self.tmp.name, "app.zip")
+        with zipfile.ZipFile(self.archive, "w") as zf:
+            zf.writestr("a.py", b"a = 1\n")
+
+    def test_unchanged(self):
+        zi = zipimporter(self.archive)
+        with mock.patch.object(
+            zipimport64, "_read_directory", side_effect=AssertionError
+        ):
+            zi.invalidate_caches()
+            zipimporter(self.archive)
+        self.assertEqual(["a.py"], list(zi._files))
+
+    def test_replaced(self):
+        zi = zipimporter(self.archive)
+        self.assertEqual(b"a = 1\n", zi.get_data("a.py"))
+
+        new = os.path.join(self.tmp.name, "new.zip")
+        with zipfile.ZipFile(new, "w") as zf:
+            zf.writestr("b.py", b"b = 2\n")
+            zf.writestr("a.py", b"a = 'changed'\n")
+        os.replace(new, self.archive)
+
+        zi.invalidate_caches()
+        self.assertEqual(["b.py", "a.py"], list(zi._files))
+        self.assertEqual(b"a = 'changed'\n", zi.get_data("a.py"))
+        # New importers see the new version too.
+        self.assertIs(zi._files, zipimporter(self.archive)._files)
+
+    def test_appended(self):
+        zi = zipimporter(self.archive)
+        with zipfile.ZipFile(self.archive, "a") as zf:
+            zf.writestr("b.py", b"b = 2\n")
+
+        extend = zipimport64._TableOfContents._extend
+        with mock.patch.object(
+            zipimport64._TableOfContents, "_extend", autospec=True, side_effect=extend
+        ) as m:
+            zi.invalidate_caches()
+        m.assert_called_once()
+        self.assertEqual(["a.py", "b.py"], list(zi._files))
+        self.assertEqual(b"a = 1\n", zi.get_data("a.py"))
+        self.assertEqual(b"b = 2\n", zi.get_data("b.py"))
+
+    def test_removed(self):
+        zi = zipimporter(self.archive)
+        os.unlink(self.archive)
+        zi.invalidate_caches()
+        self.assertEqual(0, len(zi._files))
+        self.assertNotIn(self.archive, zipimport64._zip_directory_cache)
+
+
+class DataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(zipimport64.disable_data_cache)
+        self.zi = zipimporter("testdata/small_deflate.zip")
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(zipimport64.data_cache_info())
+
+    def test_hits_and_evictions(self):
+        zipimport64.enable_data_cache(10_010)
+        with mock.patch.object(
+            zipimport64, "_read_data", wraps=zipimport64._read_data
+        ) as read_data:
+            for _ in range(3):
+                self.assertEqual(EXPECTED_SMALL, self.zi.get_data("small.py"))
+            self.assertEqual(1, read_data.call_count)
+
+            # Both fit, just.
+            self.zi.get_data("zeroes.bin")
+            self.zi.get_data("small.py")
+            self.assertEqual(2, read_data.call_count)
+
+            # These don't both fit, so the least recently used one goes.
+            zipimport64.enable_data_cache(10_005)
+            self.zi.get_data("small.py")
+            self.zi.get_data("zeroes.bin")
+            self.assertEqual(4, read_data.call_count)
+
+        info = zipimport64.data_cache_info()
+        self.assertEqual(1, info["entries"])
+        self.assertEqual(10_000, info["bytes"])
+        self.assertEqual(1, info["evictions"])
+        self.assertEqual(2, info["misses"])
+        self.assertEqual(0, info["hits"])
+
+    def test_entry_limit(self):
+        zipimport64.enable_data_cache(1_000_000, max_entry_bytes=100)
+        self.zi.get_data("zeroes.bin")
+        self.zi.get_data("small.py")
+        info = zipimport64.data_cache_info()
+        self.assertEqual(1, info["entries"])
+        self.assertEqual(len(EXPECTED_SMALL), info["bytes"])
+
+
+class CompressionMethodTest(unittest.TestCase):
+    def check_archive(self, path):
+        zi = zipimporter(path)
+        self.assertEqual(EXPECTED_SMALL, zi.get_data("small.py"))
+        self.assertEqual(b"\x00" * 10_000, zi.get_data("zeroes.bin"))
+
+    def test_bzip2(self):
+        self.check_archive("testdata/small_bzip2.zip")
+
+    def test_lzma(self):
+        self.check_archive("testdata/small_lzma.zip")
+
+    def test_zstd(self):
+        try:
+            zipimport64._zstd_codec()
+        except ImportError:
+            self.skipTest("no zstd module available")
+        self.check_archive("testdata/small_zstd.zip")
+
+    def test_concurrent_first_use(self):
+        # Threads that need zlib while another is importing it wait for it,
+        # rather than taking it to be recursively imported.
+        class SlowZlib(types.ModuleType):
+            def __getattr__(self, name):
+                time.sleep(0.01)
+                return getattr(zlib, name)
+
+        zi = zipimporter("testdata/small_deflate.zip")
+        barrier = threading.Barrier(8)
+
+        def read():
+            barrier.wait()
+            return zipimport64._get_data(zi.archive, zi._files["small.py"])
+
+        with mock.patch.dict(zipimport64._codecs, clear=True), mock.patch.dict(
+            sys.modules, {"zlib": SlowZlib("zlib")}
+        ):
+            with ThreadPoolExecutor(8) as pool:
+                futures = [pool.submit(read) for _ in range(8)]
+            self.assertEqual([EXPECTED_SMALL] * 8, [f.result() for f in futures])
+
+    def test_unsupported_method(self):
+        zi = zipimporter("testdata/small_store.zip")
+        toc_entry = zi._files["small.py"]
+        with self.assertRaisesRegex(
+            ZipImportError, "unsupported compression method 99"
+        ):
+            zipimport64._read_data(
+                "testdata/small_store.zip", (toc_entry[0], 99) + toc_entry[2:]
+            )
+
+    def test_recursive_import(self):
+        # A codec module imported from a Zip file using the same codec
+        with mock.patch.dict(
+            zipimport64._codecs, clear=True
+        ), mock.patch.object(
+            zipimport64,
+            "_importing_codecs",
+            {(zipimport64.ZIP_LZMA, threading.get_ident())},
+        ):
+            zi = zipimporter("testdata/small_lzma.zip")
+            with self.assertRaisesRegex(ZipImportError, "lzma not available"):
+                zi.get_data("small.py")
+
+
+class StreamTest(unittest.TestCase):
+    ARCHIVES = {
+        "testdata/small_store.zip": zipimport64.ZIP_STORED,
+        "testdata/small_deflate.zip": zipimport64.ZIP_DEFLATED,
+        "testdata/small_bzip2.zip": zipimport64.ZIP_BZIP2,
+        "testdata/small_lzma.zip": zipimport64.ZIP_LZMA,
+        "testdata/small_zstd.zip": zipimport64.ZIP_ZSTANDARD,
+    }
+
+    def archives(self):
+        for archive, method in self.ARCHIVES.items():
+            with self.subTest(archive):
+                if method != zipimport64.ZIP_STORED:
+                    try:
+                        zipimport64._get_codec(method)
+                    except ZipImportError:
+                        continue
+                yield zipimporter(archive)
+
+    def test_read(self):
+        for zi in self.archives():
+            with zi.open("small.py") as f:
+                self.assertEqual(EXPECTED_SMALL, f.read())
+            with zi.open(zi.archive + "/zeroes.bin") as f:
+                self.assertEqual(b"\x00" * 1000, f.read(1000))
+                self.assertEqual(1000, f.tell())
+                self.assertEqual(b"\x00" * 9000, f.read())
+                self.assertEqual(b"", f.read())
+
+    def test_seek(self):
+        for zi in self.archives():
+            with zi.open("small.py") as f:
+                self.assertEqual(2, f.seek(2))
+                self.assertEqual(EXPECTED_SMALL[2:], f.read())
+                self.assertEqual(1, f.seek(1))
+                self.assertEqual(EXPECTED_SMALL[1:3], f.read(2))
+                self.assertEqual(len(EXPECTED_SMALL) - 1, f.seek(-1, os.SEEK_END))
+                self.assertEqual(EXPECTED_SMALL[-1:], f.read())
+
+    def test_small_chunks(self):
+        with mock.patch.object(zipimport64, "_STREAM_CHUNK_SIZE", 7):
+            for zi in self.archives():
+                with zi.open("zeroes.bin") as f:
+                    self.assertEqual(b"\x00" * 10_000, f.read())
+
+    def test_missing(self):
+        zi = zipimporter("testdata/small_deflate.zip")
+        with self.assertRaises(OSError):
+            zi.open("missing.py")
+
+    def test_truncated(self):
+        zi = zipimporter("testdata/small_deflate.zip")
+        toc_entry = zi._files["zeroes.bin"]
+        toc_entry = toc_entry[:2] + (toc_entry[2] // 2,) + toc_entry[3:]
+        with zipimport64._open_member(zi.archive, toc_entry) as f:
+            with self.assertRaises(EOFError):
+                f.read()
+
+    def test_seek_past_end_of_stream(self):
+        # The member's data decompresses to less than its file size.
+        zi = zipimporter("testdata/small_deflate.zip")
+        toc_entry = zi._files["zeroes.bin"]
+        toc_entry = toc_entry[:3] + (toc_entry[3] * 2,) + toc_entry[4:]
+        with zipimport64._open_member(zi.archive, toc_entry) as f:
+            with self.assertRaises(EOFError):
+                f.seek(0, os.SEEK_END)
+
+    def test_large_zstd_bounded(self):
+        try:
+            from compression.zstd import compress
+        except ImportError:
+            try:
+                from zstandard import compress
+            except ImportError:
+                self.skipTest("no zstd compressor available")
+        data = os.urandom(100_000) + b"\x00" * 50_000_000 + os.urandom(100_000)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        archive = os.path.join(tmpdir, "large_zstd.zip")
+        # Stored, then made to look like a zstd member
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("large.bin", compress(data))
+        entry = zipimport64._read_directory(archive)["large.bin"]
+        toc_entry = (entry[0], zipimport64.ZIP_ZSTANDARD, entry[2], len(data))
+        toc_entry += entry[4:]
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        total = 0
+        with zipimport64._open_member(archive, toc_entry) as f:
+            while chunk := f.read(1 << 16):
+                if total == 0:
+                    self.assertEqual(data[: len(chunk)], chunk)
+                total += len(chunk)
+            f.seek(-1000, os.SEEK_END)
+            self.assertEqual(data[-1000:], f.read())
+        self.assertEqual(len(data), total)
+        # Nothing like the size of the member is held at once.
+        self.assertLess(tracemalloc.get_traced_memory()[1], 4 << 20)
+        zipimport64._zip_reader_cache.pop(archive).close()
+
+    @unittest.skipIf("SLOW" not in os.environ, "Slow test")
+    def test_large(self):
+        zi = zipimporter("testdata/large_deflate_64.zip")
+        total = 0
+        with zi.open("large.bin") as f:
+            while chunk := f.read(1 << 20):
+                self.assertEqual(chunk.count(0), len(chunk))
+                total += len(chunk)
+        self.assertEqual(2_300_000_000, total)
+
+
+class LocalHeaderTest(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.archive = os.path.join(tmpdir, "small.zip")
+        shutil.copy("testdata/small_store.zip", self.archive)
+        zipimport64.enable_stats()
+        self.addCleanup(zipimport64.disable_stats)
+        self.addCleanup(zipimport64.disable_local_header_checks)
+
+    def reads(self, zi, name):
+        zipimport64.reset_stats()
+        self.assertEqual(b"\x00" * 10_000, zi.get_data(name))
+        return zipimport64.get_stats()["archives"][self.archive]["reads"]
+
+    def test_header_read_once(self):
+        zi = zipimporter(self.archive)
+        self.assertEqual(2, self.reads(zi, "zeroes.bin"))
+        self.assertEqual(1, self.reads(zi, "zeroes.bin"))
+        with zi.open("zeroes.bin") as f:
+            self.assertEqual(b"\x00" * 10_000, f.read())
+
+    def test_checks(self):
+        zi = zipimporter(self.archive)
+        zipimport64.enable_local_header_checks()
+        self.assertEqual(2, self.reads(zi, "zeroes.bin"))
+        self.assertEqual(2, self.reads(zi, "zeroes.bin"))
+
+    def test_checks_catch_changed_header(self):
+        zi = zipimporter(self.archive)
+        zi.get_data("zeroes.bin")
+        # Overwrite the header's signature, without the archive looking
+        # changed.
+        st = os.stat(self.archive)
+        with open(self.archive, "r+b") as f:
+            f.seek(zi._files["zeroes.bin"][4])
+            f.write(b"XX")
+        os.utime(self.archive, ns=(st.st_atime_ns, st.st_mtime_ns))
+        zi.get_data("zeroes.bin")
+        zipimport64.enable_local_header_checks()
+        with self.assertRaisesRegex(ZipImportError, "bad local file header"):
+            zi.get_data("zeroes.bin")
+
+
+class GetManyTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        zipimport64.enable_stats()
+        self.addCleanup(zipimport64.disable_stats)
+
+    def make_archive(self, members, compression=zipfile.ZIP_DEFLATED):
+        path = os.path.join(self.tmpdir, "many.zip")
+        with zipfile.ZipFile(path, "w", compression) as zf:
+            for name, data in members.items():
+                if isinstance(name, zipfile.ZipInfo):
+                    name.compress_type = compression
+                zf.writestr(name, data)
+        zipimport64.reset_stats()
+        return zipimporter(path)
+
+    def reads(self, zi):
+        return zipimport64.get_stats()["archives"][zi.archive]["reads"]
+
+    def test_same_as_get_data(self):
+        for archive in StreamTest.ARCHIVES:
+            zi = zipimporter(archive)
+            names = ["zeroes.bin", zi.archive + "/small.py"]
+            for workers in [None, 4]:
+                with self.subTest(archive=archive, workers=workers):
+                    try:
+                        results = zi.get_many(names, workers)
+                    except ZipImportError:
+                        continue  # codec not installed
+                    self.assertEqual(names, list(results))
+                    for name in names:
+                        self.assertEqual(zi.get_data(name), results[name])
+
+    def test_coalesced(self):
+        members = {f"m{i}.py": f"x = {i}\n" * i for i in range(100)}
+        zi = self.make_archive(members)
+        zipimport64.reset_stats()
+        names = sorted(members, reverse=True)
+        results = zi.get_many(names, workers=4)
+        expected = {name: data.encode() for name, data in members.items()}
+        self.assertEqual(expected, results)
+        self.assertEqual(1, self.reads(zi))
+
+    def test_gap(self):
+        zi = self.make_archive(
+            {"a.txt": b"a", "big.bin": os.urandom(200_000), "b.txt": b"b"},
+            zipfile.ZIP_STORED,
+        )
+        zipimport64.reset_stats()
+        self.assertEqual(
+            {"a.txt": b"a", "b.txt": b"b"}, zi.get_many(["a.txt", "b.txt"])
+        )
+        self.assertEqual(2, self.reads(zi))
+        zipimport64.reset_stats()
+        with mock.patch.object(zipimport64, "_COALESCE_GAP", 1_000_000):
+            zi.get_many(["a.txt", "b.txt"])
+        self.assertEqual(1, self.reads(zi))
+
+    def test_long_extra_field(self):
+        # The local header's extra field is bigger than allowed for.
+        info = zipfile.ZipInfo("extra.txt")
+        info.extra = b"\xfe\xca\xe8\x03" + b"\x00" * 1000
+        zi = self.make_archive({"first.txt": b"first", info: b"extra"})
+        self.assertEqual(
+            {"first.txt": b"first", "extra.txt": b"extra"},
+            zi.get_many(["first.txt", "extra.txt"]),
+        )
+
+    def test_missing(self):
+        zi = zipimporter("testdata/small_deflate.zip")
+        with self.assertRaises(OSError):
+            zi.get_many(["small.py", "missing.py"])
+
+
+class AsyncTest(unittest.TestCase):
+    def test_get_data_async(self):
+        for archive in ["testdata/small_store.zip", "testdata/small_deflate.zip"]:
+            zi = zipimporter(archive)
+            with self.subTest(archive):
+                for name in ["small.py", "zeroes.bin"]:
+                    data = asyncio.run(zi.get_data_async(name))
+                    self.assertEqual(zi.get_data(name), data)
+
+    def test_get_data_async_in_chunks(self):
+        zi = zipimporter("testdata/small_store.zip")
+        with ThreadPoolExecutor(1) as executor:
+            with mock.patch.object(zipimport64, "_ASYNC_CHUNK_SIZE", 1000):
+                data = asyncio.run(zi.get_data_async("zeroes.bin", executor))
+        self.assertEqual(b"\x00" * 10_000, data)
+
+    def test_open_async(self):
+        async def read(zi):
+            async with zi.open_async("small.py") as f:
+                self.assertEqual(0, await f.tell())
+                self.assertEqual(EXPECTED_SMALL[:3], await f.read(3))
+                self.assertEqual(3, await f.tell())
+                self.assertEqual(1, await f.seek(1))
+                self.assertEqual(EXPECTED_SMALL[1:], await f.read())
+                self.assertEqual(b"", await f.read())
+            self.assertTrue(f.closed)
+            with self.assertRaises(ValueError):
+                await f.read()
+            async with zi.open_async("zeroes.bin") as f:
+                return [chunk async for chunk in f]
+
+        zi = zipimporter("testdata/small_deflate.zip")
+        with mock.patch.object(zipimport64, "_ASYNC_CHUNK_SIZE", 4000):
+            chunks = asyncio.run(read(zi))
+        self.assertEqual([4000, 4000, 2000], [len(chunk) for chunk in chunks])
+        self.assertEqual(b"\x00" * 10_000, b"".join(chunks))
+
+    def test_seek_in_chunks(self):
+        async def seek(zi, executor):
+            async with zi.open_async("zeroes.bin", executor) as f:
+                self.assertEqual(9_000, await f.seek(-1000, os.SEEK_END))
+                self.assertEqual(b"\x00" * 1000, await f.read())
+                self.assertEqual(5_500, await f.seek(5_500))
+                self.assertEqual(5_600, await f.seek(100, os.SEEK_CUR))
+                self.assertEqual(5_600, await f.tell())
+                self.assertEqual(10_000, await f.seek(20_000))
+
+        zi = zipimporter("testdata/small_deflate.zip")
+        with ThreadPoolExecutor(1) as executor:
+            with mock.patch.object(executor, "submit", wraps=executor.submit) as submit:
+                with mock.patch.object(zipimport64, "_ASYNC_CHUNK_SIZE", 1000):
+                    asyncio.run(seek(zi, executor))
+        # No call decompresses more than a chunk.
+        self.assertGreater(submit.call_count, 20)
+
+    def test_large_member_hooks(self):
+        zi = zipimporter("testdata/small_deflate.zip")
+        zipimport64.enable_data_cache(100_000)
+        self.addCleanup(zipimport64.disable_data_cache)
+        zipimport64.enable_stats()
+        self.addCleanup(zipimport64.disable_stats)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        log = os.path.join(tmpdir, "prefetch.log")
+        zipimport64.start_recording(log)
+        self.addCleanup(zipimport64.stop_recording)
+        # The member is 27 bytes compressed.
+        with mock.patch.object(zipimport64, "_ASYNC_CHUNK_SIZE", 10):
+            for _ in range(2):
+                data = asyncio.run(zi.get_data_async("zeroes.bin"))
+                self.assertEqual(b"\x00" * 10_000, data)
+        self.assertEqual(1, zipimport64.stop_recording())
+        self.assertEqual(1, zipimport64.data_cache_info()["hits"])
+        stats = zipimport64.get_stats()["archives"][zi.archive]
+        self.assertEqual(1, stats["data_cache_hits"])
+        self.assertEqual(10_000, stats["bytes_decompressed"])
+
+    def test_missing(self):
+        zi = zipimporter("testdata/small_deflate.zip")
+        with self.assertRaises(OSError):
+            asyncio.run(zi.get_data_async("missing.py"))
+        with self.assertRaises(OSError):
+            zi.open_async("missing.py")
+
+    def test_cancel(self):
+        calls = 0
+        task = None
+
+        class CancellingExecutor(ThreadPoolExecutor):
+            def submit(self, *args, **kwargs):
+                nonlocal calls
+                calls += 1
+                if calls == 5:
+                    task.cancel()
+                return super().submit(*args, **kwargs)
+
+        async def cancel(zi, executor):
+            nonlocal task
+            task = asyncio.create_task(zi.get_data_async("zeroes.bin", executor))
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        zi = zipimporter("testdata/small_store.zip")
+        with CancellingExecutor(1) as executor:
+            with mock.patch.object(zipimport64, "_ASYNC_CHUNK_SIZE", 100):
+                asyncio.run(cancel(zi, executor))
+        # Reading 10,000 bytes would take 100 chunks.
+        self.assertLess(calls, 10)
+
+
+class ZeroCopyTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        self.addCleanup(zipimport64._zip_reader_cache.clear)
+
+    def test_stored_member_is_mapped(self):
+        zi = zipimporter("testdata/small_store.zip")
+        view = zi.get_buffer("small.py")
+        self.assertIsInstance(view, memoryview)
+        self.assertTrue(view.readonly)
+        self.assertEqual(EXPECTED_SMALL, view)
+        self.assertEqual("mmap", type(view.obj).__name__)
+
+    def test_compressed_member(self):
+        zi = zipimporter("testdata/small_deflate.zip")
+        view = zi.get_buffer("testdata/small_deflate.zip/small.py")
+        self.assertTrue(view.readonly)
+        self.assertEqual(EXPECTED_SMALL, view)
+
+    def test_cached_and_recorded(self):
+        zipimport64.enable_data_cache(1_000_000)
+        self.addCleanup(zipimport64.disable_data_cache)
+        zipimport64.enable_stats()
+        self.addCleanup(zipimport64.disable_stats)
+        log = os.path.join(self.tmp.name, "prefetch.log")
+        zipimport64.start_recording(log)
+        self.addCleanup(zipimport64.stop_recording)
+        zi = zipimporter("testdata/small_store.zip")
+        zi.get_buffer("small.py")
+        self.assertEqual(1, zipimport64.stop_recording())
+        counters = zipimport64.get_stats()["archives"][zi.archive]
+        self.assertEqual((1, 6), (counters["mapped_reads"], counters["bytes_mapped"]))
+        # Data already read comes from the data cache rather than the map.
+        zi.get_data("zeroes.bin")
+        view = zi.get_buffer("zeroes.bin")
+        self.assertIsInstance(view.obj, bytes)
+        self.assertEqual(1, zipimport64.get_stats()["total"]["data_cache_hits"])
+
+    def test_view_outlives_reader(self):
+        zi = zipimporter("testdata/small_store.zip")
+        view = zi.get_buffer("small.py")
+        zipimport64._zip_reader_cache.pop(zi.archive).close()
+        self.assertEqual(EXPECTED_SMALL, view)
+
+    def test_archive_grows(self):
+        archive = os.path.join(self.tmp.name, "app.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("a.bin", b"a" * 100)
+        zi = zipimporter(archive)
+        self.assertEqual(b"a" * 100, zi.get_buffer("a.bin"))
+        with zipfile.ZipFile(archive, "a") as zf:
+            zf.writestr("b.bin", b"b" * 100)
+        zi.invalidate_caches()
+        self.assertEqual(b"b" * 100, zi.get_buffer("b.bin"))
+
+    def test_bytecode_is_not_copied(self):
+        archive = os.path.join(self.tmp.name, "app.zip")
+        source = b"x = 1\n"
+        code = compile(source, "mod.py", "exec")
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("mod.py", source)
+            zf.writestr(
+                "mod.pyc",
+                importlib.util.MAGIC_NUMBER
+                + b"\x01\x00\x00\x00"  # unchecked hash-based pyc
+                + b"\x00" * 8
+                + marshal.dumps(code),
+            )
+        with mock.patch.object(zipimport64, "_read_data", side_effect=AssertionError):
+            code = zipimporter(archive).get_code("mod")
+        ns = {}
+        exec(code, ns)
+        self.assertEqual(1, ns["x"])
+
+    def test_resource_reader(self):
+        archive = os.path.join(self.tmp.name, "app.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("pkg/__init__.py", b"")
+            zf.writestr("pkg/table.bin", b"\x01" * 1000)
+        reader = zipimporter(archive).get_resource_reader("pkg")
+        self.assertEqual(b"\x01" * 1000, reader.get_buffer("table.bin"))
+        with self.assertRaises(FileNotFoundError):
+            reader.get_buffer("missing.bin")
+
+
+class ExtractionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        self.cache = os.path.join(self.tmp.name, "cache")
+        zipimport64.enable_extraction_cache(self.cache)
+        self.addCleanup(zipimport64.disable_extraction_cache)
+
+        self.archive = os.path.join(self.tmp.name, "app.zip")
+        with zipfile.ZipFile(self.archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("pkg/__init__.py", b"")
+            zf.writestr("pkg/cacert.pem", b"cert" * 1000)
+            zf.writestr("pkg/other.bin", b"other" * 1000)
+
+    def reader(self):
+        return zipimporter(self.archive).get_resource_reader("pkg")
+
+    def test_disabled(self):
+        zipimport64.disable_extraction_cache()
+        with self.assertRaises(FileNotFoundError):
+            self.reader().resource_path("cacert.pem")
+
+    def package(self):
+        zi = zipimporter(self.archive)
+        spec = importlib.util.spec_from_loader("pkg", zi, is_package=True)
+        return importlib.util.module_from_spec(spec)
+
+    def test_extracted_once(self):
+        resource = importlib.resources.files(self.package()) / "cacert.pem"
+        with importlib.resources.as_file(resource) as path:
+            self.assertEqual("cacert.pem", path.name)
+            self.assertTrue(str(path).startswith(self.cache))
+            self.assertEqual(b"cert" * 1000, path.read_bytes())
+        # It stays in the cache.
+        self.assertTrue(path.exists())
+
+        with mock.patch.object(
+            zipimport64, "_open_member", side_effect=AssertionError
+        ):
+            with warnings.catch_warnings():
+                # Deprecated in 3.11 and 3.12
+                warnings.simplefilter("ignore", DeprecationWarning)
+                with importlib.resources.path(self.package(), "cacert.pem") as other:
+                    self.assertEqual(path, other)
+            resource = importlib.resources.files(self.package()) / "cacert.pem"
+            with importlib.resources.as_file(resource) as other:
+                self.assertEqual(path, other)
+
+    def test_as_file_disabled(self):
+        zipimport64.disable_extraction_cache()
+        resource = importlib.resources.files(self.package()) / "cacert.pem"
+        with importlib.resources.as_file(resource) as path:
+            self.assertFalse(str(path).startswith(self.cache))
+            self.assertEqual(b"cert" * 1000, path.read_bytes())
+        self.assertFalse(path.exists())
+
+    def test_missing(self):
+        with self.assertRaises(FileNotFoundError):
+            self.reader().resource_path("missing.pem")
+
+    def test_changed_resource(self):
+        path = self.reader().resource_path("cacert.pem")
+        with zipfile.ZipFile(self.archive, "w") as zf:
+            zf.writestr("pkg/__init__.py", b"")
+            zf.writestr("pkg/cacert.pem", b"new cert")
+        zipimport64._zip_directory_cache.clear()
+        new_path = self.reader().resource_path("cacert.pem")
+        self.assertNotEqual(path, new_path)
+        with open(new_path, "rb") as f:
+            self.assertEqual(b"new cert", f.read())
+
+    def test_concurrent(self):
+        reader = self.reader()
+        with ThreadPoolExecutor(8) as pool:
+            paths = set(
+                pool.map(lambda _: reader.resource_path("cacert.pem"), range(32))
+            )
+        self.assertEqual(1, len(paths))
+        path = paths.pop()
+        self.assertEqual(["cacert.pem"], os.listdir(os.path.dirname(path)))
+        with open(path, "rb") as f:
+            self.assertEqual(b"cert" * 1000, f.read())
+
+    def test_trim(self):
+        old = self.reader().resource_path("cacert.pem")
+        os.utime(old, ns=(0, 0))
+        new = self.reader().resource_path("other.bin")
+        self.assertEqual(4000, zipimport64.trim_extraction_cache(5000))
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+
+    def test_max_bytes(self):
+        zipimport64.enable_extraction_cache(self.cache, max_bytes=5000)
+        old = self.reader().resource_path("cacert.pem")
+        os.utime(old, ns=(0, 0))
+        new = self.reader().resource_path("other.bin")
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+
+
+class ExtensionModuleTest(unittest.TestCase):
+    def setUp(self):
+        spec = importlib.machinery.PathFinder.find_spec("xxlimited")
+        if spec is None or not spec.origin.endswith(".so"):
+            self.skipTest("needs the xxlimited extension module")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        self.archive = os.path.join(self.tmp.name, "app.zip")
+        with zipfile.ZipFile(self.archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.write(spec.origin, os.path.basename(spec.origin))
+
+    def load(self):
+        loader = zipimporter(self.archive).find_module("xxlimited")
+        self.assertIsInstance(loader, zipimport64._ZipExtensionLoader)
+        spec = importlib.util.spec_from_loader("xxlimited", loader)
+        module = importlib.util.module_from_spec(spec)
+        loader.exec_module(module)
+        self.assertEqual(3, module.foo(1, 2))
+        self.assertTrue(module.__file__.startswith(self.archive + os.sep))
+        return module
+
+    @unittest.skipUnless(hasattr(os, "memfd_create"), "needs memfd_create")
+    def test_memfd(self):
+        with mock.patch.object(
+            zipimport64, "_extract", side_effect=AssertionError
+        ):
+            self.load()
+
+    def test_extraction_cache(self):
+        cache = os.path.join(self.tmp.name, "cache")
+        zipimport64.enable_extraction_cache(cache)
+        self.addCleanup(zipimport64.disable_extraction_cache)
+        with mock.patch.object(zipimport64, "_memfd_create", None):
+            self.load()
+        self.assertEqual(1, len(os.listdir(cache)))
+
+    def test_not_loadable(self):
+        with mock.patch.object(zipimport64, "_memfd_create", None):
+            self.assertIsNone(zipimporter(self.archive).find_module("xxlimited"))
+
+
+class DirectoryTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        self.archive = os.path.join(self.tmp.name, "app.zip")
+        # No entries for directories
+        with zipfile.ZipFile(self.archive, "w") as zf:
+            zf.writestr("pkg/__init__.py", b"")
+            zf.writestr("pkg/data/a.txt", b"a")
+            zf.writestr("pkg/data/sub/b.txt", b"b")
+            zf.writestr("ns/mod.py", b"")
+        self.zi = zipimporter(self.archive)
+
+    def test_list_dir(self):
+        files = self.zi._files
+        self.assertEqual({"pkg": True, "ns": True}, files._list_dir(""))
+        self.assertEqual({"a.txt": False, "sub": True}, files._list_dir("pkg/data/"))
+        self.assertIsNone(files._list_dir("pkg/data/a.txt/"))
+        self.assertIsNone(files._list_dir("missing/"))
+
+    def test_directory_entries(self):
+        with zipfile.ZipFile(self.archive, "w") as zf:
+            zf.writestr("pkg/", b"")
+            zf.writestr("pkg/empty/", b"")
+            zf.writestr("pkg/__init__.py", b"")
+        files = zipimporter(self.archive)._files
+        self.assertEqual({"pkg": True}, files._list_dir(""))
+        self.assertEqual({"empty": True, "__init__.py": False}, files._list_dir("pkg/"))
+        self.assertEqual({}, files._list_dir("pkg/empty/"))
+
+    def test_namespace_portion(self):
+        self.assertEqual(
+            (None, [os.path.join(self.archive, "ns")]), self.zi.find_loader("ns")
+        )
+
+    def test_contents(self):
+        reader = self.zi.get_resource_reader("pkg")
+        self.assertEqual({"__init__.py", "data"}, set(reader.contents()))
+        with mock.patch.object(zipimport64, "_read_data", side_effect=AssertionError):
+            self.assertTrue(reader.is_resource("__init__.py"))
+            self.assertFalse(reader.is_resource("data"))
+            self.assertFalse(reader.is_resource("missing"))
+
+    def test_files(self):
+        root = self.zi.get_resource_reader("pkg").files()
+        self.assertIsInstance(root, importlib.resources.abc.Traversable)
+        self.assertTrue(root.is_dir())
+        self.assertEqual({"__init__.py", "data"}, {p.name for p in root.iterdir()})
+
+        b = root / "data/sub" / "b.txt"
+        self.assertEqual(b, root.joinpath("data", "sub", "b.txt"))
+        self.assertTrue(b.is_file())
+        self.assertFalse(b.is_dir())
+        self.assertEqual("b", b.read_text())
+        self.assertEqual(b"b", b.read_bytes())
+        with b.open("rb") as f:
+            self.assertEqual(b"b", f.read())
+
+        with self.assertRaises(IsADirectoryError):
+            (root / "data").open()
+        with self.assertRaises(FileNotFoundError):
+            (root / "missing").read_bytes()
+        with self.assertRaises(NotADirectoryError):
+            list(b.iterdir())
+
+
+class ModuleIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        self.a = os.path.join(self.tmp.name, "a.zip")
+        with zipfile.ZipFile(self.a, "w") as zf:
+            zf.writestr("mod_a.py", b"where = 'a'\n")
+            zf.writestr("nspkg/x.py", b"")
+        self.b = os.path.join(self.tmp.name, "b.zip")
+        with zipfile.ZipFile(self.b, "w") as zf:
+            zf.writestr("mod_a.py", b"where = 'b'\n")
+            zf.writestr("mod_b.py", b"where = 'b'\n")
+            zf.writestr("nspkg/y.py", b"")
+        self.dir = os.path.join(self.tmp.name, "dir")
+        os.mkdir(self.dir)
+        with open(os.path.join(self.dir, "mod_b.py"), "w") as f:
+            f.write("where = 'dir'\n")
+
+        for patch in [
+            mock.patch.object(sys, "path", [self.a, self.dir, self.b]),
+            mock.patch.object(sys, "path_hooks", [zipimporter] + sys.path_hooks),
+            mock.patch.object(sys, "meta_path", list(sys.meta_path)),
+            mock.patch.dict(sys.path_importer_cache),
+            mock.patch.dict(sys.modules),
+            warnings.catch_warnings(),
+        ]:
+            patch.__enter__()
+            self.addCleanup(patch.__exit__, None, None, None)
+        # zipimporter only has find_loader()
+        warnings.simplefilter("ignore", ImportWarning)
+        zipimport64.enable_module_index()
+        self.addCleanup(zipimport64.disable_module_index)
+
+    def test_replaces_path_finder(self):
+        self.assertNotIn(importlib.machinery.PathFinder, sys.meta_path)
+        zipimport64.disable_module_index()
+        self.assertIn(importlib.machinery.PathFinder, sys.meta_path)
+
+    def test_precedence(self):
+        self.assertEqual("a", importlib.import_module("mod_a").where)
+        self.assertEqual("dir", importlib.import_module("mod_b").where)
+
+    def test_namespace_package(self):
+        nspkg = importlib.import_module("nspkg")
+        self.assertEqual(
+            [os.path.join(self.a, "nspkg"), os.path.join(self.b, "nspkg")],
+            list(nspkg.__path__),
+        )
+        importlib.import_module("nspkg.x")
+        importlib.import_module("nspkg.y")
+
+    def test_only_archives_with_the_module_are_searched(self):
+        with mock.patch.object(
+            zipimporter, "find_loader", autospec=True, return_value=(None, [])
+        ) as find_loader:
+            with self.assertRaises(ImportError):
+                importlib.import_module("missing")
+            self.assertEqual([], find_loader.call_args_list)
+            # Not found (by the mock) in a.zip, so b.zip is next.
+            importlib.util.find_spec("mod_a")
+        self.assertEqual(
+            [self.a, self.b],
+            [call.args[0].archive for call in find_loader.call_args_list],
+        )
+
+    def test_sys_path_change(self):
+        sys.path.remove(self.a)
+        self.assertEqual("b", importlib.import_module("mod_a").where)
+
+
+class PrefetchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        self.addCleanup(zipimport64.stop_prefetch)
+        self.addCleanup(zipimport64.stop_recording)
+        self.archive = os.path.join(self.tmp.name, "app.zip")
+        with zipfile.ZipFile(self.archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name in "abcd":
+                zf.writestr(f"{name}.txt", name.encode() * 1000)
+        self.log = os.path.join(self.tmp.name, "prefetch.log")
+
+    def record(self, names):
+        zipimport64.start_recording(self.log)
+        zi = zipimporter(self.archive)
+        for name in names:
+            zi.get_data(f"{name}.txt")
+        return zipimport64.stop_recording()
+
+    def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail("timed out")
+
+    def start(self, **kwargs):
+        self.assertEqual(4, zipimport64.prefetch(self.log, **kwargs))
+        prefetcher = zipimport64._prefetcher
+        self.wait_for(
+            lambda: prefetcher._running == 0
+            or prefetcher._bytes >= prefetcher.max_bytes
+        )
+        return prefetcher
+
+    def test_record(self):
+        self.assertEqual(4, self.record("cadbca"))
+        with open(self.log, "rb") as f:
+            version, entries = marshal.load(f)
+        self.assertEqual([(self.archive, f"{name}.txt") for name in "cadb"], entries)
+
+    def test_prefetch(self):
+        self.record("cadb")
+        prefetcher = self.start()
+        zi = zipimporter(self.archive)
+        for name in "cadb":
+            self.assertEqual(name.encode() * 1000, zi.get_data(f"{name}.txt"))
+        self.assertEqual(4, prefetcher.hits)
+        # Nothing left to prefetch
+        self.assertIsNone(zipimport64._prefetcher)
+
+    def test_prefetch_async(self):
+        self.record("abcd")
+        prefetcher = self.start()
+        zi = zipimporter(self.archive)
+        # Large enough to be read a chunk at a time
+        with mock.patch.object(zipimport64, "_ASYNC_CHUNK_SIZE", 5):
+            for name in "ab":
+                data = asyncio.run(zi.get_data_async(f"{name}.txt"))
+                self.assertEqual(name.encode() * 1000, data)
+        self.assertEqual(2, prefetcher.hits)
+
+    def test_skipped(self):
+        self.record("abcd")
+        prefetcher = self.start()
+        zi = zipimporter(self.archive)
+        zi.get_data("c.txt")
+        zi.get_data("a.txt")
+        self.assertEqual((1, 1), (prefetcher.hits, prefetcher.misses))
+        self.assertEqual([3], list(prefetcher._staged))
+
+    def test_max_bytes(self):
+        self.record("abcd")
+        prefetcher = self.start(workers=1, max_bytes=1000)
+        self.assertEqual(1, prefetcher._next)
+        zipimporter(self.archive).get_data("a.txt")
+        self.wait_for(lambda: prefetcher._next == 2)
+
+    def test_changed_archive(self):
+        self.record("abcd")
+        self.start()
+        with zipfile.ZipFile(self.archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("a.txt", b"new")
+        zi = zipimporter(self.archive)
+        zi.invalidate_caches()
+        self.assertEqual(b"new", zi.get_data("a.txt"))
+
+    def test_stored_archive(self):
+        archive = os.path.join(self.tmp.name, "stored.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            for name in "abcd":
+                code = compile(f"x = {name!r}\n", f"mod_{name}.py", "exec")
+                zf.writestr(
+                    f"mod_{name}.pyc",
+                    importlib.util.MAGIC_NUMBER
+                    + b"\x01\x00\x00\x00"  # unchecked hash-based pyc
+                    + b"\x00" * 8
+                    + marshal.dumps(code),
+                )
+        zipimport64.start_recording(self.log)
+        zi = zipimporter(archive)
+        for name in "cadb":
+            zi.get_code(f"mod_{name}")
+        self.assertEqual(4, zipimport64.stop_recording())
+
+        self.start()
+        prefetcher = zipimport64._prefetcher
+        zi = zipimporter(archive)
+        for name in "cadb":
+            ns = {}
+            exec(zi.get_code(f"mod_{name}"), ns)
+            self.assertEqual(name, ns["x"])
+        self.assertEqual(4, prefetcher.hits)
+
+    def test_no_log(self):
+        self.assertEqual(0, zipimport64.prefetch(self.log))
+        self.assertIsNone(zipimport64._prefetcher)
+
+
+class StatsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        self.addCleanup(zipimport64._zip_reader_cache.clear)
+        self.archive = os.path.join(self.tmp.name, "app.zip")
+        code = compile(b"y = 2\n", "cmod.py", "exec")
+        with zipfile.ZipFile(self.archive, "w") as zf:
+            zf.writestr("mod.py", b"x = 1\n", zipfile.ZIP_DEFLATED)
+            zf.writestr(
+                "cmod.pyc",
+                importlib.util.MAGIC_NUMBER
+                + b"\x01\x00\x00\x00"  # unchecked hash-based pyc
+                + b"\x00" * 8
+                + marshal.dumps(code),
+            )
+            zf.writestr("old.pyc", b"\x00\x00\x0d\x0a" + b"\x00" * 12 + b"junk")
+            zf.writestr("old.py", b"z = 3\n")
+        zipimport64.enable_stats()
+        self.addCleanup(zipimport64.disable_stats)
+
+    def test_disabled(self):
+        zipimport64.disable_stats()
+        self.assertIsNone(zipimport64.get_stats())
+
+    def test_counters(self):
+        zi = zipimporter(self.archive)
+        zi.get_code("mod")
+        zi.get_code("cmod")
+        zi.get_code("old")
+        with mock.patch.dict(sys.modules):
+            zi.load_module("mod")
+
+        stats = zipimport64.get_stats()
+        counters = stats["archives"][self.archive]
+        self.assertEqual(counters, stats["total"])
+        self.assertEqual(1, counters["directory_reads"])
+        self.assertEqual(1, counters["opens"])
+        self.assertEqual(3, counters["compiles"])
+        self.assertEqual(2, counters["decompressions"])
+        self.assertEqual(2 * len(b"x = 1\n"), counters["bytes_decompressed"])
+        self.assertEqual(1, counters["pyc_loads"])
+        self.assertEqual(1, counters["stale_pycs"])
+        self.assertEqual(2, counters["mapped_reads"])  # cmod.pyc and old.pyc
+        self.assertEqual(1, counters["execs"])
+        self.assertGreater(counters["bytes_read"], 0)
+        self.assertGreater(counters["compile_ns"], 0)
+
+    def test_reset(self):
+        zipimporter(self.archive)
+        zipimport64.reset_stats()
+        stats = zipimport64.get_stats()
+        self.assertEqual({}, stats["archives"])
+        self.assertEqual(0, stats["total"]["directory_reads"])
+
+
+class CheckedHashPycTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        patcher = mock.patch.object(zipimport64, "_validated_pycs", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        zipimport64.enable_stats()
+        self.addCleanup(zipimport64.disable_stats)
+
+        self.archive = os.path.join(self.tmp.name, "app.zip")
+        with zipfile.ZipFile(self.archive, "w") as zf:
+            self.write_module(zf, "mod", b"x = 1\n")
+            # A .pyc that doesn't match its source
+            self.write_module(zf, "stale", b"x = 2\n", b"x = 3\n")
+
+    def write_module(self, zf, name, source, compiled_source=None):
+        compiled_source = compiled_source or source
+        code = compile(compiled_source, f"{name}.py", "exec")
+        zf.writestr(f"{name}.py", source)
+        zf.writestr(
+            f"{name}.pyc",
+            importlib.util.MAGIC_NUMBER
+            + b"\x03\x00\x00\x00"  # checked hash-based pyc
+            + importlib.util.source_hash(compiled_source)
+            + marshal.dumps(code),
+        )
+
+    def get_x(self, fullname):
+        zipimport64.reset_stats()
+        ns = {}
+        exec(zipimporter(self.archive).get_code(fullname), ns)
+        stats = zipimport64.get_stats()["archives"][self.archive]
+        return ns["x"], stats["pyc_hash_checks"], stats["pyc_hash_check_skips"]
+
+    def test_checked_once(self):
+        self.assertEqual((1, 1, 0), self.get_x("mod"))
+        with mock.patch.object(
+            zipimport64, "_get_pyc_source", side_effect=AssertionError
+        ):
+            self.assertEqual((1, 0, 1), self.get_x("mod"))
+
+    def test_mismatch_is_not_remembered(self):
+        self.assertEqual((2, 0, 0), self.get_x("stale"))
+        self.assertEqual((2, 0, 0), self.get_x("stale"))
+        self.assertEqual(set(), zipimport64._validated_pycs)
+
+    def test_changed_source(self):
+        self.get_x("mod")
+        with zipfile.ZipFile(self.archive, "w") as zf:
+            self.write_module(zf, "mod", b"x = 1\n", b"x = 4\n")
+        zipimport64._zip_directory_cache.clear()
+        self.assertEqual((1, 0, 0), self.get_x("mod"))
+
+    def test_remembered_in_code_cache(self):
+        cache = os.path.join(self.tmp.name, "cache")
+        zipimport64.enable_code_cache(cache)
+        self.addCleanup(zipimport64.disable_code_cache)
+        self.assertEqual((1, 1, 0), self.get_x("mod"))
+        # As if in a new process
+        zipimport64._validated_pycs = None
+        self.assertEqual((1, 0, 1), self.get_x("mod"))
+
+
+class CodeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(zipimport64._zip_directory_cache.clear)
+        self.cache = os.path.join(self.tmp.name, "cache")
+        zipimport64.enable_code_cache(self.cache)
+        self.addCleanup(zipimport64.disable_code_cache)
+
+        self.archive = os.path.join(self.tmp.name, "app.zip")
+        with zipfile.ZipFile(self.archive, "w") as zf:
+            zf.writestr("mod.py", b"x = 1\n")
+            zf.writestr("pkg/__init__.py", b"y = 2\n")
+            zf.writestr("bad.py", b"def (\n")
+            # Bytecode for some other interpreter, with its source.
+            zf.writestr("old.pyc", b"\x00\x00\x0d\x0a" + b"\x00" * 12 + b"junk")
+            zf.writestr("old.py", b"z = 3\n")
+
+    def test_cached_code_is_reused(self):
+        code = zipimporter(self.archive).get_code("mod")
+        self.assertEqual(os.path.join(self.archive, "mod.py"), code.co_filename)
+
+        other = os.path.join(self.tmp.name, "other.zip")
+        shutil.copy(self.archive, other)
+        with mock.patch.object(
+            zipimport64, "_compile_source", side_effect=AssertionError
+        ):
+            code = zipimporter(other).get_code("mod")
+        # The cached code gets the right filename.
+        self.assertEqual(os.path.join(other, "mod.py"), code.co_filename)
+        ns = {}
+        exec(code, ns)
+        self.assertEqual(1, ns["x"])
+
+    def test_changed_source_is_recompiled(self):
+        zipimporter(self.archive).get_code("mod")
+        with zipfile.ZipFile(self.archive, "w") as zf:
+            zf.writestr("mod.py", b"x = 2\n")
+        zipimport64._zip_directory_cache.clear()
+        ns = {}
+        exec(zipimporter(self.archive).get_code("mod"), ns)
+        self.assertEqual(2, ns["x"])
+
+    def test_stale_pyc_is_remembered(self):
+        self.assertIsNotNone(zipimporter(self.archive).get_code("old"))
+        # As in a new process.
+        zipimport64._stale_pyc_cache.clear()
+        with mock.patch.object(
+            zipimport64, "_unmarshal_code", side_effect=AssertionError
+        ):
+            self.assertIsNotNone(zipimporter(self.archive).get_code("old"))
+
+    def test_stale_pycs_are_appended(self):
+        with zipfile.ZipFile(self.archive, "a") as zf:
+            for i in range(3):
+                zf.writestr(f"old{i}.pyc", b"\x00\x00\x0d\x0a" + b"\x00" * 12)
+                zf.writestr(f"old{i}.py", b"")
+        zi = zipimporter(self.archive)
+        path = zipimport64._stale_pyc_path(self.archive)
+        stats = []
+        for name in ["old", "old0", "old1", "old2"]:
+            zi.get_code(name)
+            stats.append(os.stat(path))
+        # Each record is added to the same file, not the whole set written to
+        # a new one.
+        self.assertEqual(1, len({st.st_ino for st in stats}))
+        sizes = [st.st_size for st in stats]
+        record_size = sizes[1] - sizes[0]
+        self.assertEqual([record_size] * 3, [b - a for a, b in zip(sizes, sizes[1:])])
+        keys = zipimport64._stale_pyc_cache.pop(self.archive)
+        self.assertEqual(4, len(keys))
+        self.assertEqual(keys, zipimport64._get_stale_pycs(self.archive))
+
+    @unittest.skipUnless(hasattr(time, "tzset"), "requires time.tzset()")
+    def test_stale_pyc_key_ignores_time_zone(self):
+        zi = zipimporter(self.archive)
+        toc_entry = zi._files["old.pyc"]
+        keys = set()
+        for tz in ["UTC", "America/New_York", "Asia/Tokyo"]:
+            with mock.patch.dict(os.environ, {"TZ": tz}):
+                time.tzset()
+                keys.add(zipimport64._stale_pyc_key(zi, "old.pyc", toc_entry))
+        time.tzset()
+        self.assertEqual(1, len(keys))
+
+    def test_precompile(self):
+        # Syntax errors are skipped.
+        self.assertEqual(3, zipimport64.precompile(self.archive, workers=2))
+        self.assertEqual(0, zipimport64.precompile(self.archive, workers=1))
+        with mock.patch.object(
+            zipimport64, "_compile_source", side_effect=AssertionError
+        ):
+            zi = zipimporter(self.archive)
+            zi.get_code("mod")
+            zi.get_code("pkg")
+
+    def test_precompile_leaves_cache_disabled(self):
+        zipimport64.disable_code_cache()
+        other = os.path.join(self.tmp.name, "other")
+        self.assertEqual(3, zipimport64.precompile(self.archive, other, workers=1))
+        self.assertIsNone(zipimport64._code_cache_dir)
+
+    def test_precompile_command(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            zipimport64.main(["precompile", "-j", "1", "-d", self.cache, self.archive])
+        self.assertEqual(f"{self.archive}: compiled 3 files\n", out.getvalue())
@@ -2,7 +2,10 @@
 
 import os
 import shutil
+import struct
+import subprocess
 import zipfile
+import zlib
 
 from zip64_promotion import (
     modify_to_include_all_three_zip64_extra_on_last_entry,
@@ -27,9 +30,61 @@ class ReproducibleZipFile(zipfile.ZipFile):
         return super().writestr(zinfo_or_arcname, data, compress_type, compresslevel)
 
 
+ZIP_ZSTANDARD = 93
+
+
+def write_zstd_zip(filename, members):
+    """
+    zipfile can only write zstd members on 3.14+, so store the output of the
+    zstd cli and then patch the method, crc and uncompressed size.
+    """
+    compressed = {
+        name: subprocess.run(
+            ["zstd", "-q", "-c", "-19"], input=data, capture_output=True, check=True
+        ).stdout
+        for name, data in members.items()
+    }
+    with ReproducibleZipFile(filename, "w") as zf:
+        for name, data in compressed.items():
+            zf.writestr(name, data)
+        infos = zf.infolist()
+
+    with open(filename, "rb") as f:
+        buf = bytearray(f.read())
+    cd_offset = struct.unpack("<I", buf[-6:-2])[0]
+    for info in infos:
+        data = members[info.filename]
+        fields = struct.pack("<I", zlib.crc32(data))
+        size = struct.pack("<I", len(data))
+        # local header
+        buf[info.header_offset + 8 : info.header_offset + 10] = struct.pack(
+            "<H", ZIP_ZSTANDARD
+        )
+        buf[info.header_offset + 14 : info.header_offset + 18] = fields
+        buf[info.header_offset + 22 : info.header_offset + 26] = size
+        # central directory header
+        cd_offset = buf.index(b"PK\x01\x02", cd_offset)
+        buf[cd_offset + 10 : cd_offset + 12] = struct.pack("<H", ZIP_ZSTANDARD)
+        buf[cd_offset + 16 : cd_offset + 20] = fields
+        buf[cd_offset + 24 : cd_offset + 28] = size
+        cd_offset += 46
+    with open(filename, "wb") as f:
+        f.write(buf)
+
+
 if __name__ == "__main__":
     os.chdir("testdata")
 
+    for base, compression in [
+        ("bzip2", {"compression": zipfile.ZIP_BZIP2}),
+        ("lzma", {"compression": zipfile.ZIP_LZMA}),
+    ]:
+        with ReproducibleZipFile(f"small_{base}.zip", "w", **compression) as zf:
+            zf.writestr("small.py", SMALL)
+            zf.writestr("zeroes.bin", ZEROES)
+
+    write_zstd_zip("small_zstd.zip", {"small.py": SMALL, "zeroes.bin": ZEROES})
+
     for base, compression in [
         ("store", {}),
         ("deflate", {"compression": zipfile.ZIP_DEFLATED}),
@@ -117,6 +172,17 @@ if __name__ == "__main__":
                 f"small_{base}_fake64.zip",
             )
 
+            # extra data between the Zip64 EOCD and its locator, which still
+            # points at the record
+            with open(f"small_{base}_fake64.zip", "rb") as f:
+                data = f.read()
+
+            assert data[-42:-38] == b"PK\x06\x07"
+            data = data[:-42] + b"\x05" * 100 + data[-42:]
+
+            with open(f"small_{base}_fake64_junk.zip", "wb") as f:
+                f.write(data)
+
             with ReproducibleZipFile(f"turducken_{base}.zip", "w") as zf:
                 # This contains a STORED zip64 at the end of a non-zip64
                 zf.writestr("outer.py", OUTER)
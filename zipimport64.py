@@ -5,7 +5,7 @@ This module exports three objects:
 - ZipImportError: exception raised by zipimporter objects. It's a
   subclass of ImportError, so it can be caught as ImportError, too.
 - _zip_directory_cache: a dict, mapping archive paths to zip directory
-  info dicts, as used in zipimporter._files.
+  info mappings, as used in zipimporter._files.
 
 It is usually not needed to use the zipimport module explicitly; it is
 used by the builtin import mechanism for sys.path items that are paths
@@ -15,15 +15,27 @@ to Zip archives.
 #from importlib import _bootstrap_external
 #from importlib import _bootstrap  # for _verbose_message
 import _frozen_importlib_external as _bootstrap_external
-from _frozen_importlib_external import _unpack_uint16, _unpack_uint32
+from _frozen_importlib_external import _unpack_uint16, _unpack_uint32, _pack_uint32
 import _frozen_importlib as _bootstrap  # for _verbose_message
 import _imp  # for check_hash_based_pycs
 import _io  # for open
+import _thread  # for allocate_lock
 import marshal  # for loads
 import sys  # for modules
 import time  # for mktime
 
-__all__ = ['ZipImportError', 'zipimporter']
+__all__ = ['ZipImportError', 'zipimporter', 'enable_index_cache',
+           'disable_index_cache', 'prewarm_index_cache', 'clear_index_cache',
+           'enable_data_cache', 'disable_data_cache', 'data_cache_info',
+           'enable_code_cache', 'disable_code_cache', 'precompile',
+           'enable_extraction_cache', 'disable_extraction_cache',
+           'trim_extraction_cache', 'enable_module_index',
+           'disable_module_index', 'start_recording', 'stop_recording',
+           'prefetch', 'stop_prefetch', 'enable_stats', 'disable_stats',
+           'get_stats', 'reset_stats', 'enable_local_header_checks',
+           'disable_local_header_checks', 'enable_shared_index',
+           'disable_shared_index', 'register_source', 'unregister_source',
+           'FileSource', 'BlockCache', 'HTTPRangeSource']
 
 
 path_sep = _bootstrap_external.path_sep
@@ -47,6 +59,9 @@ STRING_END_ZIP_64 = b'PK\x06\x06'  # Zip64 EOCD signature
 MAX_COMMENT_LEN = (1 << 16) - 1
 MAX_UINT32 = 0xffffffff
 ZIP64_EXTRA_TAG = 0x1
+CENTRAL_DIR_HEADER_SIZE = 46
+CENTRAL_DIR_HEADER_FORMAT = '<4s6H3I5H2I'
+STRING_CENTRAL_DIR = b'PK\x01\x02'  # central directory file header signature
 
 class zipimporter:
     """zipimporter(archivepath) -> zipimporter object
@@ -75,6 +90,28 @@ class zipimporter:
         if alt_path_sep:
             path = path.replace(alt_path_sep, path_sep)
 
+        prefix = []
+        archive = _find_source_archive(path) if _sources else None
+        if archive is not None:
+            files = _refresh_directory(archive)
+            prefix = [name for name in path[len(archive) + 1:].split(path_sep)
+                      if name]
+        else:
+            files, archive, prefix = self._find_archive(path)
+        if prefix:
+            # The path may lead into archives stored in this one.
+            archive, files, prefix = _enter_nested_archives(archive, files,
+                                                            prefix)
+        self._files = files
+        self.archive = archive
+        # a prefix directory following the ZIP file path.
+        self.prefix = _bootstrap_external._path_join(*prefix)
+        if self.prefix:
+            self.prefix += path_sep
+
+    # Find the archive on the file system that path is, or is in.  Return its
+    # _TableOfContents, its path and the names in path following it.
+    def _find_archive(self, path):
         prefix = []
         while True:
             try:
@@ -94,17 +131,10 @@ class zipimporter:
                     raise ZipImportError('not a Zip file', path=path)
                 break
 
-        try:
-            files = _zip_directory_cache[path]
-        except KeyError:
-            files = _read_directory(path)
-            _zip_directory_cache[path] = files
-        self._files = files
-        self.archive = path
-        # a prefix directory following the ZIP file path.
-        self.prefix = _bootstrap_external._path_join(*prefix[::-1])
-        if self.prefix:
-            self.prefix += path_sep
+        files = _zip_directory_cache.get(path)
+        if files is None or files._stat != _stat_key(st):
+            files = _refresh_directory(path, st)
+        return files, path, prefix[::-1]
 
 
     # Check whether we can satisfy the import of the module named by
@@ -127,6 +157,11 @@ class zipimporter:
             # This is a module or package.
             return self, []
 
+        toc_entry = _get_extension_entry(self, fullname)
+        if toc_entry is not None:
+            # This is an extension module, which has its own loader.
+            return _ZipExtensionLoader(self.archive, fullname, toc_entry), []
+
         # Not a module or regular package. See if this is a directory, and
         # therefore possibly a portion of a namespace package.
 
@@ -172,18 +207,67 @@ class zipimporter:
         Return the data associated with 'pathname'. Raise OSError if
         the file wasn't found.
         """
-        if alt_path_sep:
-            pathname = pathname.replace(alt_path_sep, path_sep)
+        return _get_data(self.archive, _get_toc_entry(self, pathname))
 
-        key = pathname
-        if pathname.startswith(self.archive + path_sep):
-            key = pathname[len(self.archive + path_sep):]
 
-        try:
-            toc_entry = self._files[key]
-        except KeyError:
-            raise OSError(0, '', key)
-        return _get_data(self.archive, toc_entry)
+    def get_buffer(self, pathname):
+        """get_buffer(pathname) -> read-only memoryview of file data.
+
+        Return the data associated with 'pathname', like get_data(). For
+        members that are stored uncompressed, this is a view of the archive
+        mapped into memory, so the data isn't copied. Raise OSError if the
+        file wasn't found.
+        """
+        return _get_buffer(self.archive, _get_toc_entry(self, pathname))
+
+
+    def open(self, pathname):
+        """open(pathname) -> binary file object.
+
+        Return a read-only, seekable file object for the data associated
+        with 'pathname', which is decompressed as it is read rather than all
+        at once. Raise OSError if the file wasn't found.
+        """
+        return _open_member(self.archive, _get_toc_entry(self, pathname))
+
+
+    def get_many(self, pathnames, workers=None):
+        """get_many(pathnames, workers=None) -> dict of file data.
+
+        Return a dict mapping each of 'pathnames' to its data, as get_data()
+        would. The members are read in the order they are stored in the
+        archive, with members close to each other read together, so a batch
+        takes a few large reads rather than two small ones per member. If
+        'workers' is more than 1, members are decompressed in that many
+        threads. Raise OSError if any of the files wasn't found.
+        """
+        items = [(pathname, _get_toc_entry(self, pathname))
+                 for pathname in pathnames]
+        return _get_many(self.archive, items, workers)
+
+
+    async def get_data_async(self, pathname, executor=None):
+        """get_data_async(pathname, executor=None) -> bytes with file data.
+
+        Coroutine version of get_data(). The data is read and decompressed
+        in 'executor', by default a small thread pool of zipimport64's own,
+        so the event loop isn't blocked. Large members are read a chunk at a
+        time, and cancelling the awaiting task stops after the current chunk.
+        """
+        return await _get_data_async(self.archive,
+                                     _get_toc_entry(self, pathname), executor)
+
+
+    def open_async(self, pathname, executor=None):
+        """open_async(pathname, executor=None) -> asynchronous file object.
+
+        Like open(), but the file object's read(), seek(), tell() and close()
+        are coroutines, run in 'executor' as for get_data_async(), and it can be
+        used with 'async with' and 'async for' (which yields chunks of data).
+        Raise OSError if the file wasn't found.
+        """
+        return _AsyncMemberStream(self.archive, _get_toc_entry(self, pathname),
+                                  executor)
 
 
     # Return a string matching __file__ for the named module
@@ -262,7 +346,17 @@ class zipimporter:
             if not hasattr(mod, '__builtins__'):
                 mod.__builtins__ = __builtins__
             _bootstrap_external._fix_up_module(mod.__dict__, fullname, modpath)
-            exec(code, mod.__dict__)
+            stats = _stats
+            if stats is None:
+                exec(code, mod.__dict__)
+            else:
+                start = _perf_counter_ns()
+                try:
+                    exec(code, mod.__dict__)
+                finally:
+                    # This includes the time taken by any imports it does.
+                    stats.add(self.archive, 'execs', 1,
+                              'exec_ns', _perf_counter_ns() - start)
         except:
             del sys.modules[fullname]
             raise
@@ -275,6 +369,18 @@ class zipimporter:
         return mod
 
 
+    def invalidate_caches(self):
+        """invalidate_caches() -> None.
+
+        Reread the directory of the archive if it has changed since it was
+        last read. If it was only appended to, only the new entries are read.
+        """
+        try:
+            self._files = _refresh_directory(self.archive)
+        except ZipImportError:
+            self._files = _TableOfContents(self.archive)
+
+
     def get_resource_reader(self, fullname):
         """Return the ResourceReader for a package in a zip file.
 
@@ -289,6 +395,13 @@ class zipimporter:
         if not _ZipImportResourceReader._registered:
             from importlib.abc import ResourceReader
             ResourceReader.register(_ZipImportResourceReader)
+            try:
+                from importlib.resources.abc import Traversable
+            except ImportError:
+                from importlib.abc import Traversable
+            Traversable.register(_ZipTraversable)
+            from importlib.resources import as_file
+            as_file.register(_ZipTraversable, _as_file)
             _ZipImportResourceReader._registered = True
         return _ZipImportResourceReader(self, fullname)
 
@@ -309,6 +422,21 @@ _zip_searchorder = (
     ('.py', False, False),
 )
 
+# Given a path to a member, either relative to the archive or including it,
+# return its toc_entry.  Raise OSError if it isn't found.
+def _get_toc_entry(self, pathname):
+    if alt_path_sep:
+        pathname = pathname.replace(alt_path_sep, path_sep)
+
+    key = pathname
+    if pathname.startswith(self.archive + path_sep):
+        key = pathname[len(self.archive + path_sep):]
+
+    try:
+        return self._files[key]
+    except KeyError:
+        raise OSError(0, '', key)
+
 # Given a module name, return the potential file path in the
 # archive (without extension).
 def _get_module_path(self, fullname):
@@ -317,11 +445,10 @@ def _get_module_path(self, fullname):
 # Does this path represent a directory?
 def _is_dir(self, path):
     # See if this is a "directory". If so, it's eligible to be part
-    # of a namespace package. We test by seeing if the name, with an
-    # appended path separator, exists.
-    dirpath = path + path_sep
-    # If dirpath is present in self._files, we have a directory.
-    return dirpath in self._files
+    # of a namespace package. Archives don't always have entries for
+    # their directories, so look in the directory tree, which has them
+    # all.
+    return self._files._list_dir(path + path_sep) is not None
 
 # Return some information about a module.
 def _get_module_info(self, fullname):
@@ -332,12 +459,409 @@ def _get_module_info(self, fullname):
             return ispackage
     return None
 
+# Return the toc_entry of an extension module for fullname, or None if there
+# isn't one, or extension modules can't be loaded from archives here.
+def _get_extension_entry(self, fullname):
+    if _memfd_create is None and _extraction_cache_dir is None:
+        return None
+    name = self._files._find_extension(_get_module_path(self, fullname))
+    return None if name is None else self._files[name]
+
 
 # implementation
 
-# _read_directory(archive) -> files dict (new reference)
+# Return the value to use for __file__ for name in archive.
+def _toc_path(archive, name):
+    if name and name[0] != path_sep and name[-1] != path_sep:
+        # Same as _path_join(), without the overhead.
+        return archive + path_sep + name
+    return _bootstrap_external._path_join(archive, name)
+
+
+class _TableOfContents:
+    """Read-only mapping of the names in an archive to toc_entry tuples.
+
+    The fields of the entries are stored column-wise, one machine integer per
+    entry in each column, and the tuples (including the __file__ value) are
+    only built when an entry is looked up. For an archive with many entries
+    this takes a fraction of the memory of a dict of tuples, each with its
+    own copy of the archive path.
+
+    The columns are memoryviews cast over bytearrays rather than arrays, as
+    the array module may not be importable yet.
+    """
+    # (attribute, memoryview format) of each column.
+    _COLUMNS = (
+        ('_compress', 'H'),
+        ('_data_size', 'Q'),
+        ('_file_size', 'Q'),
+        ('_file_offset', 'Q'),
+        ('_dostime', 'I'),  # date << 16 | time
+        ('_crc', 'I'),
+    )
+
+    def __init__(self, archive, capacity=0):
+        self.archive = archive
+        self._index = {}  # name -> row; a _FlatIndex once shared
+        self._rows = 0
+        for attr, fmt in self._COLUMNS:
+            setattr(self, attr, _new_column(fmt, capacity))
+        # Set by _read_directory() to (st_size, st_mtime_ns, st_ino) of the
+        # archive, to tell whether it has changed since.
+        self._stat = None
+        # Set by _read_central_directory() to (central_directory_position,
+        # central_directory_size, arc_offset, hash of the central directory),
+        # to tell whether the archive has only been appended to since.
+        self._directory = None
+        # Built by _list_dir() when first needed, see _build_tree().
+        self._tree = None
+        # Built by _find_extension() when first needed.
+        self._extensions = None
+
+    def _resize(self, capacity):
+        for attr, fmt in self._COLUMNS:
+            old = getattr(self, attr)
+            new = _new_column(fmt, capacity)
+            rows = min(self._rows, capacity)
+            new[:rows] = old[:rows]
+            setattr(self, attr, new)
+
+    # Add an entry; a later entry with the same name replaces the earlier one.
+    def _add(self, name, compress, data_size, file_size, file_offset, time,
+             date, crc):
+        row = self._rows
+        if row == len(self._compress):
+            self._resize(max(2 * row, 16))
+        self._compress[row] = compress
+        self._data_size[row] = data_size
+        self._file_size[row] = file_size
+        self._file_offset[row] = file_offset
+        self._dostime[row] = date << 16 | time
+        self._crc[row] = crc
+        self._index[name] = row
+        self._rows = row + 1
+
+    # Add all the entries of other, which must be done before adding any
+    # others.
+    def _extend(self, other):
+        if len(self._compress) < other._rows:
+            self._resize(other._rows)
+        for attr, fmt in self._COLUMNS:
+            getattr(self, attr)[:other._rows] = getattr(other, attr)[:other._rows]
+        self._index.update(other._index)
+        self._rows = other._rows
+
+    # Drop any unused capacity once all entries have been added.
+    def _finish(self):
+        if self._rows != len(self._compress):
+            self._resize(self._rows)
+        return self
+
+    # Return the columns in a form that marshal can store, see _from_state().
+    def _get_state(self):
+        index = self._index
+        if not isinstance(index, dict):
+            index = dict(index.items())
+        return (index, self._directory) + tuple(
+            getattr(self, attr).tobytes() for attr, fmt in self._COLUMNS)
+
+    @classmethod
+    def _from_state(cls, archive, state):
+        self = cls(archive)
+        index, directory, *columns = state
+        if not isinstance(index, dict) or len(columns) != len(cls._COLUMNS):
+            raise ValueError('bad table of contents state')
+        self._index = index
+        self._directory = directory
+        for (attr, fmt), data in zip(cls._COLUMNS, columns):
+            setattr(self, attr, memoryview(bytearray(data)).cast(fmt))
+        self._rows = len(self._compress)
+        for attr, fmt in cls._COLUMNS:
+            if len(getattr(self, attr)) != self._rows:
+                raise ValueError('bad table of contents state')
+        return self
+
+    # Return a dict mapping the names in the directory dirpath ('' for the
+    # top of the archive, otherwise ending with path_sep) to whether each
+    # is a directory, or None if there's no such directory.  Directories
+    # without an entry of their own, only implied by the names in them,
+    # are included.
+    def _list_dir(self, dirpath):
+        tree = self._tree
+        if tree is None:
+            tree = self._tree = self._build_tree()
+        return tree.get(dirpath)
+
+    # Return the name of the extension module file for the module path (a
+    # module's path without a suffix), or None if there isn't one.  All the
+    # extension modules are found with a single pass over the names.
+    def _find_extension(self, path):
+        extensions = self._extensions
+        if extensions is None:
+            extensions = self._extensions = {}
+            suffixes = _imp.extension_suffixes()
+            any_suffix = tuple(suffixes)
+            for name in self._index:
+                if not name.endswith(any_suffix):
+                    continue
+                # The first suffix in extension_suffixes() wins, like in
+                # the order they are tried in.
+                for i, suffix in enumerate(suffixes):
+                    if name.endswith(suffix):
+                        base = name[:-len(suffix)]
+                        found = extensions.get(base)
+                        if found is None or i < found[0]:
+                            extensions[base] = i, name
+        found = extensions.get(path)
+        return None if found is None else found[1]
+
+    # Return a dict mapping each directory path (as in _list_dir()) to the
+    # dict of its contents.  Each name is visited once, and its parent
+    # directories only until one that is already known.
+    def _build_tree(self):
+        tree = {'': {}}
+        for name in self._index:
+            is_dir = name.endswith(path_sep)
+            if is_dir:
+                name = name[:-1]
+                tree.setdefault(name + path_sep, {})
+            while name:
+                parent, sep, base = name.rpartition(path_sep)
+                dirpath = parent + sep
+                siblings = tree.get(dirpath)
+                known = siblings is not None
+                if not known:
+                    siblings = tree[dirpath] = {}
+                # A directory wins over a file of the same name.
+                siblings[base] = is_dir or siblings.get(base, False)
+                if known:
+                    break
+                name = parent
+                is_dir = True
+        return tree
+
+    def _entry(self, name, row):
+        dostime = self._dostime[row]
+        return (_toc_path(self.archive, name), self._compress[row],
+                self._data_size[row], self._file_size[row],
+                self._file_offset[row], dostime & 0xffff, dostime >> 16,
+                self._crc[row])
+
+    def __getitem__(self, name):
+        return self._entry(name, self._index[name])
+
+    def get(self, name, default=None):
+        try:
+            row = self._index[name]
+        except KeyError:
+            return default
+        return self._entry(name, row)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def keys(self):
+        return self._index.keys()
+
+    def values(self):
+        for name, row in self._index.items():
+            yield self._entry(name, row)
+
+    def items(self):
+        for name, row in self._index.items():
+            yield name, self._entry(name, row)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} for {self.archive!r}, {len(self)} entries>'
+
+# Return a zero-filled column of capacity unsigned integers of the given
+# memoryview format.
+def _new_column(fmt, capacity):
+    return memoryview(bytearray(capacity * _COLUMN_ITEMSIZE[fmt])).cast(fmt)
+
+_COLUMN_ITEMSIZE = {'H': 2, 'I': 4, 'Q': 8, 'q': 8}
+
+
+# Whether to move the directories of archives into shared memory as they're
+# read; see enable_shared_index().
+_shared_index = False
+
+def enable_shared_index():
+    """enable_shared_index() -> None.
+
+    Keep the directories of archives in shared memory, in a flat layout that
+    is looked up in place, rather than in dicts of names. Processes forked
+    afterwards then share a single copy, instead of each ending up with its
+    own as reference counts are updated. Directories already read are moved
+    there too, so this can be called just before forking workers. The
+    ZIPIMPORT64_SHARED_INDEX environment variable has the same effect at
+    import time.
+    """
+    global _shared_index
+    _shared_index = True
+    for files in list(_zip_directory_cache.values()):
+        _share_table_of_contents(files)
+
+
+def disable_shared_index():
+    """disable_shared_index() -> None.
+
+    Keep the directories of archives read from now on in dicts again.
+    """
+    global _shared_index
+    _shared_index = False
+
+
+class _FlatIndex:
+    """Read-only mapping of names to rows of a _TableOfContents, laid out in
+    a buffer rather than as objects.
+
+    Names are looked up with an open addressing hash table of (hash of the
+    name, position) slots, comparing the UTF-8 encoded names in place.  The
+    stored hashes are those of hash(), so the layout is only valid in the
+    process that made it and its forked children.
+    """
+
+    def __init__(self, hashes, slots, rows, offsets, names):
+        self._hashes = hashes  # hash of the name in each slot
+        self._slots = slots  # position + 1 of the name in each slot, or 0
+        self._rows = rows  # row of each name
+        self._offsets = offsets  # offset of each name in names, and the end
+        self._names = names
+        self._mask = len(slots) - 1
+
+    # Return the position of name, or -1 if it's not there.
+    def _find(self, name):
+        if not isinstance(name, str):
+            return -1
+        h = hash(name)
+        i = h & self._mask
+        key = None
+        while True:
+            pos = self._slots[i]
+            if not pos:
+                return -1
+            if self._hashes[i] == h:
+                if key is None:
+                    key = name.encode('utf-8', 'surrogatepass')
+                pos -= 1
+                if self._names[self._offsets[pos]:self._offsets[pos + 1]] == key:
+                    return pos
+            i = (i + 1) & self._mask
+
+    def _name(self, pos):
+        name = self._names[self._offsets[pos]:self._offsets[pos + 1]]
+        return str(name, 'utf-8', 'surrogatepass')
+
+    def __getitem__(self, name):
+        pos = self._find(name)
+        if pos < 0:
+            raise KeyError(name)
+        return self._rows[pos]
+
+    def get(self, name, default=None):
+        pos = self._find(name)
+        return default if pos < 0 else self._rows[pos]
+
+    def __contains__(self, name):
+        return self._find(name) >= 0
+
+    def __iter__(self):
+        for pos in range(len(self._rows)):
+            yield self._name(pos)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        for pos in range(len(self._rows)):
+            yield self._name(pos), self._rows[pos]
+
+# Move the columns and index of files into a shared, anonymous memory
+# mapping, laid out as:
+#
+#   the columns of _TableOfContents
+#   the hash table of _FlatIndex: 'q' hashes, then 'I' slots
+#   'I' row of each name
+#   'Q' offset of each name, and of the end of the last
+#   the UTF-8 encoded names
+#
+# each part starting on a multiple of 8 bytes.  Return whether it was moved.
+def _share_table_of_contents(files):
+    if isinstance(files._index, _FlatIndex):
+        return True
+    mmap = _get_mmap_module()
+    if mmap is None:
+        return False
+    index = files._index
+    names = [name.encode('utf-8', 'surrogatepass') for name in index]
+    slot_count = 8
+    while slot_count < 2 * len(names):
+        slot_count *= 2
+    parts = [(attr, fmt, files._rows) for attr, fmt in files._COLUMNS]
+    parts += [('hashes', 'q', slot_count), ('slots', 'I', slot_count),
+              ('rows', 'I', len(names)), ('offsets', 'Q', len(names) + 1)]
+    size = 0
+    layout = []
+    for attr, fmt, length in parts:
+        layout.append((attr, fmt, size, length))
+        size += (length * _COLUMN_ITEMSIZE[fmt] + 7) & ~7
+    names_offset = size
+    size += sum(map(len, names))
+    try:
+        mm = mmap.mmap(-1, max(size, 1))
+    except (OSError, ValueError):
+        return False
+    buffer = memoryview(mm)
+    views = {}
+    for attr, fmt, offset, length in layout:
+        end = offset + length * _COLUMN_ITEMSIZE[fmt]
+        views[attr] = buffer[offset:end].cast(fmt)
+    for attr, fmt in files._COLUMNS:
+        views[attr][:] = getattr(files, attr)[:files._rows]
+
+    hashes, slots, rows, offsets = (views['hashes'], views['slots'],
+                                    views['rows'], views['offsets'])
+    mask = slot_count - 1
+    offset = 0
+    for pos, (name, row) in enumerate(index.items()):
+        rows[pos] = row
+        offsets[pos] = offset
+        key = names[pos]
+        buffer[names_offset + offset:names_offset + offset + len(key)] = key
+        offset += len(key)
+        h = hash(name)
+        i = h & mask
+        while slots[i]:
+            i = (i + 1) & mask
+        hashes[i] = h
+        slots[i] = pos + 1
+    offsets[len(names)] = offset
+
+    buffer = buffer.toreadonly()
+    views = {attr: buffer[offset:offset + length * _COLUMN_ITEMSIZE[fmt]].cast(fmt)
+             for attr, fmt, offset, length in layout}
+    # The columns are the same, so readers in other threads can go on using
+    # the old ones until the index is replaced.
+    for attr, fmt in files._COLUMNS:
+        setattr(files, attr, views[attr])
+    files._index = _FlatIndex(views['hashes'], views['slots'], views['rows'],
+                              views['offsets'], buffer[names_offset:])
+    return True
+
+
+# _read_directory(archive) -> files mapping (new reference)
 #
-# Given a path to a Zip archive, build a dict, mapping file names
+# Given a path to a Zip archive, build a _TableOfContents, mapping file names
 # (local to the archive, using SEP as a separator) to toc entries.
 #
 # A toc_entry is a tuple:
@@ -355,207 +879,608 @@ def _get_module_info(self, fullname):
 #
 # Directories can be recognized by the trailing path_sep in the name,
 # data_size and file_offset are 0.
-def _read_directory(archive):
+#
+# If previous is the _TableOfContents from an earlier version of the archive,
+# and the archive has only been appended to since, only the new entries are
+# parsed.
+def _read_directory(archive, previous=None):
+    stats = _stats
+    if stats is not None:
+        start = _perf_counter_ns()
+    source = _sources.get(archive)
     try:
-        fp = _io.open_code(archive)
+        if source is None:
+            fp = _io.open_code(archive)
+        else:
+            fp = _SourceFile(source)
     except OSError:
         raise ZipImportError(f"can't open Zip file: {archive!r}", path=archive)
 
     with fp:
-        # Check if there's a comment.
         try:
-            fp.seek(0, 2)
-            file_size = fp.tell()
+            if source is None:
+                stat_key = _stat_key(_os.fstat(fp.fileno()))
+            elif isinstance(source, _WindowSource):
+                # Nested archives change with the archive they're in.
+                stat_key = fp._size, source.offset, *source.files._stat
+            else:
+                # Sources don't change while registered; only the size is
+                # known.
+                stat_key = fp._size, 0, 0
         except OSError:
-            raise ZipImportError(f"can't read Zip file: {archive!r}",
-                                 path=archive)
+            raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
+        (header_position, central_directory_size, central_directory_position,
+         arc_offset, num_entries, eocd) = _read_end_of_central_directory(fp, archive)
+
+        files = index_path = None
+        if _index_cache_dir is not None:
+            index_path, index_header = _index_cache_key(archive, stat_key, eocd)
+            files = _load_index(index_path, index_header)
+            if files is not None:
+                _bootstrap._verbose_message('zipimport: loaded index for {!r} from {!r}',
+                                            archive, index_path)
+
+        if files is None:
+            files = _read_central_directory(fp, archive, header_position,
+                                            central_directory_size,
+                                            central_directory_position,
+                                            arc_offset, num_entries, previous)
+            if index_path is not None:
+                _store_index(index_path, index_header, files)
+        elif stats is not None:
+            stats.add(archive, 'index_cache_hits')
+    files._stat = stat_key
+    if _shared_index:
+        _share_table_of_contents(files)
+    if stats is not None:
+        stats.add(archive, 'directory_reads', 1,
+                  'directory_read_ns', _perf_counter_ns() - start)
+    return files
+
+def _stat_key(st):
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+# Return the current _TableOfContents for archive, rereading its directory
+# if the archive has changed (or wasn't read yet).  st is the result of
+# stat() on the archive, if known.
+def _refresh_directory(archive, st=None):
+    files = _zip_directory_cache.get(archive)
+    source = _sources.get(archive)
+    if source is not None:
+        if isinstance(source, _WindowSource):
+            _refresh_window_source(archive, source)
+            files = _zip_directory_cache.get(archive)
+        if files is not None:
+            return files
+    else:
+        try:
+            if st is None:
+                st = _bootstrap_external._path_stat(archive)
+        except OSError:
+            pass
+        else:
+            if files is not None and files._stat == _stat_key(st):
+                return files
+    # Any reader still has the old version of the archive open.  Other
+    # threads may be reading from it, so it's left to close itself when the
+    # last of them is done with it.
+    _zip_reader_cache.pop(archive, None)
+    if files is not None:
+        _bootstrap._verbose_message('zipimport: {!r} has changed', archive)
+    try:
+        files = _read_directory(archive, previous=files)
+    except ZipImportError:
+        _zip_directory_cache.pop(archive, None)
+        raise
+    _zip_directory_cache[archive] = files
+    return files
+
+# Find the end of central directory record(s) of archive, open as fp.
+# Return the position of the start of the central directory in fp, its size,
+# its position as recorded in the archive, the number of bytes prepended to
+# the archive (arc_offset), the number of entries, and the bytes of the EOCD
+# record(s) and what follows them to the end of the file.
+#
+# Usually there's no comment, so the EOCD (with the Zip64 EOCD and locator
+# right before it, if there are any) is read first, and the whole stretch a
+# comment could cover only if it's not there.
+def _read_end_of_central_directory(fp, archive):
+    try:
+        fp.seek(0, 2)
+        file_size = fp.tell()
+    except OSError:
+        raise ZipImportError(f"can't read Zip file: {archive!r}",
+                             path=archive)
+    tail_size = min(file_size, END_CENTRAL_DIR_SIZE +
+                    END_CENTRAL_DIR_LOCATOR_SIZE_64 + END_CENTRAL_DIR_SIZE_64)
+    data = _read_at(fp, archive, file_size - tail_size, tail_size)
+    pos = len(data) - END_CENTRAL_DIR_SIZE
+    if (pos < 0 or data[pos:pos + 4] != STRING_END_ARCHIVE or
+            data[pos + 20:pos + 22] != b'\x00\x00'):
+        # Check if there's a comment.
         max_comment_start = max(file_size - MAX_COMMENT_LEN -
                                 END_CENTRAL_DIR_SIZE - END_CENTRAL_DIR_SIZE_64 -
                                 END_CENTRAL_DIR_LOCATOR_SIZE_64, 0)
-        try:
-            fp.seek(max_comment_start)
-            data = fp.read()
-        except OSError:
-            raise ZipImportError(f"can't read Zip file: {archive!r}",
-                                 path=archive)
+        data = _read_at(fp, archive, max_comment_start,
+                        file_size - max_comment_start)
         pos = data.rfind(STRING_END_ARCHIVE)
-        pos64 = data.rfind(STRING_END_ZIP_64)
-
-        if (pos64 >= 0 and pos64+END_CENTRAL_DIR_SIZE_64+END_CENTRAL_DIR_LOCATOR_SIZE_64==pos):
-            # Zip64 at "correct" offset from standard EOCD
-            buffer = data[pos64:pos64 + END_CENTRAL_DIR_SIZE_64]
-            if len(buffer) != END_CENTRAL_DIR_SIZE_64:
-                raise ZipImportError(f"corrupt Zip64 file: {archive!r}",
-                                     path=archive)
-            header_position = file_size - len(data) + pos64
-
-            central_directory_size = int.from_bytes(buffer[40:48], 'little')
-            central_directory_position = int.from_bytes(buffer[48:56], 'little')
-            num_entries = int.from_bytes(buffer[24:32], 'little')
-        elif pos >= 0:
-            buffer = data[pos:pos+END_CENTRAL_DIR_SIZE]
-            if len(buffer) != END_CENTRAL_DIR_SIZE:
-                raise ZipImportError(f"corrupt Zip file: {archive!r}",
-                                     path=archive)
-
-            header_position = file_size - len(data) + pos
-
-            # Buffer now contains a valid EOCD, and header_position gives the
-            # starting position of it.
-            central_directory_size = _unpack_uint32(buffer[12:16])
-            central_directory_position = _unpack_uint32(buffer[16:20])
-            num_entries = _unpack_uint16(buffer[8:10])
-
-            # N.b. if someday you want to prefer the standard (non-zip64) EOCD,
-            # you need to adjust position by 76 for arc to be 0.
-        else:
+        if pos < 0:
             raise ZipImportError(f'not a Zip file: {archive!r}',
                                  path=archive)
+    data_start = file_size - len(data)
+
+    buffer = None
+    pos64 = pos - END_CENTRAL_DIR_LOCATOR_SIZE_64 - END_CENTRAL_DIR_SIZE_64
+    locator_pos = pos - END_CENTRAL_DIR_LOCATOR_SIZE_64
+    if pos64 >= 0 and data[pos64:pos64 + 4] == STRING_END_ZIP_64:
+        # Zip64 at "correct" offset from standard EOCD
+        buffer = data[pos64:pos64 + END_CENTRAL_DIR_SIZE_64]
+        header_position = data_start + pos64
+        eocd = data[pos64:]
+    elif (locator_pos >= 0 and
+          data[locator_pos:locator_pos + 4] == STRING_END_LOCATOR_64):
+        # There's data between the Zip64 EOCD and its locator, so go by the
+        # locator's offset of the Zip64 EOCD.  Prepended data would move it,
+        # with nothing to say by how much, so this only finds it in archives
+        # without any.
+        position = int.from_bytes(data[locator_pos + 8:locator_pos + 16],
+                                  'little')
+        if position + END_CENTRAL_DIR_SIZE_64 <= data_start + locator_pos:
+            record = _read_at(fp, archive, position, END_CENTRAL_DIR_SIZE_64)
+            if record[:4] == STRING_END_ZIP_64:
+                buffer = record
+                header_position = position
+                eocd = record + data[locator_pos:]
+
+    if buffer is not None:
+        central_directory_size = int.from_bytes(buffer[40:48], 'little')
+        central_directory_position = int.from_bytes(buffer[48:56], 'little')
+        num_entries = int.from_bytes(buffer[24:32], 'little')
+    else:
+        buffer = data[pos:pos+END_CENTRAL_DIR_SIZE]
+        if len(buffer) != END_CENTRAL_DIR_SIZE:
+            raise ZipImportError(f"corrupt Zip file: {archive!r}",
+                                 path=archive)
+
+        header_position = data_start + pos
+        eocd = data[pos:]
 
         # Buffer now contains a valid EOCD, and header_position gives the
         # starting position of it.
-        # XXX: These are cursory checks but are not as exact or strict as they
-        # could be.  Checking the arc-adjusted value is probably good too.
-        if header_position < central_directory_size:
-            raise ZipImportError(f'bad central directory size: {archive!r}', path=archive)
-        if header_position < central_directory_position:
-            raise ZipImportError(f'bad central directory offset: {archive!r}', path=archive)
-        header_position -= central_directory_size
-        # On just-a-zipfile these values are the same and arc_offset is zero; if
-        # the file has some bytes prepended, `arc_offset` is the number of such
-        # bytes.  This is used for pex as well as self-extracting .exe.
-        arc_offset = header_position - central_directory_position
-        if arc_offset < 0:
-            raise ZipImportError(f'bad central directory size or offset: {archive!r}', path=archive)
-
-        files = {}
-        # Start of Central Directory
-        count = 0
-        try:
-            fp.seek(header_position)
+        central_directory_size = _unpack_uint32(buffer[12:16])
+        central_directory_position = _unpack_uint32(buffer[16:20])
+        num_entries = _unpack_uint16(buffer[8:10])
+
+        # N.b. if someday you want to prefer the standard (non-zip64) EOCD,
+        # you need to adjust position by 76 for arc to be 0.
+
+    # Buffer now contains a valid EOCD, and header_position gives the
+    # starting position of it.
+    # XXX: These are cursory checks but are not as exact or strict as they
+    # could be.  Checking the arc-adjusted value is probably good too.
+    if header_position < central_directory_size:
+        raise ZipImportError(f'bad central directory size: {archive!r}', path=archive)
+    if header_position < central_directory_position:
+        raise ZipImportError(f'bad central directory offset: {archive!r}', path=archive)
+    header_position -= central_directory_size
+    # On just-a-zipfile these values are the same and arc_offset is zero; if
+    # the file has some bytes prepended, `arc_offset` is the number of such
+    # bytes.  This is used for pex as well as self-extracting .exe.
+    arc_offset = header_position - central_directory_position
+    if arc_offset < 0:
+        raise ZipImportError(f'bad central directory size or offset: {archive!r}', path=archive)
+
+    return (header_position, central_directory_size, central_directory_position,
+            arc_offset, num_entries, eocd)
+
+# Return size bytes from position in the open file fp.
+def _read_at(fp, archive, position, size):
+    try:
+        fp.seek(position)
+        return fp.read(size)
+    except OSError:
+        raise ZipImportError(f"can't read Zip file: {archive!r}",
+                             path=archive)
+
+_importing_struct = False
+
+# Walk the central directory of archive, which is the central_directory_size
+# bytes at header_position in the open file fp, building the _TableOfContents
+# described above.
+#
+# The whole directory is read with a single call, and the fixed-size part of
+# each header is decoded with a single struct call, rather than reading and
+# decoding each field of each entry separately.
+def _read_central_directory(fp, archive, header_position, central_directory_size,
+                            central_directory_position, arc_offset, num_entries,
+                            previous=None):
+    global _importing_struct
+    Struct = None
+    if not _importing_struct:
+        # Like the codecs in _get_codec(), importing _struct might need
+        # the archive we're in the middle of opening.
+        _importing_struct = True
+        try:
+            from _struct import Struct
+        except ImportError:
+            # _struct is not built in on every platform.
+            pass
+        finally:
+            _importing_struct = False
+    if Struct is None:
+        return _read_central_directory_by_entry(
+            fp, archive, header_position, central_directory_position,
+            arc_offset, num_entries)
+    unpack_header = Struct(CENTRAL_DIR_HEADER_FORMAT).unpack_from
+
+    try:
+        fp.seek(header_position)
+        data = fp.read(central_directory_size)
+    except OSError:
+        raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
+    if len(data) != central_directory_size:
+        raise EOFError('EOF read where not expected')
+
+    # num_entries comes from the archive, so it's only trusted as far as
+    # the central directory has room for that many entries.
+    files = _TableOfContents(archive, min(num_entries,
+                                          len(data) // CENTRAL_DIR_HEADER_SIZE))
+    count = 0
+    pos = 0
+    if previous is not None and previous._directory is not None:
+        # When an archive is appended to, new entries are added after the
+        # old ones in the central directory, which moves to the end, and
+        # the old ones are left as they were.
+        old_position, old_size, old_arc_offset, old_hash = previous._directory
+        if (old_arc_offset == arc_offset and
+                old_position <= central_directory_position and
+                old_size <= central_directory_size and
+                _hash_central_directory(data, old_size) == old_hash):
+            files._extend(previous)
+            count = previous._rows
+            pos = old_size
+            _bootstrap._verbose_message(
+                'zipimport: reusing {} entries for {!r}', count, archive)
+    end = len(data) - CENTRAL_DIR_HEADER_SIZE
+    while pos <= end:
+        (signature, _, _, flags, compress, time, date, crc, data_size,
+         file_size, name_size, extra_size, comment_size, _, _, _,
+         file_offset) = unpack_header(data, pos)
+        if signature != STRING_CENTRAL_DIR:
+            break
+        name_start = pos + CENTRAL_DIR_HEADER_SIZE
+        extra_start = name_start + name_size
+        pos = extra_start + extra_size + comment_size
+        if pos > len(data):
+            raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
+
+        name = data[name_start:extra_start]
+        if name.isascii():
+            # By far the most common case, and the same in every encoding
+            # we support.
+            name = name.decode('ascii')
+        elif flags & 0x800:
+            # UTF-8 file names extension
+            name = name.decode()
+        else:
+            # Historical ZIP filename encoding
+            name = name.decode('latin1').translate(cp437_table)
+
+        if path_sep != '/':
+            name = name.replace('/', path_sep)
+
+        if (
+            file_size == MAX_UINT32 or
+            data_size == MAX_UINT32 or
+            file_offset == MAX_UINT32
+        ):
+            file_size, data_size, file_offset = _read_zip64_extra(
+                archive, _toc_path(archive, name),
+                data[extra_start:extra_start + extra_size],
+                file_size, data_size, file_offset)
+        # See the matching check in _read_central_directory_by_entry().
+        if file_offset > central_directory_position:
+            raise ZipImportError(f'bad local header offset: {archive!r}', path=archive)
+        file_offset += arc_offset
+
+        files._add(name, compress, data_size, file_size, file_offset,
+                   time, date, crc)
+        count += 1
+
+    if count != num_entries:
+        raise ZipImportError(
+            f"mismatched num_entries: {count} should be {num_entries} in {archive!r}",
+            path=archive,
+        )
+    _bootstrap._verbose_message('zipimport: found {} names in {!r}', count, archive)
+    files._directory = (central_directory_position, central_directory_size,
+                        arc_offset, _hash_central_directory(data, pos))
+    return files._finish()
+
+def _hash_central_directory(data, size):
+    return _imp.source_hash(_bootstrap_external._RAW_MAGIC_NUMBER,
+                            memoryview(data)[:size])
+
+# The original version of _read_central_directory(), which reads and decodes
+# one entry at a time from fp.
+def _read_central_directory_by_entry(fp, archive, header_position,
+                                     central_directory_position, arc_offset,
+                                     num_entries):
+    # Grown as entries are read, since num_entries can't be trusted.
+    files = _TableOfContents(archive)
+    # Start of Central Directory
+    count = 0
+    try:
+        fp.seek(header_position)
+    except OSError:
+        raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
+    while True:
+        buffer = fp.read(46)
+        if len(buffer) < 4:
+            raise EOFError('EOF read where not expected')
+        # Start of file header
+        if buffer[:4] != b'PK\x01\x02':
+            if count != num_entries:
+                raise ZipImportError(
+                    f"mismatched num_entries: {count} should be {num_entries} in {archive!r}",
+                    path=archive,
+                )
+            break                                # Bad: Central Dir File Header
+        if len(buffer) != 46:
+            raise EOFError('EOF read where not expected')
+        flags = _unpack_uint16(buffer[8:10])
+        compress = _unpack_uint16(buffer[10:12])
+        time = _unpack_uint16(buffer[12:14])
+        date = _unpack_uint16(buffer[14:16])
+        crc = _unpack_uint32(buffer[16:20])
+        data_size = _unpack_uint32(buffer[20:24])
+        file_size = _unpack_uint32(buffer[24:28])
+        name_size = _unpack_uint16(buffer[28:30])
+        extra_size = _unpack_uint16(buffer[30:32])
+        comment_size = _unpack_uint16(buffer[32:34])
+        file_offset = _unpack_uint32(buffer[42:46])
+        header_size = name_size + extra_size + comment_size
+
+        try:
+            name = fp.read(name_size)
         except OSError:
             raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
-        while True:
-            buffer = fp.read(46)
-            if len(buffer) < 4:
-                raise EOFError('EOF read where not expected')
-            # Start of file header
-            if buffer[:4] != b'PK\x01\x02':
-                if count != num_entries:
-                    raise ZipImportError(
-                        f"mismatched num_entries: {count} should be {num_entries} in {archive!r}",
-                        path=archive,
-                    )
-                break                                # Bad: Central Dir File Header
-            if len(buffer) != 46:
-                raise EOFError('EOF read where not expected')
-            flags = _unpack_uint16(buffer[8:10])
-            compress = _unpack_uint16(buffer[10:12])
-            time = _unpack_uint16(buffer[12:14])
-            date = _unpack_uint16(buffer[14:16])
-            crc = _unpack_uint32(buffer[16:20])
-            data_size = _unpack_uint32(buffer[20:24])
-            file_size = _unpack_uint32(buffer[24:28])
-            name_size = _unpack_uint16(buffer[28:30])
-            extra_size = _unpack_uint16(buffer[30:32])
-            comment_size = _unpack_uint16(buffer[32:34])
-            file_offset = _unpack_uint32(buffer[42:46])
-            header_size = name_size + extra_size + comment_size
+        if len(name) != name_size:
+            raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
+        # On Windows, calling fseek to skip over the fields we don't use is
+        # slower than reading the data because fseek flushes stdio's
+        # internal buffers.    See issue #8745.
+        try:
+            extra_data_len = header_size - name_size
+            extra_data = fp.read(extra_data_len)
 
-            try:
-                name = fp.read(name_size)
-            except OSError:
+            if len(extra_data) != extra_data_len:
                 raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
-            if len(name) != name_size:
-                raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
-            # On Windows, calling fseek to skip over the fields we don't use is
-            # slower than reading the data because fseek flushes stdio's
-            # internal buffers.    See issue #8745.
+        except OSError:
+            raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
+
+        if flags & 0x800:
+            # UTF-8 file names extension
+            name = name.decode()
+        else:
+            # Historical ZIP filename encoding
             try:
-                extra_data_len = header_size - name_size
-                extra_data = fp.read(extra_data_len)
+                name = name.decode('ascii')
+            except UnicodeDecodeError:
+                name = name.decode('latin1').translate(cp437_table)
 
-                if len(extra_data) != extra_data_len:
-                    raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
-            except OSError:
-                raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
+        name = name.replace('/', path_sep)
+        path = _toc_path(archive, name)
 
-            if flags & 0x800:
-                # UTF-8 file names extension
-                name = name.decode()
-            else:
-                # Historical ZIP filename encoding
-                try:
-                    name = name.decode('ascii')
-                except UnicodeDecodeError:
-                    name = name.decode('latin1').translate(cp437_table)
+        # Ordering matches unpacking in _read_zip64_extra().
+        if (
+            file_size == MAX_UINT32 or
+            data_size == MAX_UINT32 or
+            file_offset == MAX_UINT32
+        ):
+            file_size, data_size, file_offset = _read_zip64_extra(
+                archive, path, extra_data[:extra_size],
+                file_size, data_size, file_offset)
+        # XXX These two statements seem swapped because `header_offset` is a
+        # position within the actual file, but `file_offset` (when compared) is
+        # as encoded in the entry, not adjusted for this file.
+        # N.b. this must be after we've potentially read the zip64 extra which can
+        # change `file_offset`.
+        if file_offset > central_directory_position:
+            raise ZipImportError(f'bad local header offset: {archive!r}', path=archive)
+        file_offset += arc_offset
 
-            name = name.replace('/', path_sep)
-            path = _bootstrap_external._path_join(archive, name)
-
-            # Ordering matches unpacking below.
-            if (
-                file_size == MAX_UINT32 or
-                data_size == MAX_UINT32 or
-                file_offset == MAX_UINT32
-            ):
-                # need to decode extra_data looking for a zip64 extra (which might not
-                # be present)
-                while extra_data:
-                    if len(extra_data) < 4:
-                        raise ZipImportError(f"can't read header extra: {archive!r}", path=archive)
-                    tag = _unpack_uint16(extra_data[:2])
-                    size = _unpack_uint16(extra_data[2:4])
-                    if len(extra_data) < 4 + size:
-                        raise ZipImportError(f"can't read header extra: {archive!r}", path=archive)
-                    if tag == ZIP64_EXTRA_TAG:
-                        if (len(extra_data) - 4) % 8 != 0:
-                            raise ZipImportError(f"can't read header extra: {archive!r}", path=archive)
-                        values = [
-                            int.from_bytes(extra_data[i:i+8], 'little')
-                            for i in range(4, len(extra_data), 8)
-                        ]
-
-                        # N.b. Here be dragons: the ordering of these is different than
-                        # the header fields, and it's really easy to get it wrong since
-                        # naturally-occuring zips that use all 3 are >4GB and not
-                        # something that would be checked-in.
-                        # The tests include a binary-edited zip that uses zip64
-                        # (unnecessarily) for all three.
-                        if file_size == MAX_UINT32:
-                            file_size = values.pop(0)
-                        if data_size == MAX_UINT32:
-                            data_size = values.pop(0)
-                        if file_offset == MAX_UINT32:
-                            file_offset = values.pop(0)
-
-                        if values:
-                            raise ZipImportError(f"can't read header extra: {archive!r}", path=archive)
-
-                        break
-
-                    # For a typical zip, this bytes-slicing only happens 2-3 times, on
-                    # small data like timestamps and filesizes.
-                    extra_data = extra_data[4+size:]
-                else:
-                    _bootstrap._verbose_message(
-                        "zipimport: suspected zip64 but no zip64 extra for {!r}",
-                        path,
-                    )
-            # XXX These two statements seem swapped because `header_offset` is a
-            # position within the actual file, but `file_offset` (when compared) is
-            # as encoded in the entry, not adjusted for this file.
-            # N.b. this must be after we've potentially read the zip64 extra which can
-            # change `file_offset`.
-            if file_offset > central_directory_position:
-                raise ZipImportError(f'bad local header offset: {archive!r}', path=archive)
-            file_offset += arc_offset
-
-            t = (path, compress, data_size, file_size, file_offset, time, date, crc)
-            files[name] = t
-            count += 1
+        files._add(name, compress, data_size, file_size, file_offset, time,
+                   date, crc)
+        count += 1
     _bootstrap._verbose_message('zipimport: found {} names in {!r}', count, archive)
-    return files
+    return files._finish()
+
+
+# Given the extra field of a central directory entry for path, where one or
+# more of file_size, data_size and file_offset are MAX_UINT32, return those
+# three values with the real ones from the zip64 extra block (if any)
+# substituted.
+def _read_zip64_extra(archive, path, extra_data, file_size, data_size, file_offset):
+    # need to decode extra_data looking for a zip64 extra (which might not
+    # be present)
+    while extra_data:
+        if len(extra_data) < 4:
+            raise ZipImportError(f"can't read header extra: {archive!r}", path=archive)
+        tag = _unpack_uint16(extra_data[:2])
+        size = _unpack_uint16(extra_data[2:4])
+        if len(extra_data) < 4 + size:
+            raise ZipImportError(f"can't read header extra: {archive!r}", path=archive)
+        if tag == ZIP64_EXTRA_TAG:
+            if size % 8 != 0:
+                raise ZipImportError(f"can't read header extra: {archive!r}", path=archive)
+            values = [
+                int.from_bytes(extra_data[i:i+8], 'little')
+                for i in range(4, 4 + size, 8)
+            ]
+
+            # N.b. Here be dragons: the ordering of these is different than
+            # the header fields, and it's really easy to get it wrong since
+            # naturally-occuring zips that use all 3 are >4GB and not
+            # something that would be checked-in.
+            # The tests include a binary-edited zip that uses zip64
+            # (unnecessarily) for all three.
+            if file_size == MAX_UINT32:
+                file_size = values.pop(0)
+            if data_size == MAX_UINT32:
+                data_size = values.pop(0)
+            if file_offset == MAX_UINT32:
+                file_offset = values.pop(0)
+
+            if values:
+                raise ZipImportError(f"can't read header extra: {archive!r}", path=archive)
+
+            break
+
+        # For a typical zip, this bytes-slicing only happens 2-3 times, on
+        # small data like timestamps and filesizes.
+        extra_data = extra_data[4+size:]
+    else:
+        _bootstrap._verbose_message(
+            "zipimport: suspected zip64 but no zip64 extra for {!r}",
+            path,
+        )
+    return file_size, data_size, file_offset
+
+
+# Persistent index cache
+#
+# Walking the central directory of a large archive dominates the cost of the
+# first zipimporter for it in every new process.  When an index cache
+# directory is configured, _read_directory() marshals the files dict it
+# builds into that directory, and later processes load it from there instead.
+#
+# An index file is named after the absolute path of its archive and is only
+# used while the archive still has the same size, mtime and inode, and the
+# same bytes from the start of its EOCD record to the end of the file.
+# Anything else (including an index written by another Python version) is
+# treated as a miss, and the index is rewritten.
+
+_index_cache_dir = None
+_INDEX_CACHE_VERSION = 3
+_INDEX_SUFFIX = '.idx'
+
+def enable_index_cache(directory):
+    """enable_index_cache(directory) -> None.
+
+    Store the parsed central directory of each archive opened from now on in
+    'directory', and reuse it in later processes while the archive is
+    unchanged. The ZIPIMPORT64_INDEX_CACHE environment variable has the same
+    effect at import time.
+    """
+    global _index_cache_dir
+    import os
+    _index_cache_dir = os.fspath(directory)
+
+
+def disable_index_cache():
+    """disable_index_cache() -> None.
+
+    Stop reading and writing the persistent index cache. Existing index files
+    are left alone; see clear_index_cache().
+    """
+    global _index_cache_dir
+    _index_cache_dir = None
+
+
+def prewarm_index_cache(archive):
+    """prewarm_index_cache(archive) -> int.
+
+    Parse the central directory of 'archive' and write it to the index cache,
+    replacing any existing index for it. Return the number of entries.
+    Raise ValueError if the index cache is not enabled.
+    """
+    if _index_cache_dir is None:
+        raise ValueError('the index cache is not enabled')
+    import os
+    archive = os.fsdecode(archive)
+    clear_index_cache(archive)
+    return len(_read_directory(archive))
+
+
+def clear_index_cache(archive=None):
+    """clear_index_cache(archive=None) -> None.
+
+    Remove the cached index of 'archive', or every cached index if 'archive'
+    is None. Does nothing if the index cache is not enabled.
+    """
+    if _index_cache_dir is None:
+        return
+    import os
+    if archive is not None:
+        names = [_index_cache_name(os.fsdecode(archive))]
+    else:
+        try:
+            names = [name for name in os.listdir(_index_cache_dir)
+                     if name.endswith(_INDEX_SUFFIX)]
+        except FileNotFoundError:
+            return
+    for name in names:
+        try:
+            os.unlink(_bootstrap_external._path_join(_index_cache_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+# Return the file name (within the index cache directory) of the index of
+# archive.  Interpreters which can't share an index write their own.
+def _index_cache_name(archive):
+    import os
+    key = (os.fsencode(os.path.abspath(archive)) +
+           f'\0{sys.implementation.cache_tag}\0{marshal.version}'.encode())
+    digest = _imp.source_hash(_bootstrap_external._RAW_MAGIC_NUMBER, key)
+    return digest.hex() + _INDEX_SUFFIX
+
+# Return the path of the index file for archive, and the header that
+# identifies the current contents of the archive, given its _stat_key() and
+# its EOCD record(s) and comment.
+def _index_cache_key(archive, stat_key, eocd):
+    header = (
+        _INDEX_CACHE_VERSION,
+        _bootstrap_external.MAGIC_NUMBER,
+        archive,
+        *stat_key,
+        _imp.source_hash(_bootstrap_external._RAW_MAGIC_NUMBER, eocd),
+    )
+    path = _bootstrap_external._path_join(_index_cache_dir,
+                                          _index_cache_name(archive))
+    return path, header
+
+# Return the files dict stored at index_path, or None if there is no usable
+# index with the given header there.
+def _load_index(index_path, header):
+    try:
+        with _io.FileIO(index_path, 'r') as fp:
+            data = fp.readall()
+    except OSError:
+        return None
+    try:
+        stored_header, state = marshal.loads(data)
+        if stored_header != header:
+            _bootstrap._verbose_message('zipimport: stale index {!r}', index_path)
+            return None
+        return _TableOfContents._from_state(header[2], state)
+    except (EOFError, ValueError, TypeError):
+        _bootstrap._verbose_message('zipimport: bad index {!r}', index_path)
+        return None
+
+# Write files to index_path; failing to do so is not an error.
+def _store_index(index_path, header, files):
+    import os
+    try:
+        os.makedirs(_index_cache_dir, exist_ok=True)
+        _bootstrap_external._write_atomic(index_path,
+                                          marshal.dumps((header, files._get_state())))
+    except OSError as exc:
+        _bootstrap._verbose_message('zipimport: could not write index {!r}: {}',
+                                    index_path, exc)
+    else:
+        _bootstrap._verbose_message('zipimport: wrote index {!r}', index_path)
 
 # During bootstrap, we may need to load the encodings
 # package from a ZIP file. But the cp437 encoding is implemented
@@ -592,73 +1517,1742 @@ cp437_table = (
     '\xb0\u2219\xb7\u221a\u207f\xb2\u25a0\xa0'
 )
 
-_importing_zlib = False
+# Compression methods, as found in the compress field of a toc_entry.
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_BZIP2 = 12
+ZIP_LZMA = 14
+ZIP_ZSTANDARD = 93
 
-# Return the zlib.decompress function object, or NULL if zlib couldn't
-# be imported. The function is cached when found, so subsequent calls
-# don't import zlib again.
-def _get_decompress_func():
-    global _importing_zlib
-    if _importing_zlib:
-        # Someone has a zlib.py[co] in their Zip file
-        # let's avoid a stack overflow.
-        _bootstrap._verbose_message('zipimport: zlib UNAVAILABLE')
-        raise ZipImportError("can't decompress data; zlib not available")
+# The streaming decompressors below all follow the interface of
+# bz2.BZ2Decompressor: decompress(data, max_length) returns at most max_length
+# bytes, buffering any input it didn't get to, and needs_input tells whether
+# more input is needed to make progress.
 
-    _importing_zlib = True
-    try:
-        from zlib import decompress
-    except Exception:
-        _bootstrap._verbose_message('zipimport: zlib UNAVAILABLE')
-        raise ZipImportError("can't decompress data; zlib not available")
-    finally:
-        _importing_zlib = False
+# zlib.decompressobj() keeps what it didn't get to in unconsumed_tail instead.
+class _ZlibDecompressor:
+    def __init__(self, decompressobj):
+        self._decompressobj = decompressobj(-15)
+        self.needs_input = True
+        self.eof = False
 
-    _bootstrap._verbose_message('zipimport: zlib available')
-    return decompress
+    def decompress(self, data, max_length=-1):
+        d = self._decompressobj
+        if d.unconsumed_tail:
+            data = d.unconsumed_tail + data
+        data = d.decompress(data, max(max_length, 0))
+        self.needs_input = not d.unconsumed_tail
+        self.eof = d.eof
+        return data
 
-# Given a path to a Zip file and a toc_entry, return the (uncompressed) data.
-def _get_data(archive, toc_entry):
-    datapath, compress, data_size, file_size, file_offset, time, date, crc = toc_entry
-    if data_size < 0:
-        raise ZipImportError('negative data size')
+# A raw LZMA1 stream in a Zip file is preceded by a 2 byte version, and the
+# size and contents of its properties.
+class _LZMADecompressor:
+    def __init__(self, lzma):
+        self._lzma = lzma
+        self._decompressor = None
+        self._header = b''
+        self.needs_input = True
+        self.eof = False
 
-    with _io.open_code(archive) as fp:
-        # Check to make sure the local file header is correct
-        try:
-            fp.seek(file_offset)
-        except OSError:
-            raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
-        buffer = fp.read(30)
-        if len(buffer) != 30:
-            raise EOFError('EOF read where not expected')
+    def decompress(self, data, max_length=-1):
+        if self._decompressor is None:
+            self._header += data
+            if len(self._header) < 4:
+                return b''
+            props_end = 4 + _unpack_uint16(self._header[2:4])
+            if len(self._header) < props_end:
+                return b''
+            lzma = self._lzma
+            filters = [lzma._decode_filter_properties(
+                lzma.FILTER_LZMA1, self._header[4:props_end])]
+            self._decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW,
+                                                       filters=filters)
+            data = self._header[props_end:]
+            self._header = None
+        d = self._decompressor
+        data = d.decompress(data, max_length)
+        self.needs_input = d.needs_input
+        self.eof = d.eof
+        return data
 
-        if buffer[:4] != b'PK\x03\x04':
-            # Bad: Local File Header
-            raise ZipImportError(f'bad local file header: {archive!r}', path=archive)
+# zstandard's decompressobj() can't limit the size of its output, so a
+# stream_reader() reads from this object instead, which hands it the input
+# given so far and raises _NeedInput once it's all been read.  read1() only
+# reads input when it has no output yet, so no output is lost when it does.
+class _NeedInput(Exception):
+    pass
 
-        name_size = _unpack_uint16(buffer[26:28])
-        extra_size = _unpack_uint16(buffer[28:30])
-        header_size = 30 + name_size + extra_size
-        file_offset += header_size  # Start of file data
-        try:
-            fp.seek(file_offset)
-        except OSError:
-            raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
-        raw_data = fp.read(data_size)
-        if len(raw_data) != data_size:
-            raise OSError("zipimport: can't read data")
+class _ZstandardDecompressor:
+    def __init__(self, zstandard):
+        self._input = bytearray()
+        self._reader = zstandard.ZstdDecompressor().stream_reader(
+            self, closefd=False)
+        self.needs_input = True
+        self.eof = False
+
+    # Called by the stream reader for more input.
+    def read(self, size):
+        if not self._input:
+            raise _NeedInput
+        data = bytes(self._input[:size])
+        del self._input[:size]
+        return data
+
+    def decompress(self, data, max_length=-1):
+        self._input += data
+        if max_length < 0:
+            chunks = []
+            while chunk := self.decompress(b'', _STREAM_CHUNK_SIZE):
+                chunks.append(chunk)
+            return b''.join(chunks)
+        if self.eof or max_length == 0:
+            return b''
+        try:
+            data = self._reader.read1(max_length)
+        except _NeedInput:
+            self.needs_input = True
+            return b''
+        self.needs_input = False
+        self.eof = not data
+        return data
+
+# Each of these imports the module(s) needed for a compression method, and
+# returns a pair of functions: decompress(data, file_size) to decompress a
+# whole member, and new() to create a streaming decompressor.
+def _deflate_codec():
+    from zlib import decompress, decompressobj
+    return (lambda data, file_size: decompress(data, -15),
+            lambda: _ZlibDecompressor(decompressobj))
+
+def _bzip2_codec():
+    from bz2 import decompress, BZ2Decompressor
+    return lambda data, file_size: decompress(data), BZ2Decompressor
+
+def _lzma_codec():
+    import lzma
+
+    def decompress(data, file_size):
+        d = _LZMADecompressor(lzma)
+        data = d.decompress(data)
+        if d._decompressor is None:
+            raise ZipImportError("can't decompress data; bad LZMA header")
+        return data
+    return decompress, lambda: _LZMADecompressor(lzma)
+
+def _zstd_codec():
+    try:
+        # Python 3.14+
+        from compression.zstd import decompress, ZstdDecompressor
+    except ImportError:
+        pass
+    else:
+        return lambda data, file_size: decompress(data), ZstdDecompressor
+    try:
+        import zstandard
+    except ImportError:
+        from pyzstd import decompress, ZstdDecompressor
+        return lambda data, file_size: decompress(data), ZstdDecompressor
+    # A ZstdDecompressor can't be shared between threads, and needs to be
+    # told the size if the frame doesn't record it.
+    return (lambda data, file_size: zstandard.ZstdDecompressor().decompress(
+                data, max_output_size=file_size),
+            lambda: _ZstandardDecompressor(zstandard))
+
+# method -> (name, function returning its codec)
+_CODECS = {
+    ZIP_DEFLATED: ('zlib', _deflate_codec),
+    ZIP_BZIP2: ('bz2', _bzip2_codec),
+    ZIP_LZMA: ('lzma', _lzma_codec),
+    ZIP_ZSTANDARD: ('zstd', _zstd_codec),
+}
+# method -> codec, for those that have been imported.
+_codecs = {}
+# (method, thread id) for methods whose modules are being imported by a thread.
+# Someone may have e.g. a zlib.py[co] in their Zip file, so the thread
+# importing it mustn't try to decompress it with itself, but other threads can
+# import the same module at the same time.
+_importing_codecs = set()
+
+# Return the (decompress, new) pair of functions for the given compression
+# method, importing the module it needs on first use.
+def _get_codec(method):
+    try:
+        return _codecs[method]
+    except KeyError:
+        pass
+    try:
+        name, get_codec = _CODECS[method]
+    except KeyError:
+        raise ZipImportError(f"can't decompress data; unsupported compression method {method}")
+    importing = (method, _thread.get_ident())
+    if importing in _importing_codecs:
+        # The module is being imported from this (or another) Zip file.
+        _bootstrap._verbose_message('zipimport: {} UNAVAILABLE', name)
+        raise ZipImportError(f"can't decompress data; {name} not available")
+
+    _importing_codecs.add(importing)
+    try:
+        codec = get_codec()
+    except Exception:
+        _bootstrap._verbose_message('zipimport: {} UNAVAILABLE', name)
+        raise ZipImportError(f"can't decompress data; {name} not available")
+    finally:
+        _importing_codecs.discard(importing)
+    _bootstrap._verbose_message('zipimport: {} available', name)
+    _codecs[method] = codec
+    return codec
+
+# Return the decompress(data, file_size) function for the given compression
+# method.
+def _get_decompressor(method):
+    return _get_codec(method)[0]
+
+# Return a new streaming decompressor for the given compression method.
+def _new_stream_decompressor(method):
+    return _get_codec(method)[1]()
+
+
+class _ArchiveReader:
+    """An archive kept open for positional reads of its members.
+
+    The file is opened on first use and kept open until close() is called
+    or the reader is garbage collected.  A reader dropped from
+    _zip_reader_cache when the archive changes stays open for as long as
+    threads or open streams are still using it.  Reads use os.pread()
+    where it's available, so threads reading different members don't contend
+    for the file position; elsewhere they seek and read under a lock.  A
+    child process reopens the file rather than using the one inherited over
+    fork().
+
+    data_offsets maps the offsets of the local file headers that have been
+    read to the offsets of the members' data, so they're only read once.
+
+    view() maps the archive into memory instead, to give out its bytes
+    without copying them.  The mapping lives as long as any view of it, so
+    an archive that is truncated in place while views are in use can crash
+    the process (as with any mmap).
+
+    If a byte source is given (see register_source()), reads go to it
+    instead, and so does view() if the source has a view() method (else it
+    returns None).
+    """
+
+    def __init__(self, archive, source=None):
+        self.archive = archive
+        self.source = source
+        self._fp = None
+        self._fd = None
+        self._pid = None
+        self._mmap = None
+        self._view = None
+        self._lock = _thread.allocate_lock()
+        self.data_offsets = {}
+
+    def _open(self):
+        with self._lock:
+            if self._fp is not None and self._pid == _os.getpid():
+                return
+            fp = _io.open_code(self.archive)
+            _bootstrap._verbose_message('zipimport: opened {!r} for reading',
+                                        self.archive, verbosity=2)
+            if _stats is not None:
+                _stats.add(self.archive, 'opens')
+            # In a forked child, the old file object is a duplicate of the
+            # parent's descriptor, which is safe to close here.
+            old, self._fp = self._fp, fp
+            self._fd = fp.fileno()
+            self._pid = _os.getpid()
+        if old is not None:
+            old.close()
+
+    def pread(self, size, offset):
+        """Return up to 'size' bytes from 'offset' in the archive."""
+        if self.source is not None:
+            data = self.source.pread(size, offset)
+        else:
+            data = self._read(size, offset)
+        if _stats is not None:
+            _stats.add(self.archive, 'reads', 1, 'bytes_read', len(data))
+        return data
+
+    def _read(self, size, offset):
+        if self._pid != _os.getpid():
+            self._open()
+        if _pread is None:
+            with self._lock:
+                self._fp.seek(offset)
+                data = self._fp.read(size)
+        else:
+            data = _pread(self._fd, size, offset)
+            if 0 < len(data) < size:
+                # A single pread() is limited to about 2GB on some platforms.
+                chunks = [data]
+                while data and size > len(data):
+                    size -= len(data)
+                    offset += len(data)
+                    data = _pread(self._fd, size, offset)
+                    chunks.append(data)
+                data = b''.join(chunks)
+        return data
+
+    def view(self, size, offset):
+        """Return a read-only memoryview of up to 'size' bytes from 'offset'
+        in the archive, or None if the archive can't be mapped."""
+        if self.source is not None:
+            view = getattr(self.source, 'view', None)
+            return None if view is None else view(size, offset)
+        view = self._view
+        if view is None or offset + size > len(view):
+            # Not mapped yet, or the archive has grown since.
+            view = self._map()
+            if view is None:
+                return None
+        return view[offset:offset + size]
+
+    def _map(self):
+        mmap = _get_mmap_module()
+        if mmap is None:
+            return None
+        if self._pid != _os.getpid():
+            self._open()
+        with self._lock:
+            try:
+                mm = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # e.g. an empty file, or a file system that can't be mapped
+                return None
+            old = self._mmap
+            self._mmap = mm
+            self._view = view = memoryview(mm)
+        _close_mmap(old)
+        return view
+
+    def close(self):
+        fp, self._fp = self._fp, None
+        self._fd = self._pid = None
+        self.data_offsets = {}
+        if fp is not None:
+            fp.close()
+        old = self._mmap
+        self._mmap = self._view = None
+        _close_mmap(old)
+
+    def __del__(self):
+        self.close()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} for {self.archive!r}>'
+
+
+# posix or nt; os.pread() is not available on Windows.
+_os = _bootstrap_external._os
+_pread = getattr(_os, 'pread', None)
+
+_mmap_module = None
+_importing_mmap = False
+
+# Return the mmap module, or None if it can't be imported.  Like the codecs in
+# _get_codec(), it might be imported from a Zip file.
+def _get_mmap_module():
+    global _mmap_module, _importing_mmap
+    if _mmap_module is None and not _importing_mmap:
+        _importing_mmap = True
+        try:
+            import mmap
+            mmap.ACCESS_READ
+        except Exception:
+            _bootstrap._verbose_message('zipimport: mmap UNAVAILABLE')
+        else:
+            _mmap_module = mmap
+        finally:
+            _importing_mmap = False
+    return _mmap_module
+
+# Close a mapping made by _ArchiveReader.view(), unless views of it are still
+# in use (possibly by another thread); then it's unmapped when the last of
+# them is released.
+def _close_mmap(mm):
+    if mm is not None:
+        try:
+            mm.close()
+        except BufferError:
+            pass
+
+# Archive path -> _ArchiveReader, shared by all zipimporters for the archive.
+_zip_reader_cache = {}
+
+def _get_reader(archive):
+    try:
+        return _zip_reader_cache[archive]
+    except KeyError:
+        reader = _ArchiveReader(archive, _sources.get(archive))
+        return _zip_reader_cache.setdefault(archive, reader)
+
+
+# Byte sources
+#
+# A byte source is an object with a size() method returning the size of an
+# archive, and pread(size, offset) returning up to size bytes from offset in
+# it, like os.pread(), callable from several threads at once.  An archive
+# path registered with register_source() is read through its source, for
+# both the central directory and members, instead of from the file system.
+
+# Archive path -> byte source
+_sources = {}
+
+def register_source(archive, source):
+    """register_source(archive, source) -> None.
+
+    Read the archive 'archive' from the byte source 'source' rather than the
+    file system. A byte source has a size() method, returning the size of
+    the archive, and pread(size, offset), returning up to 'size' bytes from
+    'offset' like os.pread(), which may be called from several threads.
+    'archive' doesn't have to exist as a file, e.g. it can be a URL; it's
+    used like any archive path, by zipimporter() and on sys.path. The
+    archive is assumed not to change while it's registered.
+    """
+    import os
+    archive = os.fsdecode(archive)
+    if alt_path_sep:
+        archive = archive.replace(alt_path_sep, path_sep)
+    unregister_source(archive)
+    _sources[archive] = source
+
+
+def unregister_source(archive):
+    """unregister_source(archive) -> None.
+
+    Stop reading 'archive' from the byte source registered for it, and drop
+    what's cached from it. The source isn't closed.
+    """
+    import os
+    archive = os.fsdecode(archive)
+    if alt_path_sep:
+        archive = archive.replace(alt_path_sep, path_sep)
+    _sources.pop(archive, None)
+    _zip_directory_cache.pop(archive, None)
+    # Like in _refresh_directory(), the reader closes itself once unused.
+    _zip_reader_cache.pop(archive, None)
+
+# Return the registered archive that path is, or is in, or None.  Of archives
+# nested in one another, the innermost is returned.
+def _find_source_archive(path):
+    found = None
+    for archive in _sources:
+        if path == archive or path.startswith(archive + path_sep):
+            if found is None or len(archive) > len(found):
+                found = archive
+    return found
+
+
+class _SourceFile:
+    """Read-only file object over a byte source, for reading the central
+    directory with the same code as for a file."""
+
+    def __init__(self, source):
+        self._source = source
+        self._size = source.size()
+        self._pos = 0
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self._size
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._size - self._pos
+        if size <= 0:
+            return b''
+        data = self._source.pread(size, self._pos)
+        self._pos += len(data)
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class _WindowSource:
+    """Byte source for an archive stored uncompressed as the member 'name'
+    of 'archive', 'size' bytes from 'offset' in it.  'files' is the
+    _TableOfContents of 'archive' it was found in.
+
+    Reads go to the reader of 'archive', and view() gives views of its
+    memory map, so the nested archive is never copied.
+    """
+
+    def __init__(self, archive, name, offset, size, files):
+        self.archive = archive
+        self.name = name
+        self.offset = offset
+        self._size = size
+        self.files = files
+
+    def size(self):
+        return self._size
+
+    def pread(self, size, offset):
+        size = min(size, self._size - offset)
+        if size <= 0:
+            return b''
+        return _get_reader(self.archive).pread(size, self.offset + offset)
+
+    def view(self, size, offset):
+        size = min(size, self._size - offset)
+        if size < 0:
+            return None
+        return _get_reader(self.archive).view(size, self.offset + offset)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.name!r} in {self.archive!r}>'
+
+# Return a _WindowSource for the member name of archive, whose directory is
+# files, or None if it isn't a member stored uncompressed.
+def _nested_source(archive, files, name):
+    toc_entry = files.get(name)
+    if toc_entry is None or toc_entry[1] != ZIP_STORED:
+        return None
+    reader = _get_reader(archive)
+    try:
+        offset = _get_data_offset(reader, archive, toc_entry[4])
+    except (OSError, EOFError):
+        raise ZipImportError(f"can't read Zip file: {archive!r}", path=archive)
+    return _WindowSource(archive, name, offset, toc_entry[2], files)
+
+# Given archive, its _TableOfContents and the names in a path following it,
+# follow the names into any archive stored uncompressed in it (and on into
+# archives stored in that), registering each as a source.  Return the
+# innermost archive, its _TableOfContents and the names following it.
+def _enter_nested_archives(archive, files, names):
+    i = 1
+    while i <= len(names):
+        name = path_sep.join(names[:i])
+        i += 1
+        nested = archive + path_sep + name
+        if nested not in _sources:
+            source = _nested_source(archive, files, name)
+            if source is None:
+                continue
+            register_source(nested, source)
+        try:
+            nested_files = _refresh_directory(nested)
+        except ZipImportError:
+            # Just a member, not an archive
+            unregister_source(nested)
+            continue
+        _bootstrap._verbose_message('zipimport: found archive {!r} in {!r}',
+                                    name, archive)
+        archive, files, names = nested, nested_files, names[i - 1:]
+        i = 1
+    return archive, files, names
+
+# Make sure that source, the _WindowSource registered for archive, is still
+# where the archive is in the (possibly changed) archive it's nested in.
+def _refresh_window_source(archive, source):
+    files = _refresh_directory(source.archive)
+    if files is source.files:
+        return
+    new_source = _nested_source(source.archive, files, source.name)
+    if new_source is None:
+        unregister_source(archive)
+        raise ZipImportError(f'{source.name!r} is no longer stored in '
+                             f'{source.archive!r}', path=archive)
+    register_source(archive, new_source)
+
+
+class FileSource:
+    """FileSource(path) -> byte source for a local file.
+
+    Reads the file at 'path' with os.pread() where it's available. This is
+    how archives are read anyway; it's for wrapping in a BlockCache, e.g.
+    for archives on network file systems.
+    """
+
+    def __init__(self, path):
+        import os
+        self.path = os.fsdecode(path)
+        self._reader = _ArchiveReader(self.path)
+
+    def size(self):
+        return _os.stat(self.path).st_size
+
+    def pread(self, size, offset):
+        return self._reader._read(size, offset)
+
+    def close(self):
+        self._reader.close()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.path!r}>'
+
+
+class BlockCache:
+    """BlockCache(source, block_size=64 KiB, max_blocks=256, readahead=1)
+    -> byte source.
+
+    Byte source that reads 'source' in aligned blocks of 'block_size' bytes,
+    and keeps the 'max_blocks' most recently used ones. The blocks a read
+    needs that aren't cached, and up to 'readahead' blocks after them, are
+    fetched with a single read of 'source'. Reads of more blocks than the
+    cache holds go straight to 'source'.
+    """
+
+    def __init__(self, source, block_size=64 * 1024, max_blocks=256,
+                 readahead=1):
+        if block_size <= 0 or max_blocks <= 0 or readahead < 0:
+            raise ValueError('bad block cache parameters')
+        self.source = source
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.readahead = readahead
+        self.hits = self.misses = self.fetches = 0
+        self._blocks = {}  # block number -> data, least recently used first
+        self._size = None
+        self._lock = _thread.allocate_lock()
+
+    def size(self):
+        if self._size is None:
+            self._size = self.source.size()
+        return self._size
+
+    def pread(self, size, offset):
+        size = min(size, self.size() - offset)
+        if size <= 0:
+            return b''
+        block_size = self.block_size
+        first = offset // block_size
+        last = (offset + size - 1) // block_size
+        if last - first >= self.max_blocks:
+            self.fetches += 1
+            return self.source.pread(size, offset)
+
+        blocks = {}
+        missing = []
+        with self._lock:
+            for n in range(first, last + 1):
+                data = self._blocks.pop(n, None)
+                if data is None:
+                    missing.append(n)
+                else:
+                    # Now the most recently used
+                    self._blocks[n] = blocks[n] = data
+            self.hits += len(blocks)
+            self.misses += len(missing)
+        if missing:
+            start = missing[0]
+            end = missing[-1] + 1
+            end_of_file = (self.size() + block_size - 1) // block_size
+            while (end < end_of_file and end - start < self.max_blocks and
+                   end <= last + self.readahead and end not in self._blocks):
+                end += 1
+            self.fetches += 1
+            data = self.source.pread((end - start) * block_size,
+                                     start * block_size)
+            fetched = {}
+            for n in range(start, end):
+                block = data[(n - start) * block_size:(n - start + 1) * block_size]
+                if not block:
+                    break
+                fetched[n] = block
+            with self._lock:
+                for n, block in fetched.items():
+                    if n not in blocks:
+                        blocks[n] = block
+                        self._blocks.pop(n, None)
+                        self._blocks[n] = block
+                while len(self._blocks) > self.max_blocks:
+                    del self._blocks[next(iter(self._blocks))]
+
+        start = offset - first * block_size
+        data = b''.join([blocks[n] for n in range(first, last + 1) if n in blocks])
+        return data[start:start + size]
+
+    def close(self):
+        with self._lock:
+            self._blocks.clear()
+        close = getattr(self.source, 'close', None)
+        if close is not None:
+            close()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} for {self.source!r}>'
+
+
+class HTTPRangeSource:
+    """HTTPRangeSource(url, headers=None, timeout=None) -> byte source.
+
+    Byte source for a file served over HTTP or HTTPS by a server that
+    supports range requests. Each read is one request, sent with any extra
+    'headers', over a connection kept open for each thread until close()
+    is called. Wrap it in a BlockCache to make fewer, larger requests.
+    If the server ignores ranges and sends the whole file, that's kept and
+    read from instead of making any more requests.
+    """
+
+    def __init__(self, url, headers=None, timeout=None):
+        import threading
+        from urllib.parse import urlsplit
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ValueError(f'not an HTTP URL: {url!r}')
+        self.url = url
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self._scheme = parts.scheme
+        self._netloc = parts.netloc
+        self._target = parts.path or '/'
+        if parts.query:
+            self._target += '?' + parts.query
+        self._local = threading.local()
+        self._connections = []
+        self._size = None
+        self._body = None  # the whole file, from a server ignoring ranges
+
+    def _connect(self):
+        import http.client
+        if self._scheme == 'https':
+            cls = http.client.HTTPSConnection
+        else:
+            cls = http.client.HTTPConnection
+        return cls(self._netloc, timeout=self.timeout)
+
+    # Send a request and return the response's status, headers and body.
+    # A kept open connection that the server has closed is retried once.
+    def _request(self, method, headers):
+        import http.client
+        headers = {**self.headers, **headers}
+        for attempt in (1, 2):
+            conn = getattr(self._local, 'conn', None)
+            fresh = conn is None
+            if fresh:
+                conn = self._local.conn = self._connect()
+                self._connections.append(conn)
+            try:
+                conn.request(method, self._target, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException) as exc:
+                self._drop(conn)
+                if fresh:
+                    raise OSError(f"can't read {self.url!r}: {exc}") from exc
+                continue
+            if response.will_close:
+                self._drop(conn)
+            return response.status, response.headers, body
+
+    def _drop(self, conn):
+        conn.close()
+        self._local.conn = None
+        try:
+            self._connections.remove(conn)
+        except ValueError:
+            pass
+
+    def size(self):
+        if self._size is None:
+            status, headers, body = self._request('GET', {'Range': 'bytes=0-0'})
+            if status == 206:
+                # Content-Range: bytes 0-0/size
+                size = headers.get('Content-Range', '').rpartition('/')[2]
+            elif status == 200:
+                self._body = body
+                size = len(body)
+            else:
+                raise OSError(f"can't read {self.url!r}: HTTP {status}")
+            try:
+                self._size = int(size)
+            except ValueError:
+                raise OSError(f"can't read {self.url!r}: no size") from None
+        return self._size
+
+    def pread(self, size, offset):
+        if size <= 0:
+            return b''
+        if self._body is not None:
+            return self._body[offset:offset + size]
+        status, headers, body = self._request(
+            'GET', {'Range': f'bytes={offset}-{offset + size - 1}'})
+        if status == 206:
+            return body[:size]
+        if status == 416:  # Range Not Satisfiable: past the end
+            return b''
+        if status == 200:
+            # The server ignored the range.
+            self._body = body
+            return body[offset:offset + size]
+        raise OSError(f"can't read {self.url!r}: HTTP {status}")
+
+    def close(self):
+        # Connections are only ever used by the thread that opened them, but
+        # may be closed from any.
+        connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.url!r}>'
+
+# Given a path to a Zip file and a toc_entry, return the (uncompressed) data.
+def _get_data(archive, toc_entry):
+    if _recorder is not None:
+        _recorder.record(archive, toc_entry)
+    cache = _data_cache
+    if cache is None:
+        return _read_prefetched_data(archive, toc_entry)
+    # The offset and crc tell apart different members, and the same member
+    # in different versions of the archive.
+    key = (archive, toc_entry[4], toc_entry[7])
+    data = cache.get(key)
+    if data is None:
+        data = _read_prefetched_data(archive, toc_entry)
+        cache.put(key, data)
+    elif _stats is not None:
+        _stats.add(archive, 'data_cache_hits')
+    return data
+
+# Like read(archive, toc_entry), _read_data() by default, but take the data
+# from the prefetcher if it has it.
+def _read_prefetched_data(archive, toc_entry, read=None):
+    prefetcher = _prefetcher
+    if prefetcher is not None:
+        data = prefetcher.get(toc_entry)
+        if data is not None:
+            if _stats is not None:
+                _stats.add(archive, 'prefetch_hits')
+            return data
+    return (read or _read_data)(archive, toc_entry)
+
+# Given a path to a Zip file and a toc_entry, return a read-only memoryview
+# of the (uncompressed) data.  For stored members, this is a view of the
+# archive mapped into memory, so the data isn't copied, unless the data cache
+# or the prefetcher already has the data.  Either way the member is recorded
+# and counted like in _get_data().
+def _get_buffer(archive, toc_entry):
+    if toc_entry[1] != ZIP_STORED:
+        return memoryview(_get_data(archive, toc_entry)).toreadonly()
+    if _recorder is not None:
+        _recorder.record(archive, toc_entry)
+    cache = _data_cache
+    data = None
+    if cache is not None:
+        # The same key as in _get_data()
+        key = (archive, toc_entry[4], toc_entry[7])
+        data = cache.get(key)
+        if data is not None and _stats is not None:
+            _stats.add(archive, 'data_cache_hits')
+    if data is None:
+        data = _read_prefetched_data(archive, toc_entry, _map_data)
+        # There's no need to cache views of the map.
+        if cache is not None and not isinstance(data, memoryview):
+            cache.put(key, data)
+    return memoryview(data).toreadonly()
+
+# Return a view of the stored member of archive described by toc_entry in the
+# archive's memory map, or read it if the archive can't be mapped.
+def _map_data(archive, toc_entry):
+    datapath, compress, data_size, file_size, file_offset, time, date, crc = toc_entry
+    if data_size < 0:
+        raise ZipImportError('negative data size')
+    reader = _get_reader(archive)
+    file_offset = _get_data_offset(reader, archive, file_offset)
+    view = reader.view(data_size, file_offset)
+    if view is None:
+        return _read_data(archive, toc_entry)
+    if len(view) != data_size:
+        raise OSError("zipimport: can't read data")
+    if _stats is not None:
+        _stats.add(archive, 'mapped_reads', 1, 'bytes_mapped', data_size)
+    return view
+
+# Whether to read and check each member's local file header every time its
+# data is read, not only the first time.
+_check_local_headers = False
+
+def enable_local_header_checks():
+    """enable_local_header_checks() -> None.
+
+    Read and check a member's local file header every time the member is
+    read. By default, the offset of a member's data is remembered the first
+    time, so later reads only read the data. The ZIPIMPORT64_CHECK_HEADERS
+    environment variable has the same effect at import time.
+    """
+    global _check_local_headers
+    _check_local_headers = True
+
+
+def disable_local_header_checks():
+    """disable_local_header_checks() -> None.
+
+    Only read a member's local file header the first time it's read.
+    """
+    global _check_local_headers
+    _check_local_headers = False
+
+# Given the offset of a member's local file header, return the offset of its
+# data.  The header is only read once per reader, unless local header checks
+# are enabled.
+def _get_data_offset(reader, archive, file_offset):
+    if not _check_local_headers:
+        try:
+            return reader.data_offsets[file_offset]
+        except KeyError:
+            pass
+    buffer = reader.pread(30, file_offset)
+    if len(buffer) != 30:
+        raise EOFError('EOF read where not expected')
+    data_offset = file_offset + _local_header_size(buffer, archive)
+    reader.data_offsets[file_offset] = data_offset
+    return data_offset
+
+# Given the fixed-size part of a local file header, return the size of the
+# whole header.
+def _local_header_size(buffer, archive):
+    # Check to make sure the local file header is correct
+    if buffer[:4] != b'PK\x03\x04':
+        # Bad: Local File Header
+        raise ZipImportError(f'bad local file header: {archive!r}', path=archive)
+
+    name_size = _unpack_uint16(buffer[26:28])
+    extra_size = _unpack_uint16(buffer[28:30])
+    return 30 + name_size + extra_size
+
+# Read and decompress the member of archive described by toc_entry.
+def _read_data(archive, toc_entry):
+    datapath, compress, data_size, file_size, file_offset, time, date, crc = toc_entry
+    if data_size < 0:
+        raise ZipImportError('negative data size')
+
+    reader = _get_reader(archive)
+    file_offset = _get_data_offset(reader, archive, file_offset)
+    raw_data = reader.pread(data_size, file_offset)
+    if len(raw_data) != data_size:
+        raise OSError("zipimport: can't read data")
+
+    if compress == ZIP_STORED:
+        # data is not compressed
+        return raw_data
+    return _decompress(archive, compress, raw_data, file_size)
+
+# Decompress the raw data of a member of archive.
+def _decompress(archive, compress, raw_data, file_size):
+    decompress = _get_decompressor(compress)
+    stats = _stats
+    if stats is None:
+        return decompress(raw_data, file_size)
+    start = _perf_counter_ns()
+    data = decompress(raw_data, file_size)
+    stats.add(archive, 'decompressions', 1,
+              'decompress_ns', _perf_counter_ns() - start)
+    stats.add(archive, 'bytes_decompressed', len(data))
+    return data
+
+
+# get_many() reads members whose local headers are at most _COALESCE_GAP
+# bytes past the end of the previous one together, in one read of up to
+# _COALESCE_MAX_READ bytes.
+_COALESCE_GAP = 64 * 1024
+_COALESCE_MAX_READ = 8 * 1024 * 1024
+
+# Return (an upper bound on) the offset in the archive of the end of the
+# member described by toc_entry.  The central directory doesn't say how big
+# the local header's extra field is, so allow some room for it; a member
+# whose data ends up past the end of the read is read again on its own.
+def _estimate_member_end(toc_entry):
+    # The path includes the archive's, which more than covers the name.
+    return toc_entry[4] + 30 + len(toc_entry[0]) + 64 + toc_entry[2]
+
+# Given a list of (key, toc_entry) for members of archive, return a dict
+# mapping each key to the (uncompressed) data of its member.  The members
+# are read in the order they're in the archive, coalescing nearby members
+# into larger reads, and decompressed in up to 'workers' threads.
+def _get_many(archive, items, workers=None):
+    results = {}
+    pending = []
+    cache = _data_cache
+    for key, toc_entry in items:
+        if _recorder is not None:
+            _recorder.record(archive, toc_entry)
+        if toc_entry[2] < 0:
+            raise ZipImportError('negative data size')
+        if cache is not None:
+            data = cache.get((archive, toc_entry[4], toc_entry[7]))
+            if data is not None:
+                if _stats is not None:
+                    _stats.add(archive, 'data_cache_hits')
+                results[key] = data
+                continue
+        pending.append((key, toc_entry))
+    pending.sort(key=lambda item: item[1][4])
+
+    reader = _get_reader(archive)
+    raw = []  # (key, toc_entry, raw data)
+    i = 0
+    while i < len(pending):
+        start = pending[i][1][4]
+        end = _estimate_member_end(pending[i][1])
+        j = i + 1
+        while j < len(pending):
+            toc_entry = pending[j][1]
+            member_end = max(end, _estimate_member_end(toc_entry))
+            if (toc_entry[4] > end + _COALESCE_GAP
+                    or member_end - start > _COALESCE_MAX_READ):
+                break
+            end = member_end
+            j += 1
+        buffer = memoryview(reader.pread(end - start, start))
+        for key, toc_entry in pending[i:j]:
+            raw_data = _slice_member(reader, archive, buffer, start, toc_entry)
+            raw.append((key, toc_entry, raw_data))
+        i = j
+
+    def finish(item):
+        key, toc_entry, raw_data = item
+        compress = toc_entry[1]
+        if compress == ZIP_STORED:
+            return bytes(raw_data)
+        return _decompress(archive, compress, raw_data, toc_entry[3])
+
+    if workers is not None and workers > 1 and len(raw) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(min(workers, len(raw))) as pool:
+            datas = list(pool.map(finish, raw))
+    else:
+        datas = list(map(finish, raw))
+    for (key, toc_entry, raw_data), data in zip(raw, datas):
+        if cache is not None:
+            cache.put((archive, toc_entry[4], toc_entry[7]), data)
+        results[key] = data
+    return {key: results[key] for key, toc_entry in items}
+
+# Return the raw data of the member described by toc_entry, from buffer
+# holding the archive's bytes from start on, or read from the archive if
+# it's not all in buffer.
+def _slice_member(reader, archive, buffer, start, toc_entry):
+    file_offset, data_size = toc_entry[4], toc_entry[2]
+    header = buffer[file_offset - start:file_offset - start + 30]
+    if len(header) == 30:
+        data_offset = file_offset + _local_header_size(header, archive)
+        reader.data_offsets[file_offset] = data_offset
+        data = buffer[data_offset - start:data_offset - start + data_size]
+        if len(data) == data_size:
+            return data
+    else:
+        data_offset = _get_data_offset(reader, archive, file_offset)
+    data = reader.pread(data_size, data_offset)
+    if len(data) != data_size:
+        raise OSError("zipimport: can't read data")
+    return data
+
+
+# How much compressed data _MemberStream reads at a time.
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+class _MemberStream(_io._RawIOBase):
+    """Raw, read-only file object for a member of a Zip file.
+
+    Compressed members are decompressed incrementally as they are read,
+    _STREAM_CHUNK_SIZE bytes of compressed data at a time, so memory use
+    doesn't depend on the size of the member.  Seeking backwards in a
+    compressed member starts decompressing it again from the start.
+    """
+
+    def __init__(self, archive, toc_entry):
+        datapath, compress, data_size, file_size, file_offset, time, date, crc = toc_entry
+        if data_size < 0:
+            raise ZipImportError('negative data size')
+        self.name = datapath
+        self._archive = archive
+        self._compress = compress
+        self._data_size = data_size
+        self._file_size = file_size
+        self._reader = _get_reader(archive)
+        self._data_offset = _get_data_offset(self._reader, archive, file_offset)
+        self._pos = 0
+        self._decompressor = None
+        if compress != ZIP_STORED:
+            self._rewind()
+
+    def _rewind(self):
+        self._decompressor = _new_stream_decompressor(self._compress)
+        self._raw_pos = 0
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        size = min(len(b), self._file_size - self._pos)
+        if size <= 0:
+            return 0
+        if self._decompressor is None:
+            data = self._reader.pread(size, self._data_offset + self._pos)
+        else:
+            data = self._decompress(size)
+        size = len(data)
+        b[:size] = data
+        self._pos += size
+        return size
+
+    # Return up to size bytes of decompressed data, reading more compressed
+    # data when the decompressor needs it.
+    def _decompress(self, size):
+        d = self._decompressor
+        while True:
+            chunk = b''
+            if d.needs_input and self._raw_pos < self._data_size:
+                chunk = self._reader.pread(
+                    min(_STREAM_CHUNK_SIZE, self._data_size - self._raw_pos),
+                    self._data_offset + self._raw_pos)
+                if not chunk:
+                    raise EOFError('EOF read where not expected')
+                self._raw_pos += len(chunk)
+            data = d.decompress(chunk, size)
+            if _stats is not None:
+                _stats.add(self._archive, 'bytes_decompressed', len(data))
+            if data or d.eof:
+                return data
+            if (not chunk and d.needs_input and
+                    self._raw_pos >= self._data_size):
+                raise EOFError('Compressed data ended before the '
+                               'end-of-stream marker was reached')
+
+    def seek(self, offset, whence=0):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        if whence == 0:
+            pos = offset
+        elif whence == 1:
+            pos = self._pos + offset
+        elif whence == 2:
+            pos = self._file_size + offset
+        else:
+            raise ValueError(f'invalid whence ({whence}, should be 0, 1 or 2)')
+        if pos < 0:
+            raise ValueError(f'negative seek position {pos}')
+        if self._decompressor is None:
+            self._pos = pos
+            return pos
+        if pos < self._pos:
+            self._rewind()
+        pos = min(pos, self._file_size)
+        while self._pos < pos:
+            data = self._decompress(min(pos - self._pos, _STREAM_CHUNK_SIZE))
+            if not data:
+                raise EOFError('Compressed data ended before the end of '
+                               'the file')
+            self._pos += len(data)
+        return self._pos
+
+    def tell(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        return self._pos
+
+    def close(self):
+        # The reader is shared, so it's left open.
+        self._decompressor = None
+        super().close()
+
+    def __repr__(self):
+        return f'<zipimport64._MemberStream {self.name!r}>'
+
+# Return a buffered, read-only file object for the member of archive
+# described by toc_entry.
+def _open_member(archive, toc_entry):
+    return _io.BufferedReader(_MemberStream(archive, toc_entry),
+                              _STREAM_CHUNK_SIZE)
+
+
+# The async API reads members with more compressed data than this, and
+# streams, this much at a time, so cancelling takes effect after at most one
+# chunk and a large member doesn't hold on to an executor thread for long.
+_ASYNC_CHUNK_SIZE = 1024 * 1024
+# Size of the thread pool the async API uses by default.
+_ASYNC_WORKERS = 4
+
+_async_executor = None
+_async_executor_lock = _thread.allocate_lock()
+
+# Return the executor the async API uses when it isn't given one: a small
+# pool of its own, so reading archives can't tie up the event loop's default
+# executor.
+def _get_async_executor():
+    global _async_executor
+    with _async_executor_lock:
+        if _async_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _async_executor = ThreadPoolExecutor(
+                _ASYNC_WORKERS, thread_name_prefix='zipimport64-async')
+        return _async_executor
+
+# Call func(*args) in executor (or the default one), and return the result.
+async def _run_async(executor, func, *args):
+    import asyncio
+    if executor is None:
+        executor = _get_async_executor()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+# Coroutine version of _get_data().
+async def _get_data_async(archive, toc_entry, executor):
+    if toc_entry[2] <= _ASYNC_CHUNK_SIZE:
+        return await _run_async(executor, _get_data, archive, toc_entry)
+    # Recorded, cached and taken from the prefetcher like in _get_data(), but
+    # read a chunk at a time.  The reads and the bytes decompressed are
+    # counted as they happen, as for open(), rather than as one decompression.
+    if _recorder is not None:
+        _recorder.record(archive, toc_entry)
+    cache = _data_cache
+    key = (archive, toc_entry[4], toc_entry[7])
+    if cache is not None:
+        data = cache.get(key)
+        if data is not None:
+            if _stats is not None:
+                _stats.add(archive, 'data_cache_hits')
+            return data
+    data = None
+    prefetcher = _prefetcher
+    if prefetcher is not None:
+        # This waits for the member if it's being prefetched.
+        data = await _run_async(executor, prefetcher.get, toc_entry)
+        if data is not None and _stats is not None:
+            _stats.add(archive, 'prefetch_hits')
+    if data is None:
+        async with _AsyncMemberStream(archive, toc_entry, executor) as f:
+            data = await f.read()
+    if cache is not None:
+        cache.put(key, data)
+    return data
+
+class _AsyncMemberStream:
+    """Asynchronous, read-only file object for a member of a Zip file.
+
+    Wraps the file object from _open_member(), whose methods are run in an
+    executor, reading (or seeking over) at most _ASYNC_CHUNK_SIZE bytes per
+    call.  The member
+    is opened on first use.  Like other file objects, it's not meant to be
+    used by several tasks at once.
+    """
+
+    def __init__(self, archive, toc_entry, executor):
+        self.name = toc_entry[0]
+        self._archive = archive
+        self._toc_entry = toc_entry
+        self._executor = executor
+        self._fp = None
+        self._closed = False
+
+    async def _call(self, method, *args):
+        if self._closed:
+            raise ValueError('I/O operation on closed file.')
+        if self._fp is None:
+            self._fp = await _run_async(self._executor, _open_member,
+                                        self._archive, self._toc_entry)
+        return await _run_async(self._executor, getattr(self._fp, method),
+                                *args)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    async def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._toc_entry[3]
+        chunks = []
+        while size > 0:
+            chunk = await self._call('read', min(size, _ASYNC_CHUNK_SIZE))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        if len(chunks) <= 1:
+            return chunks[0] if chunks else b''
+        # Joining large chunks takes a while too.
+        return await _run_async(self._executor, b''.join, chunks)
+
+    async def seek(self, offset, whence=0):
+        if whence == 0:
+            pos = offset
+        elif whence == 1:
+            pos = await self.tell() + offset
+        elif whence == 2:
+            pos = self._toc_entry[3] + offset
+        else:
+            raise ValueError(f'invalid whence ({whence}, should be 0, 1 or 2)')
+        if pos < 0:
+            raise ValueError(f'negative seek position {pos}')
+        if self._toc_entry[1] == ZIP_STORED:
+            return await self._call('seek', pos)
+        # Seeking in a compressed member decompresses everything before the
+        # new position, so it's done a chunk at a time too.
+        current = await self.tell()
+        if pos < current:
+            # Going back starts decompressing again from the start.
+            current = await self._call(
+                'seek', pos if pos <= _ASYNC_CHUNK_SIZE else 0)
+        while current < pos:
+            new = await self._call('seek',
+                                   min(pos, current + _ASYNC_CHUNK_SIZE))
+            if new == current:
+                # The end of the member
+                break
+            current = new
+        return current
+
+    async def tell(self):
+        return await self._call('tell')
+
+    async def close(self):
+        self._closed = True
+        fp, self._fp = self._fp, None
+        if fp is not None:
+            # A read cancelled while it's running in the executor may still
+            # be using it.
+            await _run_async(self._executor, fp.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self.read(_ASYNC_CHUNK_SIZE)
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
+
+    def __repr__(self):
+        return f'<zipimport64._AsyncMemberStream {self.name!r}>'
+
+
+class _DataCache:
+    """Least recently used cache of decompressed member data.
+
+    Entries larger than max_entry_bytes are not cached, and the least
+    recently used entries are evicted to keep the total size of the cached
+    data within max_bytes.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._entries = {}  # key -> data, least recently used first
+        self._bytes = 0
+        self._lock = _thread.allocate_lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                data = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries[key] = data
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._bytes -= len(self._entries.pop(oldest))
+                self.evictions += 1
+
+    def info(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_entry_bytes': self.max_entry_bytes,
+            }
+
+
+# The cache used by _get_data(), if any.
+_data_cache = None
+
+def enable_data_cache(max_bytes, max_entry_bytes=None):
+    """enable_data_cache(max_bytes, max_entry_bytes=None) -> None.
+
+    Keep up to 'max_bytes' of recently read (decompressed) member data in
+    memory, so that reading the same members again doesn't reread and
+    decompress them. Members larger than 'max_entry_bytes' (by default,
+    'max_bytes') are never cached. Replaces any existing cache, and its
+    statistics.
+    """
+    global _data_cache
+    if max_entry_bytes is None:
+        max_entry_bytes = max_bytes
+    if max_bytes < 0 or max_entry_bytes < 0:
+        raise ValueError('cache sizes must not be negative')
+    _data_cache = _DataCache(max_bytes, max_entry_bytes)
+
+
+def disable_data_cache():
+    """disable_data_cache() -> None.
+
+    Stop caching member data, and drop any that is cached.
+    """
+    global _data_cache
+    _data_cache = None
+
+
+def data_cache_info():
+    """data_cache_info() -> dict or None.
+
+    Return the hits, misses, evictions, number of entries and bytes cached,
+    and limits of the member data cache, or None if it's not enabled.
+    """
+    cache = _data_cache
+    if cache is None:
+        return None
+    return cache.info()
+
+
+# The counters kept for each archive when stats are enabled.  Those ending in
+# _ns are cumulative times, in nanoseconds.
+_STATS = (
+    'directory_reads',      # central directories read (or loaded)
+    'directory_read_ns',
+    'index_cache_hits',     # of those, loaded from the index cache
+    'opens',                # archive opened for reading members
+    'reads',                # positional reads
+    'bytes_read',
+    'mapped_reads',         # stored members given out as memory maps
+    'bytes_mapped',
+    'decompressions',       # whole members decompressed
+    'decompress_ns',
+    'bytes_decompressed',   # including streamed members
+    'data_cache_hits',
+    'prefetch_hits',
+    'pyc_loads',            # .pyc files used
+    'stale_pycs',           # .pyc files rejected
+    'pyc_load_ns',          # including rejected ones
+    'stale_pyc_skips',      # known stale .pyc files not read again
+    'pyc_hash_checks',      # hash-based .pyc files checked against sources
+    'pyc_hash_check_skips', # known to match their sources, not checked again
+    'compiles',
+    'compile_ns',
+    'code_cache_hits',
+    'execs',                # modules executed by load_module()
+    'exec_ns',
+)
+
+_perf_counter_ns = time.perf_counter_ns
+
+class _Stats:
+    """Counters for each archive, see _STATS."""
+
+    def __init__(self):
+        self._archives = {}  # archive -> dict of counters
+        self._lock = _thread.allocate_lock()
+
+    # Add value to counter, and optionally elapsed to timer, for archive.
+    def add(self, archive, counter, value=1, timer=None, elapsed=0):
+        with self._lock:
+            counters = self._archives.get(archive)
+            if counters is None:
+                counters = self._archives[archive] = dict.fromkeys(_STATS, 0)
+            counters[counter] += value
+            if timer is not None:
+                counters[timer] += elapsed
+
+    def get(self):
+        with self._lock:
+            archives = {archive: dict(counters)
+                        for archive, counters in self._archives.items()}
+        total = dict.fromkeys(_STATS, 0)
+        for counters in archives.values():
+            for name, value in counters.items():
+                total[name] += value
+        return {'total': total, 'archives': archives}
 
-    if compress == 0:
-        # data is not compressed
-        return raw_data
+    def reset(self):
+        with self._lock:
+            self._archives.clear()
+
+# The stats being kept, if any.  Instrumented code checks for None first, so
+# when disabled it costs a global lookup.
+_stats = None
+
+def enable_stats():
+    """enable_stats() -> None.
+
+    Start counting what the importer does, for each archive: reading
+    directories, opening and reading archives, decompressing, using and
+    rejecting .pyc files, compiling, cache hits and executing modules, and
+    the time taken by each. See get_stats(). The ZIPIMPORT64_STATS
+    environment variable has the same effect at import time.
+    """
+    global _stats
+    if _stats is None:
+        _stats = _Stats()
+
+
+def disable_stats():
+    """disable_stats() -> None.
+
+    Stop counting, and drop the counts so far.
+    """
+    global _stats
+    _stats = None
+
+
+def get_stats():
+    """get_stats() -> dict or None.
+
+    Return the counts kept since enable_stats() or reset_stats(), as a dict
+    with 'total' for the whole process and 'archives', mapping each archive
+    path to its own counts. Names ending in _ns are cumulative times in
+    nanoseconds. Return None if stats aren't enabled.
+    """
+    stats = _stats
+    if stats is None:
+        return None
+    return stats.get()
+
+
+def reset_stats():
+    """reset_stats() -> None.
+
+    Set all the counts back to zero.
+    """
+    stats = _stats
+    if stats is not None:
+        stats.reset()
+
+
+# The recorder used by _get_data(), if any.
+_recorder = None
+_PREFETCH_LOG_VERSION = 1
+
+class _Recorder:
+    """Log of the members read by _get_data(), in the order they were first
+    read, for prefetch() to replay."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []  # (archive, name)
+        self._seen = set()
+
+    def record(self, archive, toc_entry):
+        datapath = toc_entry[0]
+        if datapath not in self._seen:
+            self._seen.add(datapath)
+            self.entries.append((archive, datapath[len(archive) + 1:]))
+
+    def save(self):
+        data = marshal.dumps((_PREFETCH_LOG_VERSION, self.entries))
+        _write_cache_file(self.path, data)
+
+
+def start_recording(path):
+    """start_recording(path) -> None.
+
+    Record the order in which members of archives are read from now on, and
+    write it to 'path' at exit (or when stop_recording() is called), for
+    prefetch() to replay in later runs. The ZIPIMPORT64_RECORD environment
+    variable has the same effect at import time.
+    """
+    global _recorder
+    import os
+    import atexit
+    if _recorder is not None:
+        stop_recording()
+    _recorder = _Recorder(os.fspath(path))
+    atexit.register(stop_recording)
+
+
+def stop_recording():
+    """stop_recording() -> int or None.
 
-    # Decompress with zlib
+    Stop recording and write the log. Return the number of members in it, or
+    None if nothing was being recorded.
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is None:
+        return None
+    recorder.save()
+    return len(recorder.entries)
+
+# The prefetcher used by _get_data(), if any.
+_prefetcher = None
+
+class _Prefetcher:
+    """Reads and decompresses members in the order given by a log from
+    _Recorder, in background threads, ahead of _get_data() asking for them.
+
+    The data is staged until _get_data() takes it, keeping at most max_bytes
+    ahead.  When a member is taken, anything before it in the log that's
+    still staged (or not read yet) was not needed this time, and is dropped.
+    """
+
+    def __init__(self, entries, max_bytes, workers):
+        import threading
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self._entries = entries
+        # __file__ value -> position in entries
+        self._positions = {_toc_path(archive, name): i
+                           for i, (archive, name) in enumerate(entries)}
+        self._next = 0  # position of the next entry to read
+        self._wanted = 0  # lowest position that might still be asked for
+        self._staged = {}  # position -> (toc_entry, data)
+        self._in_flight = set()  # positions
+        self._bytes = 0
+        self._running = workers
+        self._cond = threading.Condition(threading.Lock())
+        for i in range(workers):
+            threading.Thread(target=self._work, daemon=True,
+                             name=f'zipimport64-prefetch-{i}').start()
+
+    def _work(self):
+        cond = self._cond
+        while True:
+            with cond:
+                while self._bytes >= self.max_bytes and self._next < len(self._entries):
+                    cond.wait()
+                if self._next >= len(self._entries):
+                    break
+                pos = self._next
+                self._next += 1
+                self._in_flight.add(pos)
+            archive, name = self._entries[pos]
+            toc_entry = data = None
+            try:
+                files = _zip_directory_cache.get(archive)
+                if files is None:
+                    files = _refresh_directory(archive)
+                toc_entry = files.get(name)
+                if toc_entry is not None:
+                    data = _read_data(archive, toc_entry)
+            except Exception:
+                # It will fail again when it's asked for, if it's asked for.
+                pass
+            with cond:
+                self._in_flight.discard(pos)
+                if data is not None and pos >= self._wanted:
+                    self._staged[pos] = toc_entry, data
+                    self._bytes += len(data)
+                cond.notify_all()
+        with cond:
+            self._running -= 1
+            self._check_done()
+
+    # Return the data of toc_entry if it's been (or is being) prefetched,
+    # or None.
+    def get(self, toc_entry):
+        cond = self._cond
+        with cond:
+            pos = self._positions.get(toc_entry[0])
+            if pos is None or pos < self._wanted:
+                self.misses += 1
+                return None
+            while pos in self._in_flight:
+                cond.wait()
+            staged = self._staged.pop(pos, None)
+            # Everything before this was skipped this time.
+            for skipped in [p for p in self._staged if p < pos]:
+                self._bytes -= len(self._staged.pop(skipped)[1])
+            self._wanted = pos + 1
+            # Don't read what's before this either.
+            self._next = max(self._next, self._wanted)
+            data = None
+            if staged is not None:
+                self._bytes -= len(staged[1])
+                # The archive may have changed since it was read.
+                if staged[0] == toc_entry:
+                    data = staged[1]
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._check_done()
+            cond.notify_all()
+            return data
+
+    # Stop consulting this prefetcher once it has nothing left to give.
+    def _check_done(self):
+        global _prefetcher
+        if (not self._running and not self._staged and not self._in_flight
+                and _prefetcher is self):
+            _prefetcher = None
+            _bootstrap._verbose_message('zipimport: prefetch done, {} hits, {} misses',
+                                        self.hits, self.misses)
+
+    def stop(self):
+        with self._cond:
+            self._next = len(self._entries)
+            self._staged.clear()
+            self._bytes = 0
+            self._cond.notify_all()
+
+
+def prefetch(path, workers=4, max_bytes=64 * 1024 * 1024):
+    """prefetch(path, workers=4, max_bytes=64 MiB) -> int.
+
+    Start reading and decompressing the members logged to 'path' by
+    start_recording(), in that order, in 'workers' background threads, so
+    they are ready before they are imported. At most 'max_bytes' of data is
+    kept ahead of what has been asked for. Return the number of members in
+    the log (0 if there is no usable log). The ZIPIMPORT64_PREFETCH
+    environment variable has the same effect at import time.
+    """
+    global _prefetcher
+    import os
     try:
-        decompress = _get_decompress_func()
-    except Exception:
-        raise ZipImportError("can't decompress data; zlib not available")
-    return decompress(raw_data, -15)
+        with _io.FileIO(os.fspath(path), 'r') as fp:
+            version, entries = marshal.loads(fp.readall())
+    except (OSError, EOFError, ValueError, TypeError):
+        _bootstrap._verbose_message('zipimport: no prefetch log {!r}', path)
+        return 0
+    if version != _PREFETCH_LOG_VERSION or not entries:
+        return 0
+    stop_prefetch()
+    _prefetcher = _Prefetcher(entries, max_bytes, workers)
+    return len(entries)
+
+
+def stop_prefetch():
+    """stop_prefetch() -> None.
+
+    Stop prefetching, and drop any data prefetched but not used yet.
+    """
+    global _prefetcher
+    prefetcher, _prefetcher = _prefetcher, None
+    if prefetcher is not None:
+        prefetcher.stop()
 
 
 # Lenient date/time comparison function. The precision of the mtime
@@ -690,7 +3284,13 @@ def _unmarshal_code(self, pathname, fullpath, fullname, data):
         check_source = flags & 0b10 != 0
         if (_imp.check_hash_based_pycs != 'never' and
                 (check_source or _imp.check_hash_based_pycs == 'always')):
-            source_bytes = _get_pyc_source(self, fullpath)
+            record = _validated_pyc_record(self, fullpath, data)
+            if record is not None and record in _get_validated_pycs():
+                if _stats is not None:
+                    _stats.add(self.archive, 'pyc_hash_check_skips')
+                source_bytes = None
+            else:
+                source_bytes = _get_pyc_source(self, fullpath)
             if source_bytes is not None:
                 source_hash = _imp.source_hash(
                     _bootstrap_external._RAW_MAGIC_NUMBER,
@@ -702,6 +3302,10 @@ def _unmarshal_code(self, pathname, fullpath, fullname, data):
                         data, source_hash, fullname, exc_details)
                 except ImportError:
                     return None
+                if _stats is not None:
+                    _stats.add(self.archive, 'pyc_hash_checks')
+                if record is not None:
+                    _record_validated_pyc(record)
     else:
         source_mtime, source_size = \
             _get_mtime_and_size_of_source(self, fullpath)
@@ -715,7 +3319,8 @@ def _unmarshal_code(self, pathname, fullpath, fullname, data):
                     f'bytecode is stale for {fullname!r}')
                 return None
 
-    code = marshal.loads(data[16:])
+    # Slicing a memoryview doesn't copy the code.
+    code = marshal.loads(memoryview(data)[16:])
     if not isinstance(code, _code_type):
         raise TypeError(f'compiled module {pathname!r} is not a code object')
     return code
@@ -783,10 +3388,325 @@ def _get_pyc_source(self, path):
         return _get_data(self.archive, toc_entry)
 
 
+# Compiled code cache
+#
+# When a code cache directory is configured, code compiled from source files
+# in archives is marshalled into that directory, and loaded from there
+# rather than compiled again.  A cached code object is found by the name of
+# the source file in the archive and the CRC and size of its contents, so
+# archives (or versions of one) with the same source share it, and a
+# changed source is never matched with old code.
+#
+# The same directory records .pyc files in archives which were rejected as
+# stale (or for the wrong interpreter), so that they aren't read and
+# rejected again on every import.
+
+_code_cache_dir = None
+_CODE_CACHE_SUFFIX = '.pyc'
+_STALE_PYC_SUFFIX = '.stale'
+
+def enable_code_cache(directory):
+    """enable_code_cache(directory) -> None.
+
+    Store code compiled from sources in archives in 'directory', and load
+    it from there instead of compiling it again, in this and later
+    processes. The ZIPIMPORT64_CODE_CACHE environment variable has the same
+    effect at import time. See also precompile().
+    """
+    global _code_cache_dir, _validated_pycs
+    import os
+    _code_cache_dir = os.fspath(directory)
+    # Load what's recorded there, as well as what's known already.
+    validated = _validated_pycs
+    _validated_pycs = None
+    if validated:
+        _get_validated_pycs().update(validated)
+
+
+def disable_code_cache():
+    """disable_code_cache() -> None.
+
+    Stop reading and writing the code cache.
+    """
+    global _code_cache_dir, _validated_pycs
+    _code_cache_dir = None
+    _stale_pyc_cache.clear()
+    _validated_pycs = None
+
+
+def precompile(archive, directory=None, workers=None):
+    """precompile(archive, directory=None, workers=None) -> int.
+
+    Compile every .py file in 'archive' that isn't already in the code cache
+    'directory' (by default, the one enabled with enable_code_cache()) into
+    it, using a pool of 'workers' processes, by default one per CPU. Return
+    the number of files compiled; files with syntax errors are skipped.
+    """
+    import os
+    archive = os.fsdecode(archive)
+    if directory is None:
+        directory = _code_cache_dir
+        if directory is None:
+            raise ValueError('the code cache is not enabled')
+    directory = os.fsdecode(directory)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    names = [name for name in _read_directory(archive) if name.endswith('.py')]
+    if workers <= 1 or len(names) <= 1:
+        return _precompile_names(archive, directory, names)
+
+    from concurrent.futures import ProcessPoolExecutor
+    # Several chunks per worker, to even out the load.
+    chunk_count = min(len(names), workers * 4)
+    chunks = [names[i::chunk_count] for i in range(chunk_count)]
+    with ProcessPoolExecutor(workers) as pool:
+        return sum(pool.map(_precompile_names, [archive] * chunk_count,
+                            [directory] * chunk_count, chunks))
+
+# Compile the named sources in archive into the code cache directory, if
+# they're not there already. Runs in a precompile() worker process.
+def _precompile_names(archive, directory, names):
+    files = _zip_directory_cache.get(archive)
+    if files is None:
+        files = _zip_directory_cache[archive] = _read_directory(archive)
+    compiled = 0
+    for name in names:
+        toc_entry = files[name]
+        cache_path, header = _code_cache_key(directory, name, toc_entry)
+        if _load_cached_code(cache_path, header, toc_entry[0]) is not None:
+            continue
+        try:
+            code = _compile_source(toc_entry[0], _get_data(archive, toc_entry))
+        except SyntaxError as exc:
+            _bootstrap._verbose_message('zipimport: not precompiling {!r}: {}',
+                                        toc_entry[0], exc)
+            continue
+        _store_cached_code(cache_path, header, code)
+        compiled += 1
+    return compiled
+
+# Return the code object for the source file name in archive, described by
+# toc_entry, from the code cache if it's there.  Otherwise compile it, and
+# add it to the code cache if that's enabled.
+def _get_source_code(archive, name, toc_entry):
+    modpath = toc_entry[0]
+    if _code_cache_dir is None or sys.implementation.cache_tag is None:
+        return _compile_member(archive, toc_entry)
+    cache_path, header = _code_cache_key(_code_cache_dir, name, toc_entry)
+    code = _load_cached_code(cache_path, header, modpath)
+    if code is None:
+        code = _compile_member(archive, toc_entry)
+        _store_cached_code(cache_path, header, code)
+    elif _stats is not None:
+        _stats.add(archive, 'code_cache_hits')
+    return code
+
+# Compile the source file of archive described by toc_entry.
+def _compile_member(archive, toc_entry):
+    source = _get_data(archive, toc_entry)
+    stats = _stats
+    if stats is None:
+        return _compile_source(toc_entry[0], source)
+    start = _perf_counter_ns()
+    code = _compile_source(toc_entry[0], source)
+    stats.add(archive, 'compiles', 1, 'compile_ns', _perf_counter_ns() - start)
+    return code
+
+# Return the path in the code cache directory for the source file name
+# (within its archive) described by toc_entry, and the header its contents
+# start with.
+def _code_cache_key(directory, name, toc_entry):
+    crc = toc_entry[7]
+    size = toc_entry[3]
+    key = f'{name}\0{crc}\0{size}\0{sys.flags.optimize}'
+    digest = _imp.source_hash(_bootstrap_external._RAW_MAGIC_NUMBER,
+                              key.encode('utf-8', 'surrogatepass'))
+    filename = f'{digest.hex()}.{sys.implementation.cache_tag}{_CODE_CACHE_SUFFIX}'
+    header = (_bootstrap_external.MAGIC_NUMBER + _pack_uint32(crc) +
+              size.to_bytes(8, 'little'))
+    return _bootstrap_external._path_join(directory, filename), header
+
+# Return the code object stored at cache_path, with its filename replaced
+# by modpath, or None if there isn't one with the given header.
+def _load_cached_code(cache_path, header, modpath):
+    try:
+        with _io.open_code(cache_path) as fp:
+            data = fp.read()
+    except OSError:
+        return None
+    if data[:len(header)] != header:
+        return None
+    try:
+        code = marshal.loads(memoryview(data)[len(header):])
+    except (EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(code, _code_type):
+        return None
+    _imp._fix_co_filename(code, modpath)
+    _bootstrap._verbose_message('zipimport: code for {} loaded from {}',
+                                modpath, cache_path, verbosity=2)
+    return code
+
+# Store code at cache_path; failing to do so is not an error.
+def _store_cached_code(cache_path, header, code):
+    _write_cache_file(cache_path, header + marshal.dumps(code))
+
+def _write_cache_file(path, data):
+    import os
+    try:
+        os.makedirs(_bootstrap_external._path_split(path)[0], exist_ok=True)
+        _bootstrap_external._write_atomic(path, data)
+    except OSError as exc:
+        _bootstrap._verbose_message('zipimport: could not write {!r}: {}',
+                                    path, exc)
+
+# Archive path -> set of keys (see _stale_pyc_key()) of stale .pyc files.
+_stale_pyc_cache = {}
+
+# Return the key under which a .pyc file (fullpath, described by toc_entry)
+# in the archive of self is recorded as stale.  Whether a .pyc is stale only
+# depends on it, its source, and how hash-based .pyc files are checked.  The
+# source's modification time is keyed on its raw DOS date and time fields,
+# not converted with the local time zone, so the key is the same in every
+# time zone.
+def _stale_pyc_key(self, fullpath, toc_entry):
+    source = self._files.get(fullpath[:-1])
+    if source is not None:
+        source = source[3], source[5], source[6], source[7]
+    return (fullpath, toc_entry[3], toc_entry[7], source,
+            _imp.check_hash_based_pycs)
+
+def _stale_pyc_path(archive):
+    import os
+    key = os.fsencode(os.path.abspath(archive))
+    digest = _imp.source_hash(_bootstrap_external._RAW_MAGIC_NUMBER, key)
+    filename = f'{digest.hex()}.{sys.implementation.cache_tag}{_STALE_PYC_SUFFIX}'
+    return _bootstrap_external._path_join(_code_cache_dir, filename)
+
+# The file is the magic number followed by records, each a marshalled key
+# preceded by its size, so recording a stale .pyc only appends to it.
+def _get_stale_pycs(archive):
+    try:
+        return _stale_pyc_cache[archive]
+    except KeyError:
+        pass
+    stale = set()
+    try:
+        with _io.FileIO(_stale_pyc_path(archive), 'r') as fp:
+            data = fp.readall()
+    except OSError:
+        data = b''
+    if data[:4] == _bootstrap_external.MAGIC_NUMBER:
+        pos = 4
+        while pos + 4 <= len(data):
+            end = pos + 4 + _unpack_uint32(data[pos:pos + 4])
+            if end > len(data):
+                # Still being written by another process
+                break
+            try:
+                stale.add(marshal.loads(data[pos + 4:end]))
+            except (EOFError, ValueError, TypeError):
+                break
+            pos = end
+    return _stale_pyc_cache.setdefault(archive, stale)
+
+def _is_stale_pyc(self, fullpath, toc_entry):
+    return _stale_pyc_key(self, fullpath, toc_entry) in _get_stale_pycs(self.archive)
+
+def _record_stale_pyc(self, fullpath, toc_entry):
+    key = _stale_pyc_key(self, fullpath, toc_entry)
+    _get_stale_pycs(self.archive).add(key)
+    record = marshal.dumps(key)
+    record = _pack_uint32(len(record)) + record
+    path = _stale_pyc_path(self.archive)
+    import os
+    try:
+        os.makedirs(_code_cache_dir, exist_ok=True)
+        # Like the records of validated .pyc files, each is appended whole.
+        with _io.FileIO(path, 'a') as fp:
+            if fp.seek(0, 2) == 0:
+                record = _bootstrap_external.MAGIC_NUMBER + record
+            fp.write(record)
+    except OSError as exc:
+        _bootstrap._verbose_message('zipimport: could not write {!r}: {}',
+                                    path, exc)
+
+# Checked hash-based .pyc files
+#
+# Checking a hash-based .pyc file means reading and hashing its source.  Once
+# a .pyc has matched its source, the CRC and size of the source in the archive
+# and the .pyc's hash of it are remembered, and the check is skipped when
+# they're seen again: in this process, and when the code cache is enabled, in
+# later ones, through a file of fixed-size records appended to in its
+# directory.  Like the code cache, this relies on the CRC and size to tell
+# sources apart.
+
+_VALIDATED_PYCS_SUFFIX = '.validated'
+# The magic number, source CRC and size, and the .pyc's hash of the source.
+_VALIDATED_PYC_RECORD_SIZE = 24
+
+# Set of records, loaded from the code cache when first needed.
+_validated_pycs = None
+
+def _validated_pycs_path():
+    if _code_cache_dir is None or sys.implementation.cache_tag is None:
+        return None
+    filename = f'pycs.{sys.implementation.cache_tag}{_VALIDATED_PYCS_SUFFIX}'
+    return _bootstrap_external._path_join(_code_cache_dir, filename)
+
+def _get_validated_pycs():
+    global _validated_pycs
+    validated = _validated_pycs
+    if validated is None:
+        validated = set()
+        path = _validated_pycs_path()
+        data = b''
+        if path is not None:
+            try:
+                with _io.FileIO(path, 'r') as fp:
+                    data = fp.readall()
+            except OSError:
+                pass
+        size = _VALIDATED_PYC_RECORD_SIZE
+        for i in range(0, len(data) - size + 1, size):
+            record = data[i:i + size]
+            if record[:4] == _bootstrap_external.MAGIC_NUMBER:
+                validated.add(record)
+        _validated_pycs = validated
+    return validated
+
+# Return the record for the hash-based .pyc file fullpath in the archive of
+# self, whose contents are data, or None if it has no source.
+def _validated_pyc_record(self, fullpath, data):
+    source = self._files.get(fullpath[:-1])
+    if source is None:
+        return None
+    return (_bootstrap_external.MAGIC_NUMBER + _pack_uint32(source[7]) +
+            source[3].to_bytes(8, 'little') + bytes(data[8:16]))
+
+def _record_validated_pyc(record):
+    _get_validated_pycs().add(record)
+    path = _validated_pycs_path()
+    if path is None:
+        return
+    import os
+    try:
+        os.makedirs(_code_cache_dir, exist_ok=True)
+        # Records are small enough to be appended whole, even by several
+        # processes at once.
+        with _io.FileIO(path, 'a') as fp:
+            fp.write(record)
+    except OSError as exc:
+        _bootstrap._verbose_message('zipimport: could not write {!r}: {}',
+                                    path, exc)
+
+
 # Get the code object associated with the module specified by
 # 'fullname'.
 def _get_module_code(self, fullname):
     path = _get_module_path(self, fullname)
+    caching = _code_cache_dir is not None and sys.implementation.cache_tag is not None
     for suffix, isbytecode, ispackage in _zip_searchorder:
         fullpath = path + suffix
         _bootstrap._verbose_message('trying {}{}{}', self.archive, path_sep, fullpath, verbosity=2)
@@ -796,11 +3716,26 @@ def _get_module_code(self, fullname):
             pass
         else:
             modpath = toc_entry[0]
-            data = _get_data(self.archive, toc_entry)
             if isbytecode:
+                if caching and _is_stale_pyc(self, fullpath, toc_entry):
+                    _bootstrap._verbose_message('zipimport: {} is known to be stale',
+                                                modpath, verbosity=2)
+                    if _stats is not None:
+                        _stats.add(self.archive, 'stale_pyc_skips')
+                    continue
+                data = _get_buffer(self.archive, toc_entry)
+                stats = _stats
+                if stats is not None:
+                    start = _perf_counter_ns()
                 code = _unmarshal_code(self, modpath, fullpath, fullname, data)
+                if stats is not None:
+                    stats.add(self.archive, 'pyc_loads' if code is not None
+                              else 'stale_pycs', 1,
+                              'pyc_load_ns', _perf_counter_ns() - start)
+                if code is None and caching:
+                    _record_stale_pyc(self, fullpath, toc_entry)
             else:
-                code = _compile_source(modpath, data)
+                code = _get_source_code(self.archive, fullpath, toc_entry)
             if code is None:
                 # bad magic number or non-matching mtime
                 # in byte code, try next
@@ -811,6 +3746,254 @@ def _get_module_code(self, fullname):
         raise ZipImportError(f"can't find module {fullname!r}", name=fullname)
 
 
+# The directory resources are extracted to for resource_path(), if any.
+_extraction_cache_dir = None
+_extraction_cache_max_bytes = None
+_EXTRACTING_SUFFIX = '.tmp'
+
+def enable_extraction_cache(directory, max_bytes=None):
+    """enable_extraction_cache(directory, max_bytes=None) -> None.
+
+    Let resource readers return paths to resources extracted into
+    'directory', so importlib.resources.as_file() doesn't need to extract
+    them to a temporary file each time. Extracted files are shared by all
+    processes using the directory. If 'max_bytes' is given, the least
+    recently used files are removed whenever a new one would take the total
+    over it. The ZIPIMPORT64_EXTRACTION_CACHE environment variable has the
+    same effect (without a limit) at import time.
+    """
+    global _extraction_cache_dir, _extraction_cache_max_bytes
+    import os
+    _extraction_cache_dir = os.fspath(directory)
+    _extraction_cache_max_bytes = max_bytes
+
+
+def disable_extraction_cache():
+    """disable_extraction_cache() -> None.
+
+    Stop extracting resources; files already extracted are left in place.
+    """
+    global _extraction_cache_dir, _extraction_cache_max_bytes
+    _extraction_cache_dir = _extraction_cache_max_bytes = None
+
+
+def trim_extraction_cache(max_bytes, directory=None):
+    """trim_extraction_cache(max_bytes, directory=None) -> int.
+
+    Remove the least recently used files from the extraction cache
+    'directory' (by default, the one enabled with enable_extraction_cache())
+    until they take up at most 'max_bytes'. Return the number of bytes
+    removed.
+    """
+    import os
+    if directory is None:
+        directory = _extraction_cache_dir
+        if directory is None:
+            raise ValueError('no extraction cache directory')
+    files = []
+    total = 0
+    try:
+        subdirs = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+    for subdir in subdirs:
+        if not subdir.is_dir(follow_symlinks=False):
+            continue
+        try:
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith(_EXTRACTING_SUFFIX):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                files.append((st.st_mtime_ns, st.st_size, entry.path))
+                total += st.st_size
+        except OSError:
+            continue
+    removed = 0
+    files.sort()
+    for mtime, size, path in files:
+        if total - removed <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        removed += size
+        try:
+            os.rmdir(_bootstrap_external._path_split(path)[0])
+        except OSError:
+            pass
+    return removed
+
+# Return the path the member described by toc_entry is extracted to, which
+# depends on where the member is and its CRC and size.  Each file is in its
+# own directory so it keeps its name, which some libraries look at.
+def _extraction_path(toc_entry):
+    import os
+    datapath = toc_entry[0]
+    key = f'{os.path.abspath(datapath)}\0{toc_entry[7]}\0{toc_entry[3]}'
+    digest = _imp.source_hash(_bootstrap_external._RAW_MAGIC_NUMBER,
+                              key.encode('utf-8', 'surrogatepass'))
+    basename = datapath.rpartition(path_sep)[2]
+    return _bootstrap_external._path_join(_extraction_cache_dir, digest.hex(),
+                                          basename)
+
+# Return the path of the member of archive described by toc_entry, extracting
+# it into the extraction cache first if it isn't there yet.
+def _extract(archive, toc_entry):
+    import os
+    path = _extraction_path(toc_entry)
+    try:
+        st = os.stat(path)
+    except OSError:
+        pass
+    else:
+        if st.st_size == toc_entry[3]:
+            # Mark it as recently used, for trim_extraction_cache().
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return path
+
+    # Extract to a file no other process or thread is writing to, and
+    # atomically rename it into place, so the path only ever refers to a
+    # complete file.
+    os.makedirs(_bootstrap_external._path_split(path)[0], exist_ok=True)
+    temp_path = f'{path}.{_os.getpid()}.{_thread.get_ident()}{_EXTRACTING_SUFFIX}'
+    try:
+        with _io.FileIO(temp_path, 'xb') as out, \
+                _open_member(archive, toc_entry) as member:
+            while chunk := member.read(_STREAM_CHUNK_SIZE):
+                out.write(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    _bootstrap._verbose_message('zipimport: extracted {!r} to {!r}',
+                                toc_entry[0], path)
+
+    if _extraction_cache_max_bytes is not None:
+        trim_extraction_cache(_extraction_cache_max_bytes)
+    return path
+
+
+_memfd_create = getattr(_os, 'memfd_create', None)
+# Descriptors of in-memory files extension modules were loaded from.  They
+# stay open so that their /proc/self/fd paths, which the dynamic loader
+# remembers modules by, are never reused.
+_extension_fds = []
+
+class _ZipExtensionLoader:
+    """Loader for an extension module in a Zip file.
+
+    On Linux, the extension module is copied into an anonymous in-memory
+    file (see os.memfd_create()) and loaded from its /proc/self/fd path, so
+    nothing is written to disk.  Elsewhere, or if that fails, it's loaded
+    from the extraction cache (see enable_extraction_cache()).
+    """
+
+    def __init__(self, archive, fullname, toc_entry):
+        self.archive = archive
+        self.name = fullname
+        self._toc_entry = toc_entry
+
+    def get_filename(self, fullname):
+        return self._toc_entry[0]
+
+    def is_package(self, fullname):
+        return False
+
+    def get_code(self, fullname):
+        return None
+
+    def get_source(self, fullname):
+        return None
+
+    def create_module(self, spec):
+        path = _materialize_extension(self.archive, self._toc_entry)
+        # The dynamic loader needs a real path, so give it one while keeping
+        # the archive path as __file__, like for other modules.
+        real_spec = _bootstrap.ModuleSpec(spec.name, self, origin=path)
+        module = _bootstrap._call_with_frames_removed(_imp.create_dynamic,
+                                                      real_spec)
+        _bootstrap._verbose_message('extension module {!r} loaded from {!r}',
+                                    spec.name, path)
+        return module
+
+    def exec_module(self, module):
+        module.__file__ = self._toc_entry[0]
+        _bootstrap._call_with_frames_removed(_imp.exec_dynamic, module)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} for {self._toc_entry[0]!r}>'
+
+# Return a path the extension module of archive described by toc_entry can be
+# loaded from.
+def _materialize_extension(archive, toc_entry):
+    if _memfd_create is not None:
+        basename = toc_entry[0].rpartition(path_sep)[2]
+        try:
+            fd = _memfd_create(basename, _os.MFD_CLOEXEC)
+        except OSError as exc:
+            _bootstrap._verbose_message('zipimport: memfd_create failed: {}', exc)
+        else:
+            try:
+                with _io.FileIO(fd, 'wb', closefd=False) as out, \
+                        _open_member(archive, toc_entry) as member:
+                    while chunk := member.read(_STREAM_CHUNK_SIZE):
+                        out.write(chunk)
+                path = f'/proc/self/fd/{fd}'
+                _os.stat(path)
+            except BaseException as exc:
+                _os.close(fd)
+                if not isinstance(exc, OSError):
+                    raise
+                # e.g. /proc isn't mounted
+                _bootstrap._verbose_message('zipimport: {!r} not usable: {}',
+                                            f'/proc/self/fd/{fd}', exc)
+            else:
+                _extension_fds.append(fd)
+                return path
+    if _extraction_cache_dir is None:
+        raise ImportError(f"can't load extension module {toc_entry[0]!r} "
+                          f"without an extraction cache", path=toc_entry[0])
+    return _extract(archive, toc_entry)
+
+
+# Return the path in the extraction cache of the file path in the archive of
+# zipimporter, extracting it first if it isn't there.  Raise
+# FileNotFoundError if there is no such file, or no extraction cache.
+def _extracted_path(zipimporter, path):
+    if _extraction_cache_dir is None:
+        raise FileNotFoundError(path)
+    try:
+        toc_entry = _get_toc_entry(zipimporter, path)
+    except OSError:
+        raise FileNotFoundError(path)
+    try:
+        return _extract(zipimporter.archive, toc_entry)
+    except OSError as exc:
+        _bootstrap._verbose_message('zipimport: could not extract {!r}: {}',
+                                    path, exc)
+        raise FileNotFoundError(path)
+
+# importlib.resources.as_file() (which path() uses too) for a _ZipTraversable:
+# the file in the extraction cache if there is one, instead of a temporary
+# copy made for each call.
+def _as_file(traversable):
+    try:
+        path = _extracted_path(traversable._zipimporter, traversable._at)
+    except FileNotFoundError:
+        from importlib.resources import as_file
+        return as_file.dispatch(object)(traversable)
+    import contextlib
+    import pathlib
+    return contextlib.nullcontext(pathlib.Path(path))
+
+
 class _ZipImportResourceReader:
     """Private class used to support ZipImport.get_resource_reader().
 
@@ -826,57 +4009,291 @@ class _ZipImportResourceReader:
     def open_resource(self, resource):
         fullname_as_path = self.fullname.replace('.', '/')
         path = f'{fullname_as_path}/{resource}'
-        from io import BytesIO
         try:
-            return BytesIO(self.zipimporter.get_data(path))
+            return self.zipimporter.open(path)
+        except OSError:
+            raise FileNotFoundError(path)
+
+    def get_buffer(self, resource):
+        # Not part of the ResourceReader API: a read-only memoryview of the
+        # resource, without copying it if it's stored uncompressed.
+        fullname_as_path = self.fullname.replace('.', '/')
+        path = f'{fullname_as_path}/{resource}'
+        try:
+            return self.zipimporter.get_buffer(path)
         except OSError:
             raise FileNotFoundError(path)
 
     def resource_path(self, resource):
-        # All resources are in the zip file, so there is no path to the file.
-        # Raising FileNotFoundError tells the higher level API to extract the
+        # All resources are in the zip file, so there is no path to the file,
+        # unless they are extracted to the extraction cache.  Otherwise,
+        # raising FileNotFoundError tells the higher level API to extract the
         # binary data and create a temporary file.
-        raise FileNotFoundError
+        fullname_as_path = self.fullname.replace('.', '/')
+        return _extracted_path(self.zipimporter, f'{fullname_as_path}/{resource}')
 
     def is_resource(self, name):
-        # Maybe we could do better, but if we can get the data, it's a
-        # resource.  Otherwise it isn't.
+        # It's a resource if it's a file in the archive.
         fullname_as_path = self.fullname.replace('.', '/')
         path = f'{fullname_as_path}/{name}'
         try:
-            self.zipimporter.get_data(path)
+            _get_toc_entry(self.zipimporter, path)
         except OSError:
             return False
         return True
 
     def contents(self):
-        # This is a bit convoluted, because fullname will be a module path,
-        # but _files is a list of file names relative to the top of the
-        # archive's namespace.  We want to compare file paths to find all the
-        # names of things inside the module represented by fullname.  So we
-        # turn the module path of fullname into a file path relative to the
-        # top of the archive, and then we iterate through _files looking for
-        # names inside that "directory".
-        from pathlib import Path
-        fullname_path = Path(self.zipimporter.get_filename(self.fullname))
-        relative_path = fullname_path.relative_to(self.zipimporter.archive)
-        # Don't forget that fullname names a package, so its path will include
-        # __init__.py, which we want to ignore.
-        assert relative_path.name == '__init__.py'
-        package_path = relative_path.parent
-        subdirs_seen = set()
-        for filename in self.zipimporter._files:
-            try:
-                relative = Path(filename).relative_to(package_path)
-            except ValueError:
-                continue
-            # If the path of the file (which is relative to the top of the zip
-            # namespace), relative to the package given when the resource
-            # reader was created, has a parent, then it's a name in a
-            # subdirectory and thus we skip it.
-            parent_name = relative.parent.name
-            if len(parent_name) == 0:
-                yield relative.name
-            elif parent_name not in subdirs_seen:
-                subdirs_seen.add(parent_name)
-                yield parent_name
+        # fullname names a package, whose directory is found in the same
+        # place as by get_filename(), relative to the top of the archive.
+        package_path = _get_module_path(self.zipimporter, self.fullname)
+        children = self.zipimporter._files._list_dir(package_path + path_sep)
+        return iter(children or ())
+
+    def files(self):
+        package_path = _get_module_path(self.zipimporter, self.fullname)
+        return _ZipTraversable(self.zipimporter, package_path)
+
+
+class _ZipTraversable:
+    """importlib.resources Traversable for a file or directory in a Zip file.
+
+    'at' is its path relative to the top of the archive, without a trailing
+    separator ('' for the top).  Directories are looked up in the directory
+    tree of the table of contents, so listing one only costs as much as
+    the number of names in it.
+    """
+
+    def __init__(self, zipimporter, at):
+        self._zipimporter = zipimporter
+        self._at = at
+
+    @property
+    def name(self):
+        return self._at.rpartition(path_sep)[2]
+
+    def _children(self):
+        dirpath = self._at + path_sep if self._at else ''
+        return self._zipimporter._files._list_dir(dirpath)
+
+    def is_dir(self):
+        return self._children() is not None
+
+    def is_file(self):
+        return self._at in self._zipimporter._files
+
+    def iterdir(self):
+        children = self._children()
+        if children is None:
+            raise NotADirectoryError(f"Can't list {self!r}, not a directory")
+        for name in children:
+            yield self.joinpath(name)
+
+    def joinpath(self, *descendants):
+        at = self._at
+        for descendant in descendants:
+            for name in descendant.replace('/', path_sep).split(path_sep):
+                if name:
+                    at = f'{at}{path_sep}{name}' if at else name
+        return _ZipTraversable(self._zipimporter, at)
+
+    __truediv__ = joinpath
+
+    def open(self, mode='r', *args, **kwargs):
+        if mode not in ('r', 'rb'):
+            raise ValueError(f'invalid mode: {mode!r}, only r and rb are supported')
+        try:
+            stream = self._zipimporter.open(self._at)
+        except OSError:
+            if self.is_dir():
+                raise IsADirectoryError(self._at) from None
+            raise FileNotFoundError(self._at) from None
+        if mode == 'rb':
+            return stream
+        return _io.TextIOWrapper(stream, *args, **kwargs)
+
+    def read_bytes(self):
+        try:
+            return self._zipimporter.get_data(self._at)
+        except OSError:
+            raise FileNotFoundError(self._at) from None
+
+    def read_text(self, encoding=None):
+        with self.open(encoding=encoding) as stream:
+            return stream.read()
+
+    def __eq__(self, other):
+        if not isinstance(other, _ZipTraversable):
+            return NotImplemented
+        return (self._zipimporter.archive, self._at) == (other._zipimporter.archive,
+                                                        other._at)
+
+    def __hash__(self):
+        return hash((self._zipimporter.archive, self._at))
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self._zipimporter.archive}{path_sep}{self._at}>'
+
+
+class _ModuleIndexFinder:
+    """Meta path finder standing in for PathFinder, which only looks for a
+    top-level module in the Zip files on sys.path that contain it.
+
+    PathFinder asks the finder for each sys.path entry in turn, so with many
+    Zip files on sys.path, an import (especially of a module that isn't in
+    any of them) probes each of their tables of contents.  This finder
+    indexes the top-level names in each one instead, and has PathFinder look
+    only in those entries that have the module, and in entries that aren't
+    Zip files, keeping their order.  Everything else is passed on to
+    PathFinder.
+    """
+
+    def __init__(self):
+        self._path = None
+        self._names = None  # per sys.path entry, set of names, or None
+        self._search_paths = {}  # top-level name -> sys.path entries
+
+    def find_spec(self, fullname, path=None, target=None):
+        PathFinder = _bootstrap_external.PathFinder
+        if path is None:
+            path = self._get_search_path(fullname)
+        return PathFinder.find_spec(fullname, path, target)
+
+    def find_distributions(self, *args, **kwargs):
+        return _bootstrap_external.PathFinder.find_distributions(*args, **kwargs)
+
+    def invalidate_caches(self):
+        _bootstrap_external.PathFinder.invalidate_caches()
+        self._path = None
+
+    # Return the entries of sys.path to look for the top-level module
+    # fullname in.
+    def _get_search_path(self, fullname):
+        if sys.path != self._path:
+            self._build_index()
+        try:
+            return self._search_paths[fullname]
+        except KeyError:
+            pass
+        path = [entry for entry, names in zip(self._path, self._names)
+                if names is None or fullname in names]
+        self._search_paths[fullname] = path
+        return path
+
+    def _build_index(self):
+        path = list(sys.path)
+        get_importer = _bootstrap_external.PathFinder._path_importer_cache
+        index = []
+        for entry in path:
+            importer = get_importer(entry) if isinstance(entry, str) else None
+            index.append(_get_top_level_names(importer)
+                         if isinstance(importer, zipimporter) else None)
+        self._path = path
+        self._names = index
+        self._search_paths = {}
+        _bootstrap._verbose_message('zipimport: indexed {} Zip files on sys.path',
+                                    len(index) - index.count(None))
+
+# Return the set of names of top-level modules and packages (including
+# namespace package portions) importer could find.
+def _get_top_level_names(importer):
+    names = set()
+    suffixes = [suffix for suffix, isbytecode, ispackage in _zip_searchorder
+                if not ispackage]
+    suffixes += _imp.extension_suffixes()
+    for name, is_dir in (importer._files._list_dir(importer.prefix) or {}).items():
+        if is_dir:
+            names.add(name)
+            continue
+        for suffix in suffixes:
+            if name.endswith(suffix):
+                names.add(name[:-len(suffix)])
+                break
+    return names
+
+_module_index_finder = None
+
+def enable_module_index():
+    """enable_module_index() -> None.
+
+    Replace PathFinder in sys.meta_path with a finder that indexes the
+    top-level modules in Zip files on sys.path, so importing a top-level
+    module only looks in the Zip files that have it (and in entries that
+    aren't Zip files), in sys.path order. The index is rebuilt when sys.path
+    changes, and by importlib.invalidate_caches().
+    """
+    global _module_index_finder
+    if _module_index_finder is not None:
+        return
+    finder = _ModuleIndexFinder()
+    PathFinder = _bootstrap_external.PathFinder
+    if PathFinder in sys.meta_path:
+        sys.meta_path[sys.meta_path.index(PathFinder)] = finder
+    else:
+        sys.meta_path.append(finder)
+    _module_index_finder = finder
+
+
+def disable_module_index():
+    """disable_module_index() -> None.
+
+    Put PathFinder back in sys.meta_path in place of the module index.
+    """
+    global _module_index_finder
+    finder, _module_index_finder = _module_index_finder, None
+    if finder in sys.meta_path:
+        sys.meta_path[sys.meta_path.index(finder)] = _bootstrap_external.PathFinder
+
+
+def _init_from_environment():
+    import os
+    directory = os.environ.get('ZIPIMPORT64_INDEX_CACHE')
+    if directory:
+        enable_index_cache(directory)
+    directory = os.environ.get('ZIPIMPORT64_CODE_CACHE')
+    if directory:
+        enable_code_cache(directory)
+    directory = os.environ.get('ZIPIMPORT64_EXTRACTION_CACHE')
+    if directory:
+        enable_extraction_cache(directory)
+    if os.environ.get('ZIPIMPORT64_STATS'):
+        enable_stats()
+    if os.environ.get('ZIPIMPORT64_CHECK_HEADERS'):
+        enable_local_header_checks()
+    if os.environ.get('ZIPIMPORT64_SHARED_INDEX'):
+        enable_shared_index()
+    path = os.environ.get('ZIPIMPORT64_PREFETCH')
+    if path:
+        prefetch(path)
+    path = os.environ.get('ZIPIMPORT64_RECORD')
+    if path:
+        start_recording(path)
+
+_init_from_environment()
+
+
+def main(args=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m zipimport64')
+    commands = parser.add_subparsers(dest='command', required=True)
+    precompile_parser = commands.add_parser(
+        'precompile', help='compile the sources in archives into the code cache')
+    precompile_parser.add_argument('archives', nargs='+', metavar='archive')
+    precompile_parser.add_argument(
+        '-d', '--cache-dir', default=_code_cache_dir,
+        help='code cache directory (default: $ZIPIMPORT64_CODE_CACHE)')
+    precompile_parser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: one per CPU)')
+    args = parser.parse_args(args)
+
+    if args.command == 'precompile':
+        if args.cache_dir is None:
+            precompile_parser.error('no code cache directory given')
+        for archive in args.archives:
+            count = precompile(archive, args.cache_dir, args.jobs)
+            print(f'{archive}: compiled {count} files')
+
+
+if __name__ == '__main__':
+    main()